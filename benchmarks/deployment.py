@@ -0,0 +1,168 @@
+"""
+Compra: processos separados (TCP ou Unix domain socket) x modo co-localizado
+
+Implantações:
+- multiprocess: um processo por serviço, gateway chama por TCP (localhost);
+- uds: um processo por serviço, gateway chama por Unix domain socket (UDS=...);
+- colocated: só o gateway, com os serviços no mesmo processo (UPSTREAM_MODE=inprocess).
+
+Sobe cada implantação em subprocessos (como o run_all.sh faz), aplica a mesma
+carga de compras pelo gateway e compara com a multiprocess:
+- latência (p50/p95/p99) em uma taxa fixa (--rps), abaixo da saturação;
+- vazão máxima em malha fechada: --concurrency clientes fazendo compras uma
+  atrás da outra durante --duration segundos.
+
+Uso:
+    python3 -m benchmarks.deployment --rps 100 --duration 10
+    python3 -m benchmarks.deployment --deployments multiprocess,uds --output deploy.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import httpx
+
+from benchmarks.load import OPERATIONS, LoadState, Recorder, run_load, warm_up
+
+SERVICES = [("users", "users_service.py"), ("orders", "orders_service.py"), ("billing", "billing_service.py")]
+
+def launch(deployment: str, base_port: int, socket_dir: str) -> List[subprocess.Popen]:
+    """Iniciar os processos da implantação (gateway em base_port)"""
+    env = dict(os.environ, LOG_LEVEL="WARNING", HEALTH_CHECK_INTERVAL="0")
+    processes = []
+    if deployment in ("multiprocess", "uds"):
+        for offset, (service, script) in enumerate(SERVICES, start=1):
+            service_env = dict(env, PORT=str(base_port + offset))
+            if deployment == "uds":
+                service_env["UDS"] = os.path.join(socket_dir, f"{service}.sock")
+                env[f"{service.upper()}_SERVICE_URL"] = f"unix://{service_env['UDS']}"
+            else:
+                env[f"{service.upper()}_SERVICE_URL"] = f"http://127.0.0.1:{service_env['PORT']}"
+            processes.append(subprocess.Popen([sys.executable, script], env=service_env,
+                                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+    elif deployment == "colocated":
+        env["UPSTREAM_MODE"] = "inprocess"
+    else:
+        raise ValueError(f"Implantação desconhecida: {deployment}")
+    processes.append(subprocess.Popen([sys.executable, "gateway.py"], env=dict(env, PORT=str(base_port)),
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+    return processes
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            response = await client.get("/health")
+            if response.status_code == 200 and response.json()["status"] == "healthy":
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    raise SystemExit("A implantação não ficou saudável a tempo")
+
+def stop(processes: List[subprocess.Popen]):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.wait(timeout=10)
+
+async def run_closed_loop(clients: dict, state: LoadState, duration: float, concurrency: int) -> dict:
+    """Malha fechada: cada cliente envia a próxima compra assim que a anterior responde"""
+    recorder = Recorder()
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+
+    async def client_loop():
+        while loop.time() < started + duration:
+            sent = loop.time()
+            try:
+                response = await OPERATIONS["purchase"](clients, state)
+                status, error = str(response.status_code), response.status_code >= 400
+            except Exception as e:
+                status, error = type(e).__name__, True
+            recorder.record("purchase", loop.time() - sent, status, error)
+
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    return recorder.report(loop.time() - started)
+
+def summary(report: dict) -> dict:
+    purchase = report["endpoints"].get("purchase", {})
+    return {
+        "requests": report["requests"],
+        "errors": report["errors"],
+        "throughput_rps": report["throughput_rps"],
+        "latency_ms": purchase.get("latency_ms")
+    }
+
+async def bench(deployment: str, args, socket_dir: str) -> dict:
+    processes = launch(deployment, args.base_port, socket_dir)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.base_port}", limits=limits,
+                                     timeout=30.0) as client:
+            await wait_ready(client)
+            clients = {"gateway": client}
+            state = LoadState()
+            await warm_up(clients, state, args.warmup_users, args.warmup_purchases)
+            fixed = await run_load(clients, state, {"purchase": 1}, args.rps, args.duration, args.concurrency)
+            saturated = await run_closed_loop(clients, state, args.duration, args.concurrency)
+    finally:
+        stop(processes)
+    return {"fixed_rate": summary(fixed), "saturation": summary(saturated)}
+
+async def main_async(args) -> dict:
+    results: Dict[str, dict] = {}
+    with tempfile.TemporaryDirectory(prefix="sba-uds-") as socket_dir:
+        for deployment in args.deployments.split(","):
+            results[deployment] = await bench(deployment, args, socket_dir)
+    before = results.get("multiprocess")
+    comparison = {}
+    for deployment, after in results.items():
+        if before is None or deployment == "multiprocess":
+            continue
+        comparison[deployment] = {
+            "p50_speedup": round(before["fixed_rate"]["latency_ms"]["p50"] / after["fixed_rate"]["latency_ms"]["p50"], 2),
+            "p99_speedup": round(before["fixed_rate"]["latency_ms"]["p99"] / after["fixed_rate"]["latency_ms"]["p99"], 2),
+            "throughput_gain": round(after["saturation"]["throughput_rps"] / before["saturation"]["throughput_rps"], 2)
+        }
+    if comparison:
+        results["comparison"] = comparison
+    results["config"] = {
+        "rps": args.rps,
+        "duration_s": args.duration,
+        "concurrency": args.concurrency
+    }
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Compras: processos separados (TCP/UDS) x modo co-localizado")
+    parser.add_argument("--deployments", default="multiprocess,uds,colocated")
+    parser.add_argument("--base-port", type=int, default=18100)
+    parser.add_argument("--rps", type=float, default=100)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--warmup-users", type=int, default=20)
+    parser.add_argument("--warmup-purchases", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="arquivo para o relatório JSON (sem ele, o relatório vai para o stdout)")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    logging.disable(logging.WARNING)
+    output = json.dumps(asyncio.run(main_async(args)), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
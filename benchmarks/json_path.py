@@ -0,0 +1,102 @@
+"""
+CPU por requisição nas listagens: caminho padrão do FastAPI x caminho rápido de JSON
+
+Sobe a arquitetura no mesmo processo (ASGI), cria usuários, pedidos e
+transações e mede, para cada listagem, o tempo de CPU do processo
+(time.process_time) por requisição com FAST_JSON desligado e ligado. Com ASGI o
+cliente roda no mesmo processo, então o número inclui o custo dele nas duas
+medições; a diferença entre elas é a economia do servidor.
+
+Uso:
+    python3 -m benchmarks.json_path --page-size 1000 --requests 200
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from typing import Dict
+
+import gateway
+from benchmarks.stack import open_stack
+from common import serialization
+
+async def seed(clients: Dict, users: int, orders_per_user: int) -> int:
+    """Criar os dados das listagens; retorna o user_id com pedidos"""
+    user_ids = []
+    for index in range(users):
+        response = await clients["users"].post("/users/create", json={
+            "name": "Bench User", "email": f"json.{time.time_ns()}.{index}@example.com"
+        })
+        user_ids.append(response.json()["user_id"])
+    for user_id in user_ids:
+        response = await clients["orders"].post("/orders/create/batch", json={
+            "orders": [{"user_id": user_id, "amount": 10.0 + item} for item in range(orders_per_user)]
+        })
+        await clients["billing"].post("/billing/charge/batch", json={
+            "charges": [{"order_id": order["order_id"], "amount": order["amount"]}
+                        for order in response.json()["orders"]]
+        })
+    return user_ids[0]
+
+async def measure(client, path: str, params: dict, requests: int) -> dict:
+    for _ in range(5):
+        (await client.get(path, params=params)).raise_for_status()
+    cpu_started, wall_started = time.process_time(), time.perf_counter()
+    size = 0
+    for _ in range(requests):
+        response = await client.get(path, params=params)
+        size = len(response.content)
+    cpu = time.process_time() - cpu_started
+    wall = time.perf_counter() - wall_started
+    return {
+        "cpu_ms_per_request": round(cpu / requests * 1000, 3),
+        "wall_ms_per_request": round(wall / requests * 1000, 3),
+        "response_bytes": size
+    }
+
+def set_fast_json(enabled: bool):
+    serialization.FAST_JSON = enabled
+    gateway.FAST_JSON = enabled
+
+async def main_async(args) -> dict:
+    async with open_stack("asgi") as clients:
+        user_id = await seed(clients, args.users, args.page_size)
+        params = {"limit": args.page_size}
+        endpoints = {
+            "list_users": (clients["users"], "/users"),
+            "list_orders": (clients["orders"], "/orders"),
+            "list_transactions": (clients["billing"], "/billing/transactions"),
+            "user_orders": (clients["orders"], f"/orders/user/{user_id}"),
+            "gateway_user_orders": (clients["gateway"], f"/gateway/user/{user_id}/orders"),
+        }
+        report = {}
+        for name, (client, path) in endpoints.items():
+            results = {}
+            for label, enabled in (("standard", False), ("fast", True)):
+                set_fast_json(enabled)
+                results[label] = await measure(client, path, params, args.requests)
+            results["cpu_reduction"] = round(
+                1 - results["fast"]["cpu_ms_per_request"] / results["standard"]["cpu_ms_per_request"], 3
+            )
+            report[name] = results
+    report["config"] = {
+        "page_size": args.page_size,
+        "requests": args.requests,
+        "users": args.users,
+        "encoder": "orjson" if serialization.orjson is not None else "json"
+    }
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU por requisição com e sem o caminho rápido de JSON")
+    parser.add_argument("--page-size", type=int, default=1000, help="itens por página (e pedidos do usuário)")
+    parser.add_argument("--requests", type=int, default=200, help="requisições medidas por endpoint e modo")
+    parser.add_argument("--users", type=int, default=20)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    print(json.dumps(asyncio.run(main_async(args)), indent=2))
+
+if __name__ == "__main__":
+    main()
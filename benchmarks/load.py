@@ -0,0 +1,241 @@
+"""
+Gerador de carga e benchmark de latência do gateway
+
+Reproduz as operações de test_client.py (registro, login, compra, consulta de
+pedidos) e as listagens paginadas dos serviços, em taxa alvo (RPS) com
+concorrência limitada, e gera um relatório JSON por endpoint: requisições,
+erros, vazão e latências p50/p95/p99. A latência é medida a partir do instante agendado para a
+requisição, então inclui o tempo de espera quando a concorrência satura.
+
+Uso:
+    python3 -m benchmarks.load --mode asgi --rps 200 --duration 10
+    python3 -m benchmarks.load --mode uvicorn --mix purchase=1 --output bench.json
+    python3 -m benchmarks.load --mode external --gateway-url http://localhost:8000
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import random
+import time
+from typing import Callable, Dict, List
+
+import httpx
+
+from benchmarks.stack import open_stack
+from test_client import GATEWAY_URL
+
+DEFAULT_MIX = "register=1,login=2,purchase=5,user_orders=3,list_users=1,list_orders=1,list_transactions=1"
+
+class LoadState:
+    """Usuários conhecidos pela carga (criados no aquecimento e pelo registro)"""
+
+    def __init__(self):
+        self.users: List[dict] = []
+        self.sequence = itertools.count()
+
+    def new_email(self) -> str:
+        return f"bench.{time.time_ns()}.{next(self.sequence)}@example.com"
+
+    def random_user(self) -> dict:
+        return random.choice(self.users)
+
+# Operações (clients: "gateway", "users", "orders", "billing")
+Clients = Dict[str, httpx.AsyncClient]
+
+async def op_register(clients: Clients, state: LoadState) -> httpx.Response:
+    response = await clients["gateway"].post("/gateway/register", json={"name": "Bench User", "email": state.new_email()})
+    if response.status_code == 200:
+        state.users.append(response.json()["user"])
+    return response
+
+async def op_login(clients: Clients, state: LoadState) -> httpx.Response:
+    return await clients["gateway"].post("/gateway/login", json={"email": state.random_user()["email"]})
+
+async def op_purchase(clients: Clients, state: LoadState) -> httpx.Response:
+    return await clients["gateway"].post("/gateway/purchase", json={
+        "user_id": state.random_user()["user_id"],
+        "amount": round(random.uniform(10, 500), 2),
+        "product_name": random.choice(["Notebook Dell", "Mouse Logitech", "Teclado Mecânico"])
+    })
+
+async def op_user_orders(clients: Clients, state: LoadState) -> httpx.Response:
+    return await clients["gateway"].get(f"/gateway/user/{state.random_user()['user_id']}/orders")
+
+async def op_list_users(clients: Clients, state: LoadState) -> httpx.Response:
+    return await clients["users"].get("/users", params={"limit": 100})
+
+async def op_list_orders(clients: Clients, state: LoadState) -> httpx.Response:
+    return await clients["orders"].get("/orders", params={"limit": 100})
+
+async def op_list_transactions(clients: Clients, state: LoadState) -> httpx.Response:
+    return await clients["billing"].get("/billing/transactions", params={"limit": 100})
+
+OPERATIONS: Dict[str, Callable] = {
+    "register": op_register,
+    "login": op_login,
+    "purchase": op_purchase,
+    "user_orders": op_user_orders,
+    "list_users": op_list_users,
+    "list_orders": op_list_orders,
+    "list_transactions": op_list_transactions,
+}
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise SystemExit(f"Operação desconhecida: {name} (disponíveis: {', '.join(OPERATIONS)})")
+        weights[name] = float(weight or 1)
+    return weights
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Percentil pelo método nearest-rank"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+class Recorder:
+    """Latências e status por operação"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.statuses: Dict[str, Dict[str, int]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def record(self, name: str, latency: float, status: str, error: bool):
+        self.latencies.setdefault(name, []).append(latency)
+        statuses = self.statuses.setdefault(name, {})
+        statuses[status] = statuses.get(status, 0) + 1
+        if error:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def report(self, elapsed: float) -> dict:
+        endpoints = {}
+        for name, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            errors = self.errors.get(name, 0)
+            endpoints[name] = {
+                "requests": len(values),
+                "errors": errors,
+                "error_rate": round(errors / len(values), 4),
+                "throughput_rps": round(len(values) / elapsed, 1),
+                "latency_ms": {
+                    "p50": round(percentile(values, 0.50) * 1000, 2),
+                    "p95": round(percentile(values, 0.95) * 1000, 2),
+                    "p99": round(percentile(values, 0.99) * 1000, 2),
+                    "max": round(values[-1] * 1000, 2),
+                    "mean": round(sum(values) / len(values) * 1000, 2)
+                },
+                "status_codes": self.statuses[name]
+            }
+
+        total = sum(endpoint["requests"] for endpoint in endpoints.values())
+        errors = sum(endpoint["errors"] for endpoint in endpoints.values())
+        return {
+            "elapsed_s": round(elapsed, 2),
+            "requests": total,
+            "errors": errors,
+            "error_rate": round(errors / total, 4) if total else 0.0,
+            "throughput_rps": round(total / elapsed, 1) if elapsed else 0.0,
+            "endpoints": endpoints
+        }
+
+async def run_load(clients: Clients, state: LoadState, weights: Dict[str, float],
+                   rps: float, duration: float, concurrency: int) -> dict:
+    """Carga em malha aberta: uma requisição a cada 1/rps segundos, até `concurrency` simultâneas"""
+    recorder = Recorder()
+    semaphore = asyncio.Semaphore(concurrency)
+    names = list(weights)
+    loop = asyncio.get_running_loop()
+    pending = set()
+
+    async def execute(name: str, scheduled: float):
+        try:
+            response = await OPERATIONS[name](clients, state)
+            status = str(response.status_code)
+            error = response.status_code >= 400
+        except Exception as e:
+            status = type(e).__name__
+            error = True
+        finally:
+            semaphore.release()
+        recorder.record(name, loop.time() - scheduled, status, error)
+
+    started = loop.time()
+    interval = 1.0 / rps
+    scheduled = started
+    while scheduled < started + duration:
+        delay = scheduled - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await semaphore.acquire()
+        name = random.choices(names, weights=[weights[name] for name in names])[0]
+        task = asyncio.create_task(execute(name, scheduled))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+        scheduled += interval
+
+    if pending:
+        await asyncio.gather(*pending)
+    return recorder.report(loop.time() - started)
+
+async def warm_up(clients: Clients, state: LoadState, users: int, purchases: int):
+    """Criar usuários e compras iniciais para as operações de leitura"""
+    for _ in range(users):
+        await op_register(clients, state)
+    for _ in range(purchases):
+        await op_purchase(clients, state)
+    if not state.users:
+        raise SystemExit("Aquecimento falhou: nenhum usuário criado")
+
+async def main_async(args) -> dict:
+    weights = parse_mix(args.mix)
+    state = LoadState()
+    async with open_stack(args.mode, args.gateway_url, args.base_port) as clients:
+        await warm_up(clients, state, args.warmup_users, args.warmup_purchases)
+        report = await run_load(clients, state, weights, args.rps, args.duration, args.concurrency)
+
+    report["config"] = {
+        "mode": args.mode,
+        "rps": args.rps,
+        "duration_s": args.duration,
+        "concurrency": args.concurrency,
+        "mix": weights
+    }
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de carga do gateway")
+    parser.add_argument("--mode", choices=["asgi", "uvicorn", "external"], default="asgi")
+    parser.add_argument("--gateway-url", default=GATEWAY_URL, help="usado no modo external")
+    parser.add_argument("--base-port", type=int, default=18000, help="usado no modo uvicorn")
+    parser.add_argument("--rps", type=float, default=200)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--warmup-users", type=int, default=50)
+    parser.add_argument("--warmup-purchases", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="arquivo para o relatório JSON (sem ele, o relatório vai para o stdout)")
+    parser.add_argument("--verbose", action="store_true", help="manter os logs INFO/WARNING dos serviços")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    if not args.verbose:
+        logging.disable(logging.WARNING)
+
+    report = asyncio.run(main_async(args))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Benchmark de memória: bytes por registro de pedidos e transações,
+comparando um dict por registro (formato original) com a ColumnTable.
+Os índices secundários por ID também entram na conta: listas de int (formato
+original) x array("q") (formato atual: pedidos por usuário e por usuário/status,
+transações por pedido).
+
+Uso:
+    python3 -m benchmarks.record_memory [--records 200000] [--users 50000]
+"""
+import argparse
+import gc
+import json
+import random
+import tracemalloc
+from array import array
+from datetime import datetime, timedelta
+
+import orders_service
+import billing_service
+from common.records import ColumnTable
+
+PRODUCTS = ["Notebook Dell", "Mouse Logitech", "Teclado Mecânico", "Monitor LG", "Headset HyperX"]
+ORDER_STATUSES = ["pending", "completed", "payment_failed"]
+PAYMENT_METHODS = ["credit_card", "debit_card", "pix"]
+
+# Usuários distintos nos pedidos gerados (define o tamanho médio das listas dos índices)
+USERS = 50000
+
+def make_orders(count: int, users: int = USERS):
+    started = datetime.now()
+    for index in range(count):
+        order_id = orders_service.FIRST_ORDER_ID + index
+        yield order_id, {
+            "order_id": order_id,
+            "user_id": random.randint(1, users),
+            "amount": round(random.uniform(1, 5000), 2),
+            "product_name": random.choice(PRODUCTS),
+            "status": random.choice(ORDER_STATUSES),
+            "created_at": (started + timedelta(microseconds=index * 137)).isoformat()
+        }
+
+def make_transactions(count: int):
+    started = datetime.now()
+    for index in range(count):
+        transaction_id = billing_service.FIRST_TRANSACTION_ID + index
+        paid = random.random() < 0.9
+        yield transaction_id, {
+            "transaction_id": transaction_id,
+            "order_id": orders_service.FIRST_ORDER_ID + index,
+            "amount": round(random.uniform(1, 5000), 2),
+            "status": "paid" if paid else "failed",
+            "payment_method": random.choice(PAYMENT_METHODS),
+            "processed_at": (started + timedelta(microseconds=index * 137)).isoformat(),
+            "message": "Pagamento processado com sucesso" if paid else "Falha no processamento do pagamento"
+        }
+
+def measure(build) -> int:
+    """Memória (bytes) retida pela estrutura criada por build()"""
+    gc.collect()
+    tracemalloc.start()
+    table = build()
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del table
+    return current
+
+def empty_like(table: ColumnTable) -> ColumnTable:
+    return ColumnTable(table.key, table.first_id, table.columns)
+
+def order_index_keys(order: dict):
+    """Chaves de ORDERS_BY_USER e ORDERS_BY_USER_STATUS"""
+    return [order["user_id"], (order["user_id"], order["status"])]
+
+def transaction_index_keys(transaction: dict):
+    """Chave de TRANSACTIONS_BY_ORDER"""
+    return [transaction["order_id"]]
+
+def build_indexes(records, index_keys, new_ids) -> dict:
+    index = {}
+    for record_id, record in records:
+        for key in index_keys(record):
+            ids = index.get(key)
+            if ids is None:
+                ids = index[key] = new_ids()
+            ids.append(record_id)
+    return index
+
+def compare(name: str, make_records, template: ColumnTable, index_keys, count: int) -> dict:
+    random.seed(42)
+    dict_bytes = measure(lambda: dict(make_records(count)))
+    random.seed(42)
+    list_index_bytes = measure(lambda: build_indexes(make_records(count), index_keys, list))
+    random.seed(42)
+    array_index_bytes = measure(lambda: build_indexes(make_records(count), index_keys, lambda: array("q")))
+
+    random.seed(42)
+    def build_columns():
+        table = empty_like(template)
+        for record_id, record in make_records(count):
+            table[record_id] = record
+        return table
+    column_bytes = measure(build_columns)
+
+    return {
+        "table": name,
+        "records": count,
+        "dict_bytes_per_record": round(dict_bytes / count, 1),
+        "column_bytes_per_record": round(column_bytes / count, 1),
+        "reduction": round(dict_bytes / column_bytes, 1) if column_bytes else None,
+        "list_index_bytes_per_record": round(list_index_bytes / count, 1),
+        "array_index_bytes_per_record": round(array_index_bytes / count, 1),
+        # Tabela + índices: formato original (dict + listas) x atual (colunas + array)
+        "total_reduction": round((dict_bytes + list_index_bytes) / (column_bytes + array_index_bytes), 1)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Bytes por registro: dict x ColumnTable")
+    parser.add_argument("--records", type=int, default=200000)
+    parser.add_argument("--users", type=int, default=USERS, help="usuários distintos nos pedidos")
+    args = parser.parse_args()
+
+    results = [
+        compare("orders", lambda count: make_orders(count, args.users), orders_service.ORDERS_DB, order_index_keys,
+                args.records),
+        compare("transactions", make_transactions, billing_service.TRANSACTIONS_DB, transaction_index_keys,
+                args.records),
+    ]
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
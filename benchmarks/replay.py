@@ -0,0 +1,144 @@
+"""
+Reprodução de tráfego capturado pelo gateway (CAPTURE_FILE)
+
+Lê o arquivo de captura em streaming e reenvia cada requisição respeitando os
+intervalos originais entre chegadas, que podem ser comprimidos (--speed) e
+multiplicados (--multiplier: N cópias de cada requisição distribuídas no
+intervalo até a anterior). Os cabeçalhos gravados (Idempotency-Key, Prefer,
+traceparent) são reenviados; cada cópia extra recebe uma Idempotency-Key
+própria, para ser executada em vez de repetir o resultado da original. Gera o mesmo relatório JSON de benchmarks/load.py,
+agrupado por método e rota.
+
+Uso:
+    CAPTURE_FILE=captures/gateway.jsonl python3 gateway.py      # capturar
+    python3 -m benchmarks.replay captures/gateway.jsonl --speed 2 --multiplier 3
+    python3 -m benchmarks.replay captures/gateway.jsonl --mode asgi
+"""
+import argparse
+import asyncio
+import json
+import logging
+import re
+from typing import Iterator, Tuple
+
+import httpx
+
+from benchmarks.load import Recorder
+from benchmarks.stack import open_stack
+from common.idempotency import derive_key
+from test_client import GATEWAY_URL
+
+NUMERIC_SEGMENT = re.compile(r"/\d+(?=/|$)")
+
+def route_label(method: str, path: str) -> str:
+    """POST /gateway/user/42/orders?limit=5 -> POST /gateway/user/{id}/orders"""
+    return f"{method} {NUMERIC_SEGMENT.sub('/{id}', path.split('?', 1)[0])}"
+
+def read_capture(path: str) -> Iterator[dict]:
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def schedule(entries: Iterator[dict], speed: float, multiplier: int) -> Iterator[Tuple[float, dict, int]]:
+    """Gerar (deslocamento em segundos desde o início, requisição, número da cópia)"""
+    first_ts = None
+    previous_offset = 0.0
+    for entry in entries:
+        if first_ts is None:
+            first_ts = entry["ts"]
+        offset = (entry["ts"] - first_ts) / speed
+        gap = offset - previous_offset
+        for copy in range(multiplier, 0, -1):
+            yield offset - gap * (copy - 1) / multiplier, entry, multiplier - copy
+        previous_offset = offset
+
+async def send(client: httpx.AsyncClient, entry: dict, copy: int = 0) -> httpx.Response:
+    headers = dict(entry.get("headers") or {})
+    if entry.get("content_type"):
+        headers["content-type"] = entry["content_type"]
+    if copy and "idempotency-key" in headers:
+        headers["idempotency-key"] = derive_key(headers["idempotency-key"], f"copy-{copy}")
+    body = entry["body"].encode("utf-8") if entry.get("body") else None
+    return await client.request(entry["method"], entry["path"], content=body, headers=headers)
+
+async def replay(client: httpx.AsyncClient, capture_path: str, speed: float, multiplier: int,
+                 concurrency: int, limit: int = 0) -> dict:
+    recorder = Recorder()
+    semaphore = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+    pending = set()
+
+    async def execute(entry: dict, copy: int, scheduled: float):
+        label = route_label(entry["method"], entry["path"])
+        try:
+            response = await send(client, entry, copy)
+            status = str(response.status_code)
+            # Um erro só conta se a resposta original não era um erro também
+            error = response.status_code >= 400 and entry.get("status", 200) < 400
+        except Exception as e:
+            status = type(e).__name__
+            error = True
+        finally:
+            semaphore.release()
+        recorder.record(label, loop.time() - scheduled, status, error)
+
+    started = loop.time()
+    for sent, (offset, entry, copy) in enumerate(schedule(read_capture(capture_path), speed, multiplier)):
+        if limit and sent >= limit:
+            break
+        scheduled = started + offset
+        delay = scheduled - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await semaphore.acquire()
+        task = asyncio.create_task(execute(entry, copy, scheduled))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+
+    if pending:
+        await asyncio.gather(*pending)
+    return recorder.report(loop.time() - started)
+
+async def main_async(args) -> dict:
+    async with open_stack(args.mode, args.gateway_url, args.base_port) as clients:
+        report = await replay(clients["gateway"], args.capture, args.speed, args.multiplier,
+                              args.concurrency, args.limit)
+    report["config"] = {
+        "capture": args.capture,
+        "mode": args.mode,
+        "speed": args.speed,
+        "multiplier": args.multiplier,
+        "concurrency": args.concurrency
+    }
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproduzir uma captura de requisições do gateway")
+    parser.add_argument("capture", help="arquivo JSONL gerado com CAPTURE_FILE")
+    parser.add_argument("--mode", choices=["external", "asgi", "uvicorn"], default="external")
+    parser.add_argument("--gateway-url", default=GATEWAY_URL, help="usado no modo external")
+    parser.add_argument("--base-port", type=int, default=18000, help="usado no modo uvicorn")
+    parser.add_argument("--speed", type=float, default=1.0, help="fator de compressão do tempo")
+    parser.add_argument("--multiplier", type=int, default=1, help="cópias de cada requisição")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--limit", type=int, default=0, help="máximo de requisições (0 = todas)")
+    parser.add_argument("--output", help="arquivo para o relatório JSON (sem ele, o relatório vai para o stdout)")
+    parser.add_argument("--verbose", action="store_true", help="manter os logs INFO/WARNING dos serviços")
+    args = parser.parse_args()
+
+    if args.speed <= 0 or args.multiplier < 1:
+        raise SystemExit("--speed deve ser > 0 e --multiplier >= 1")
+    if not args.verbose:
+        logging.disable(logging.WARNING)
+
+    report = asyncio.run(main_async(args))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Inicialização da arquitetura completa (gateway + users + orders + billing)
+dentro do processo do benchmark
+
+- asgi:     o gateway chama os serviços via httpx.ASGITransport (sem rede)
+- uvicorn:  cada serviço sobe um servidor uvicorn local em sua própria porta
+            (todos no mesmo processo/event loop do gerador de carga)
+- external: arquitetura já em execução (ex.: ./run_all.sh)
+
+Cada stack entrega um dict de clientes: "gateway", "users", "orders" e "billing".
+"""
+import asyncio
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Dict
+
+import httpx
+import uvicorn
+
+import gateway
+import users_service
+import orders_service
+import billing_service
+
+SERVICE_APPS = {
+    "users": users_service.app,
+    "orders": orders_service.app,
+    "billing": billing_service.app,
+}
+
+def use_upstream(service: str, url: str, transport=None):
+    """Apontar o pool do gateway para outra URL/transporte"""
+    config = gateway.UPSTREAMS[service]
+    gateway.UPSTREAM_POOLS[service] = gateway.UpstreamGroup(service, [gateway.UpstreamPool(
+        service, url, config["max_connections"], config["max_keepalive"], transport=transport,
+        max_concurrent=config["max_concurrent"]
+    )])
+
+async def open_clients(stack: AsyncExitStack, urls: Dict[str, str], max_connections: int) -> Dict[str, httpx.AsyncClient]:
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    return {
+        name: await stack.enter_async_context(httpx.AsyncClient(base_url=url, limits=limits))
+        for name, url in urls.items()
+    }
+
+@asynccontextmanager
+async def asgi_stack():
+    """Todos os apps no mesmo event loop, sem rede"""
+    async with AsyncExitStack() as stack:
+        clients = {}
+        for service, app in SERVICE_APPS.items():
+            await stack.enter_async_context(app.router.lifespan_context(app))
+            use_upstream(service, f"http://{service}", transport=httpx.ASGITransport(app=app))
+            clients[service] = await stack.enter_async_context(
+                httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url=f"http://{service}")
+            )
+        await stack.enter_async_context(gateway.app.router.lifespan_context(gateway.app))
+
+        clients["gateway"] = await stack.enter_async_context(
+            httpx.AsyncClient(transport=httpx.ASGITransport(app=gateway.app), base_url="http://gateway")
+        )
+        yield clients
+
+async def start_server(app, port: int) -> tuple:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.01)
+    return server, task
+
+async def stop_server(server: uvicorn.Server, task: asyncio.Task):
+    server.should_exit = True
+    await task
+
+@asynccontextmanager
+async def uvicorn_stack(base_port: int = 18000, max_connections: int = 200):
+    """Servidores uvicorn locais (gateway em base_port, serviços nas portas seguintes)"""
+    servers = []
+    urls = {"gateway": f"http://127.0.0.1:{base_port}"}
+    try:
+        for offset, (service, app) in enumerate(SERVICE_APPS.items(), start=1):
+            servers.append(await start_server(app, base_port + offset))
+            urls[service] = f"http://127.0.0.1:{base_port + offset}"
+            use_upstream(service, urls[service])
+        servers.append(await start_server(gateway.app, base_port))
+
+        async with AsyncExitStack() as stack:
+            yield await open_clients(stack, urls, max_connections)
+    finally:
+        for server, task in reversed(servers):
+            await stop_server(server, task)
+
+@asynccontextmanager
+async def external_stack(gateway_url: str, max_connections: int = 200):
+    """Arquitetura já em execução (ex.: iniciada por ./run_all.sh)"""
+    urls = {"gateway": gateway_url}
+    urls.update({service: config["urls"][0] for service, config in gateway.UPSTREAMS.items()})
+    async with AsyncExitStack() as stack:
+        yield await open_clients(stack, urls, max_connections)
+
+def open_stack(mode: str, gateway_url: str = "http://localhost:8000", base_port: int = 18000):
+    if mode == "asgi":
+        return asgi_stack()
+    if mode == "uvicorn":
+        return uvicorn_stack(base_port)
+    if mode == "external":
+        return external_stack(gateway_url)
+    raise ValueError(f"Modo desconhecido: {mode}")
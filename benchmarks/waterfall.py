@@ -0,0 +1,58 @@
+"""
+Visualização em cascata de traces exportados com TRACE_FILE
+
+Junta os arquivos de spans de todos os serviços e mostra o trace pedido ou,
+sem trace_id, os traces mais lentos (pela duração do span raiz).
+
+Uso:
+    TRACE_FILE=traces/gateway.jsonl python3 gateway.py      # (idem nos serviços)
+    python3 -m benchmarks.waterfall traces/*.jsonl --slowest 5
+    python3 -m benchmarks.waterfall traces/*.jsonl --trace-id 4bf92f3577b34da6a3ce929d0e0e4736
+"""
+import argparse
+import json
+from typing import Dict, List
+
+from common.tracing import build_waterfall
+
+def load_spans(paths: List[str]) -> Dict[str, List[dict]]:
+    traces: Dict[str, List[dict]] = {}
+    for path in paths:
+        with open(path, "rb") as f:
+            for line in f:
+                if line.strip():
+                    data = json.loads(line)
+                    traces.setdefault(data["trace_id"], []).append(data)
+    return traces
+
+def slowest(traces: Dict[str, List[dict]], count: int) -> List[str]:
+    roots = []
+    for trace_id, spans in traces.items():
+        for data in spans:
+            if data["parent_id"] is None:
+                roots.append((data["duration_us"], trace_id))
+    return [trace_id for _, trace_id in sorted(roots, reverse=True)[:count]]
+
+def main():
+    parser = argparse.ArgumentParser(description="Mostrar traces em cascata")
+    parser.add_argument("files", nargs="+", help="arquivos JSONL gerados com TRACE_FILE")
+    parser.add_argument("--trace-id")
+    parser.add_argument("--slowest", type=int, default=3, help="quantidade de traces mais lentos")
+    parser.add_argument("--json", action="store_true", help="imprimir os spans ordenados em JSON")
+    args = parser.parse_args()
+
+    traces = load_spans(args.files)
+    trace_ids = [args.trace_id] if args.trace_id else slowest(traces, args.slowest)
+    for trace_id in trace_ids:
+        if trace_id not in traces:
+            raise SystemExit(f"Trace não encontrado: {trace_id}")
+        waterfall = build_waterfall(traces[trace_id])
+        if args.json:
+            print(json.dumps({"trace_id": trace_id, **waterfall}, indent=2))
+            continue
+        print(f"trace {trace_id} ({waterfall['duration_ms']} ms)")
+        print("\n".join(waterfall["waterfall"]))
+        print()
+
+if __name__ == "__main__":
+    main()
@@ -3,26 +3,71 @@ Billing Microservice
 Porta: 8003
 Responsabilidades: Processamento de pagamentos e cobranças
 """
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Path, Query, Response
 from pydantic import BaseModel
-from typing import Dict
+from typing import Dict, List, Optional
 from datetime import datetime
-import uvicorn
+from array import array
+from bisect import insort
+from contextlib import asynccontextmanager
 import logging
+import os
 import random
 
-# Configuração de logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='[BILLING-SERVICE] %(asctime)s - %(levelname)s - %(message)s'
-)
+from common.analytics import Aggregates
+from common.records import EMPTY_IDS, ColumnTable, TimeIndex, index_ids
+from common.idempotency import IDEMPOTENCY_HEADER, IdempotencyStore, SharedIdempotencyStore, run_idempotent
+from common.logs import CorrelationIdMiddleware, setup_logging
+from common.metrics import setup_metrics
+from common.storage import StoreSyncMiddleware, open_store
+from common.serialization import json_response
+from common.server import serve
+from common.tracing import setup_tracing
+from common.pagination import (DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, iter_time_range, ndjson_records_response,
+                               ndjson_response, page_by_id, take_page, time_bounds, time_cursor)
+
+# Configuração de logging (fila + thread de escrita, JSON por padrão; ver common/logs.py)
+setup_logging("billing-service")
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Billing Service", version="1.0.0", docs_url=None, redoc_url=None)
+# Armazenamento em memória (colunar: um array por campo em vez de um dict por transação)
+FIRST_TRANSACTION_ID = 5000
+TRANSACTIONS_DB = ColumnTable("transaction_id", FIRST_TRANSACTION_ID, {
+    "order_id": "int",
+    "amount": "float",
+    "status": "symbol",
+    "payment_method": "symbol",
+    "processed_at": "timestamp",
+    "message": "symbol"
+})
+
+# Índice secundário: order_id -> [transaction_id] (array("q"), como os índices de pedidos)
+TRANSACTIONS_BY_ORDER: Dict[int, "array[int]"] = {}
+
+# Índice de tempo: (processed_at, transaction_id) em ordem, para os filtros from/to
+TRANSACTIONS_BY_PROCESSED = TimeIndex()
+
+# Agregados para dashboards (transações e valor por status, método de pagamento e
+# hora), atualizados a cada cobrança e reembolso; receita = transações pagas
+TRANSACTION_ANALYTICS = Aggregates({
+    "status": lambda transaction: transaction["status"],
+    "payment_method": lambda transaction: transaction["payment_method"],
+}, revenue_statuses=["paid"], time_field="processed_at")
 
-# Armazenamento em memória
-TRANSACTIONS_DB: Dict[int, dict] = {}
-NEXT_TRANSACTION_ID = 5000
+# Quantidade máxima de itens por requisição em lote
+MAX_BATCH_SIZE = 1000
+
+# Persistência (backend definido por STORAGE_BACKEND)
+TRANSACTIONS_STORE = open_store("transactions", first_id=FIRST_TRANSACTION_ID)
+
+# Chaves de idempotência das cobranças (Idempotency-Key): quantidade máxima e TTL (em segundos)
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "3600"))
+# Com armazenamento compartilhado as chaves ficam no mesmo banco (valem entre processos)
+if TRANSACTIONS_STORE.shared:
+    CHARGE_IDEMPOTENCY = SharedIdempotencyStore(TRANSACTIONS_STORE, IDEMPOTENCY_MAX_KEYS, IDEMPOTENCY_TTL)
+else:
+    CHARGE_IDEMPOTENCY = IdempotencyStore(IDEMPOTENCY_MAX_KEYS, IDEMPOTENCY_TTL)
 
 # Modelos Pydantic
 class ChargeRequest(BaseModel):
@@ -30,6 +75,12 @@ class ChargeRequest(BaseModel):
     amount: float
     payment_method: str = "credit_card"
 
+class ChargeBatchRequest(BaseModel):
+    charges: List[ChargeRequest]
+
+class OrderTransactionsBatchRequest(BaseModel):
+    order_ids: List[int]
+
 class TransactionResponse(BaseModel):
     transaction_id: int
     order_id: int
@@ -39,38 +90,20 @@ class TransactionResponse(BaseModel):
     processed_at: str
     message: str
 
-# Endpoints
-@app.get("/health")
-async def health_check():
-    """Health check endpoint"""
-    return {"status": "healthy", "service": "billing"}
-
-@app.post("/billing/charge", response_model=TransactionResponse, status_code=201)
-async def charge_payment(charge: ChargeRequest):
-    """Processar pagamento"""
-    global NEXT_TRANSACTION_ID
-
-    logger.info(f"Processando pagamento: order_id={charge.order_id}, amount={charge.amount}")
-
-    # Validar amount
-    if charge.amount <= 0:
-        logger.warning(f"Amount inválido: {charge.amount}")
-        raise HTTPException(status_code=400, detail="Amount deve ser maior que zero")
-
+# Funções auxiliares
+def process_charge(charge: ChargeRequest, transaction_id: int) -> dict:
+    """Simular a cobrança (já validada, com ID reservado no armazenamento) e registrar a transação"""
     # Simular processamento de pagamento (90% de sucesso)
     success = random.random() < 0.9
 
-    transaction_id = NEXT_TRANSACTION_ID
-    NEXT_TRANSACTION_ID += 1
-
     if success:
         status = "paid"
         message = "Pagamento processado com sucesso"
-        logger.info(f"Pagamento aprovado: transaction_id={transaction_id}")
+        logger.info("Pagamento aprovado: transaction_id=%s", transaction_id)
     else:
         status = "failed"
         message = "Falha no processamento do pagamento"
-        logger.warning(f"Pagamento recusado: transaction_id={transaction_id}")
+        logger.warning("Pagamento recusado: transaction_id=%s", transaction_id)
 
     transaction_data = {
         "transaction_id": transaction_id,
@@ -83,63 +116,202 @@ async def charge_payment(charge: ChargeRequest):
     }
 
     TRANSACTIONS_DB[transaction_id] = transaction_data
+    index_ids(TRANSACTIONS_BY_ORDER, charge.order_id).append(transaction_id)
+    TRANSACTIONS_BY_PROCESSED.add(transaction_id, transaction_data["processed_at"])
+    TRANSACTION_ANALYTICS.add(transaction_data)
+    TRANSACTIONS_STORE.put(transaction_id, transaction_data)
+
+    return transaction_data
+
+def get_transactions_for_order(order_id: int) -> List[dict]:
+    """Buscar as transações de um pedido pelo índice order_id -> [transaction_id]"""
+    return [TRANSACTIONS_DB[transaction_id] for transaction_id in TRANSACTIONS_BY_ORDER.get(order_id, EMPTY_IDS)]
+
+def index_synced_transaction(transaction_id: int, previous: Optional[dict], transaction_data: dict):
+    """Indexar transações criadas ou reembolsadas por outros processos (ver StoreSyncMiddleware)"""
+    if previous is None:
+        insort(index_ids(TRANSACTIONS_BY_ORDER, transaction_data["order_id"]), transaction_id)
+        TRANSACTIONS_BY_PROCESSED.add(transaction_id, transaction_data["processed_at"])
+    TRANSACTION_ANALYTICS.replace(previous, transaction_data)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Carregar o estado persistido na inicialização e gravá-lo no encerramento"""
+    TRANSACTIONS_STORE.load(TRANSACTIONS_DB)
+    for transaction_id, transaction_data in TRANSACTIONS_DB.items():
+        index_ids(TRANSACTIONS_BY_ORDER, transaction_data["order_id"]).append(transaction_id)
+        TRANSACTIONS_BY_PROCESSED.add(transaction_id, transaction_data["processed_at"])
+        TRANSACTION_ANALYTICS.add(transaction_data)
+    TRANSACTIONS_STORE.subscribe(index_synced_transaction)
+
+    yield
+
+    await TRANSACTIONS_STORE.close()
+
+app = FastAPI(title="Billing Service", version="1.0.0", docs_url=None, redoc_url=None, lifespan=lifespan)
+METRICS = setup_metrics(app, "billing")
+app.add_middleware(CorrelationIdMiddleware)
+if TRANSACTIONS_STORE.shared:
+    app.add_middleware(StoreSyncMiddleware, stores=[TRANSACTIONS_STORE])
+setup_tracing(app, "billing")
 
+# Endpoints
+@app.get("/health")
+async def health_check():
+    """Health check endpoint"""
+    return {"status": "healthy", "service": "billing", "storage": TRANSACTIONS_STORE.stats(),
+            "idempotency": CHARGE_IDEMPOTENCY.stats()}
+
+@app.post("/billing/charge", response_model=TransactionResponse, status_code=201)
+async def charge_payment(charge: ChargeRequest, response: Response,
+                         idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER)):
+    """Processar pagamento (com Idempotency-Key, repetições não geram nova cobrança)"""
+    return await run_idempotent(
+        CHARGE_IDEMPOTENCY, idempotency_key, charge.model_dump(), lambda: execute_charge(charge, idempotency_key), response
+    )
+
+async def execute_charge(charge: ChargeRequest, idempotency_key: Optional[str] = None) -> dict:
+    logger.info("Processando pagamento: order_id=%s, amount=%s", charge.order_id, charge.amount)
+
+    # Validar amount
+    if charge.amount <= 0:
+        logger.warning("Amount inválido: %s", charge.amount)
+        raise HTTPException(status_code=400, detail="Amount deve ser maior que zero")
+
+    transaction_data = process_charge(charge, await TRANSACTIONS_STORE.allocate_ids())
+    if idempotency_key is not None:
+        # Resultado da chave gravado no mesmo commit da transação
+        CHARGE_IDEMPOTENCY.complete(idempotency_key, transaction_data)
+    await TRANSACTIONS_STORE.commit()
     return transaction_data
 
+@app.post("/billing/charge/batch", status_code=201)
+async def charge_payments_batch(batch: ChargeBatchRequest):
+    """Processar vários pagamentos em uma única requisição (tudo ou nada na validação)"""
+    logger.info("Processando %s pagamentos em lote", len(batch.charges))
+
+    if len(batch.charges) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Máximo de {MAX_BATCH_SIZE} pagamentos por requisição")
+
+    invalid = [index for index, charge in enumerate(batch.charges) if charge.amount <= 0]
+    if invalid:
+        logger.warning("Amount inválido nos itens: %s", invalid)
+        raise HTTPException(status_code=400, detail=f"Amount deve ser maior que zero (itens {invalid})")
+
+    first_id = await TRANSACTIONS_STORE.allocate_ids(len(batch.charges))
+    transactions = [process_charge(charge, first_id + index) for index, charge in enumerate(batch.charges)]
+    await TRANSACTIONS_STORE.commit()
+    return json_response({"transactions": transactions, "total": len(transactions)}, 201)
+
 @app.get("/billing/transaction/{transaction_id}", response_model=TransactionResponse)
 async def get_transaction(transaction_id: int):
     """Buscar transação por ID"""
-    logger.info(f"Buscando transação: transaction_id={transaction_id}")
+    logger.info("Buscando transação: transaction_id=%s", transaction_id)
 
     transaction_data = TRANSACTIONS_DB.get(transaction_id)
 
     if not transaction_data:
-        logger.warning(f"Transação não encontrada: transaction_id={transaction_id}")
+        logger.warning("Transação não encontrada: transaction_id=%s", transaction_id)
         raise HTTPException(status_code=404, detail="Transação não encontrada")
 
-    logger.info(f"Transação encontrada: transaction_id={transaction_id}")
-    return transaction_data
+    logger.info("Transação encontrada: transaction_id=%s", transaction_id)
+    return json_response(transaction_data)
 
 @app.get("/billing/order/{order_id}")
 async def get_order_transactions(order_id: int):
     """Listar todas as transações de um pedido"""
-    logger.info(f"Buscando transações do pedido: order_id={order_id}")
+    logger.info("Buscando transações do pedido: order_id=%s", order_id)
+
+    order_transactions = get_transactions_for_order(order_id)
+
+    logger.info("Encontradas %s transações para order_id=%s", len(order_transactions), order_id)
+    return json_response({"transactions": order_transactions, "total": len(order_transactions)})
 
-    order_transactions = [
-        tx for tx in TRANSACTIONS_DB.values()
-        if tx["order_id"] == order_id
-    ]
+@app.post("/billing/order/batch")
+async def get_orders_transactions_batch(request: OrderTransactionsBatchRequest):
+    """Listar as transações de vários pedidos em uma única requisição"""
+    if len(request.order_ids) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Máximo de {MAX_BATCH_SIZE} pedidos por requisição")
+
+    logger.info("Buscando transações de %s pedidos", len(request.order_ids))
+
+    transactions_by_order = {
+        order_id: get_transactions_for_order(order_id)
+        for order_id in request.order_ids
+    }
+    total = sum(len(transactions) for transactions in transactions_by_order.values())
 
-    logger.info(f"Encontradas {len(order_transactions)} transações para order_id={order_id}")
-    return {"transactions": order_transactions, "total": len(order_transactions)}
+    return json_response({"transactions_by_order": transactions_by_order, "total": total})
 
 @app.get("/billing/transactions")
-async def list_all_transactions():
-    """Listar todas as transações"""
-    logger.info(f"Listando {len(TRANSACTIONS_DB)} transações")
-    return {"transactions": list(TRANSACTIONS_DB.values()), "total": len(TRANSACTIONS_DB)}
+async def list_all_transactions(
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[int] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to")
+):
+    """
+    Listar transações (paginado por transaction_id; format=ndjson exporta em streaming)
+    Com from/to, só as processadas em [from, to), pelo índice de tempo (ordem processed_at, transaction_id)
+    """
+    logger.info("Listando transações: total=%s, cursor=%s, format=%s", len(TRANSACTIONS_DB), cursor, format)
+
+    if start is not None or end is not None:
+        bounds = time_bounds(start, end)
+        transactions = iter_time_range(TRANSACTIONS_BY_PROCESSED, TRANSACTIONS_DB.get, *bounds,
+                                       after=time_cursor(TRANSACTIONS_DB, "processed_at", cursor))
+        if format == "ndjson":
+            return ndjson_records_response(transactions, limit)
+        low, high = TRANSACTIONS_BY_PROCESSED.bounds(*bounds)
+        page, next_cursor = take_page(transactions, min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+        return json_response({"transactions": page, "total": high - low, "next_cursor": next_cursor})
+
+    if format == "ndjson":
+        return ndjson_response(TRANSACTIONS_DB.get, FIRST_TRANSACTION_ID, TRANSACTIONS_STORE.next_id, cursor, limit)
+
+    page_size = min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+    transactions, next_cursor = page_by_id(
+        TRANSACTIONS_DB.get, FIRST_TRANSACTION_ID, TRANSACTIONS_STORE.next_id, cursor, page_size
+    )
+    return json_response({"transactions": transactions, "total": len(TRANSACTIONS_DB), "next_cursor": next_cursor})
+
+@app.get("/billing/analytics")
+async def billing_analytics():
+    """Totais pagos, recusados e reembolsados (quantidade e valor), sem percorrer as transações"""
+    return json_response(TRANSACTION_ANALYTICS.summary())
+
+@app.get("/billing/analytics/{dimension}")
+async def billing_analytics_breakdown(dimension: str = Path(..., pattern="^(status|payment_method|hour|day)$")):
+    """Transações, valor e receita por status, método de pagamento ou bucket de tempo (hora/dia)"""
+    return json_response({"dimension": dimension, "groups": TRANSACTION_ANALYTICS.breakdown(dimension)})
 
 @app.post("/billing/refund/{transaction_id}")
 async def refund_transaction(transaction_id: int):
     """Processar reembolso de uma transação"""
-    logger.info(f"Processando reembolso: transaction_id={transaction_id}")
+    logger.info("Processando reembolso: transaction_id=%s", transaction_id)
 
     transaction_data = TRANSACTIONS_DB.get(transaction_id)
 
     if not transaction_data:
-        logger.warning(f"Transação não encontrada: transaction_id={transaction_id}")
+        logger.warning("Transação não encontrada: transaction_id=%s", transaction_id)
         raise HTTPException(status_code=404, detail="Transação não encontrada")
 
     if transaction_data["status"] != "paid":
-        logger.warning(f"Transação não pode ser reembolsada: status={transaction_data['status']}")
+        logger.warning("Transação não pode ser reembolsada: status=%s", transaction_data['status'])
         raise HTTPException(status_code=400, detail="Apenas transações pagas podem ser reembolsadas")
 
+    previous = dict(transaction_data)
     transaction_data["status"] = "refunded"
     transaction_data["message"] = "Reembolso processado com sucesso"
+    TRANSACTIONS_DB[transaction_id] = transaction_data
+    TRANSACTION_ANALYTICS.replace(previous, transaction_data)
+    TRANSACTIONS_STORE.put(transaction_id, transaction_data)
+    await TRANSACTIONS_STORE.commit()
 
-    logger.info(f"Reembolso concluído: transaction_id={transaction_id}")
-    return transaction_data
+    logger.info("Reembolso concluído: transaction_id=%s", transaction_id)
+    return json_response(transaction_data)
 
 if __name__ == "__main__":
     logger.info("Iniciando Billing Service na porta 8003")
-    uvicorn.run(app, host="0.0.0.0", port=8003)
+    serve(app, "billing_service:app", 8003, stores=[TRANSACTIONS_STORE])
@@ -0,0 +1,3 @@
+"""
+Código compartilhado entre os microserviços
+"""
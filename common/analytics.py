@@ -0,0 +1,113 @@
+"""
+Agregados mantidos incrementalmente (dashboards de vendas)
+
+Em vez de baixar todos os pedidos ou transações e somar no cliente, cada
+serviço mantém contagem e soma de `amount` por grupo (usuário, produto,
+método de pagamento, hora...), separadas por status. Cada gravação ajusta só
+os grupos do registro: add() para um registro novo, replace() quando ele muda
+(o valor antigo sai dos seus grupos e o novo entra). As consultas custam
+O(1) para um grupo e O(grupos) para uma dimensão inteira, sem percorrer os
+registros.
+
+Os buckets de tempo são guardados por hora (prefixo "AAAA-MM-DDTHH" do
+timestamp ISO); a visão por dia soma as horas do dia.
+"""
+from typing import Callable, Dict, Hashable, Iterable, List, Optional
+
+# Granularidades de tempo: tamanho do prefixo do timestamp ISO
+TIME_GRANULARITIES = {
+    "hour": 13,
+    "day": 10,
+}
+
+def hour_bucket(timestamp: str) -> str:
+    return timestamp[:TIME_GRANULARITIES["hour"]]
+
+class Counter:
+    """Quantidade e soma de amount de um grupo, por status"""
+
+    __slots__ = ("by_status",)
+
+    def __init__(self):
+        self.by_status: Dict[str, List[float]] = {}
+
+    def add(self, status: str, amount: float, sign: int):
+        entry = self.by_status.setdefault(status, [0, 0.0])
+        entry[0] += sign
+        entry[1] += sign * amount
+        if entry[0] == 0:
+            del self.by_status[status]
+
+    def merge(self, other: "Counter"):
+        for status, (count, amount) in other.by_status.items():
+            entry = self.by_status.setdefault(status, [0, 0.0])
+            entry[0] += count
+            entry[1] += amount
+
+    def __bool__(self) -> bool:
+        return bool(self.by_status)
+
+    def report(self, revenue_statuses: Iterable[str]) -> dict:
+        return {
+            "count": sum(count for count, _ in self.by_status.values()),
+            "amount": round(sum((amount for _, amount in self.by_status.values()), 0.0), 2),
+            "revenue": round(sum((self.by_status[status][1] for status in revenue_statuses
+                                  if status in self.by_status), 0.0), 2),
+            "by_status": {
+                status: {"count": count, "amount": round(amount, 2)}
+                for status, (count, amount) in sorted(self.by_status.items())
+            }
+        }
+
+class Aggregates:
+    """Contadores por dimensão, atualizados a cada gravação de registro"""
+
+    def __init__(self, dimensions: Dict[str, Callable[[dict], Hashable]], revenue_statuses: Iterable[str],
+                 time_field: Optional[str] = None):
+        self.dimensions = dict(dimensions)
+        if time_field is not None:
+            self.dimensions["hour"] = lambda record: hour_bucket(record[time_field])
+        self.revenue_statuses = tuple(revenue_statuses)
+        self.total = Counter()
+        self.groups: Dict[str, Dict[Hashable, Counter]] = {name: {} for name in self.dimensions}
+
+    def apply(self, record: dict, sign: int):
+        status, amount = record["status"], record["amount"]
+        self.total.add(status, amount, sign)
+        for name, key_of in self.dimensions.items():
+            groups = self.groups[name]
+            key = key_of(record)
+            counter = groups.get(key)
+            if counter is None:
+                counter = groups[key] = Counter()
+            counter.add(status, amount, sign)
+            if not counter:
+                del groups[key]
+
+    def add(self, record: dict):
+        self.apply(record, 1)
+
+    def replace(self, previous: Optional[dict], record: dict):
+        """Registro novo (previous=None) ou alterado"""
+        if previous is not None:
+            self.apply(previous, -1)
+        self.apply(record, 1)
+
+    def summary(self) -> dict:
+        return self.total.report(self.revenue_statuses)
+
+    def group(self, dimension: str, key: Hashable) -> dict:
+        return (self.groups[dimension].get(key) or Counter()).report(self.revenue_statuses)
+
+    def breakdown(self, dimension: str) -> Dict[Hashable, dict]:
+        """Todos os grupos de uma dimensão (buckets de tempo em ordem cronológica)"""
+        if dimension in TIME_GRANULARITIES:
+            groups = self.groups["hour"]
+            if dimension != "hour":
+                size = TIME_GRANULARITIES[dimension]
+                rolled: Dict[str, Counter] = {}
+                for bucket, counter in groups.items():
+                    rolled.setdefault(bucket[:size], Counter()).merge(counter)
+                groups = rolled
+            return {bucket: groups[bucket].report(self.revenue_statuses) for bucket in sorted(groups)}
+        return {key: counter.report(self.revenue_statuses) for key, counter in self.groups[dimension].items()}
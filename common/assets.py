@@ -0,0 +1,168 @@
+"""
+Arquivos estáticos do frontend com nome por conteúdo e pré-comprimidos
+
+Build (python3 -m common.assets; o gateway também roda na inicialização quando
+os fontes mudaram):
+- cada arquivo de frontend/ (exceto index.html) é copiado como
+  nome.<hash>.ext, com o hash SHA-256 do conteúdo, mais as versões .gz e .br
+  (brotli, se instalado) na compressão máxima;
+- o index.html gerado referencia os nomes com hash;
+- manifest.json guarda nome original -> nome com hash e o hash dos fontes.
+
+Servindo (StaticAssets, em memória): o conteúdo de um nome com hash nunca muda,
+então ele vai com Cache-Control immutable de um ano; index.html e os nomes
+originais vão com no-cache e são revalidados pelo ETag (If-None-Match -> 304).
+A versão enviada (br, gzip ou original) segue o Accept-Encoding.
+
+Configuração (variáveis de ambiente):
+    FRONTEND_DIR    fontes do frontend (padrão: frontend)
+    ASSETS_DIR      saída do build (padrão: frontend/dist)
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+from pathlib import Path
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+from common.compression import brotli, choose_encoding
+
+FRONTEND_DIR = os.getenv("FRONTEND_DIR", "frontend")
+ASSETS_DIR = os.getenv("ASSETS_DIR", os.path.join(FRONTEND_DIR, "dist"))
+
+INDEX_FILE = "index.html"
+MANIFEST_FILE = "manifest.json"
+STATIC_PREFIX = "/static/"
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+
+# Extensões das versões pré-comprimidas -> Content-Encoding
+PRECOMPRESSED = {".br": "br", ".gz": "gzip"}
+
+def digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:16]
+
+def hashed_name(name: str, content_hash: str) -> str:
+    stem, dot, extension = name.rpartition(".")
+    return f"{stem}.{content_hash}.{extension}" if dot else f"{name}.{content_hash}"
+
+def sources(source_dir: Path) -> Dict[str, bytes]:
+    return {path.name: path.read_bytes() for path in sorted(source_dir.iterdir()) if path.is_file()}
+
+def sources_digest(files: Dict[str, bytes]) -> str:
+    combined = hashlib.sha256()
+    for name, data in files.items():
+        combined.update(name.encode() + b"\0" + data + b"\0")
+    return combined.hexdigest()
+
+def write_atomic(path: Path, data: bytes):
+    """Gravar via arquivo temporário + rename (vários workers podem gerar o build ao mesmo tempo)"""
+    temporary = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    temporary.write_bytes(data)
+    os.replace(temporary, path)
+
+def write_variants(output_dir: Path, name: str, data: bytes):
+    """Gravar o arquivo e as versões comprimidas que ficarem menores que ele"""
+    write_atomic(output_dir / name, data)
+    variants = {".gz": gzip.compress(data, 9, mtime=0)}
+    if brotli is not None:
+        variants[".br"] = brotli.compress(data, quality=11)
+    for suffix, compressed in variants.items():
+        if len(compressed) < len(data):
+            write_atomic(output_dir / (name + suffix), compressed)
+
+def build(source_dir: str = FRONTEND_DIR, output_dir: str = ASSETS_DIR) -> dict:
+    """Gerar o build do frontend e retornar o manifest"""
+    source_path, output_path = Path(source_dir), Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+    files = sources(source_path)
+
+    assets = {}
+    for name, data in files.items():
+        if name != INDEX_FILE:
+            assets[name] = hashed_name(name, digest(data))
+            write_variants(output_path, assets[name], data)
+
+    if INDEX_FILE in files:
+        index = files[INDEX_FILE].decode()
+        for name, hashed in assets.items():
+            index = index.replace(f'"{STATIC_PREFIX}{name}"', f'"{STATIC_PREFIX}{hashed}"')
+        write_variants(output_path, INDEX_FILE, index.encode())
+
+    manifest = {"sources": sources_digest(files), "assets": assets}
+    write_atomic(output_path / MANIFEST_FILE, json.dumps(manifest, indent=2).encode())
+    return manifest
+
+def ensure_built(source_dir: str = FRONTEND_DIR, output_dir: str = ASSETS_DIR) -> dict:
+    """Reaproveitar o build se os fontes não mudaram; senão, gerar de novo"""
+    try:
+        manifest = json.loads((Path(output_dir) / MANIFEST_FILE).read_text())
+        if manifest["sources"] == sources_digest(sources(Path(source_dir))):
+            return manifest
+    except (OSError, ValueError, KeyError):
+        pass
+    return build(source_dir, output_dir)
+
+class Asset:
+    """Um arquivo servido: versões por codificação, ETag e política de cache"""
+
+    __slots__ = ("variants", "etag", "media_type", "cache_control")
+
+    def __init__(self, variants: Dict[Optional[str], bytes], media_type: str, cache_control: str):
+        self.variants = variants
+        self.etag = digest(variants[None])
+        self.media_type = media_type
+        self.cache_control = cache_control
+
+class StaticAssets:
+    """Build do frontend carregado em memória (alguns KB), servido com ETag e cache"""
+
+    def __init__(self, output_dir: str = ASSETS_DIR):
+        directory = Path(output_dir)
+        manifest = json.loads((directory / MANIFEST_FILE).read_text())
+        hashed = set(manifest["assets"].values())
+        self.assets: Dict[str, Asset] = {}
+        for name in [INDEX_FILE, *hashed]:
+            variants = {None: (directory / name).read_bytes()}
+            for suffix, encoding in PRECOMPRESSED.items():
+                compressed = directory / (name + suffix)
+                if compressed.exists():
+                    variants[encoding] = compressed.read_bytes()
+            media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+            self.assets[name] = Asset(variants, media_type, IMMUTABLE_CACHE if name in hashed else REVALIDATE_CACHE)
+        # Nomes originais continuam válidos (ex.: páginas antigas em cache), sempre revalidados
+        for name, hashed_file in manifest["assets"].items():
+            original = self.assets[hashed_file]
+            self.assets[name] = Asset(original.variants, original.media_type, REVALIDATE_CACHE)
+
+    def response(self, name: str, headers) -> Response:
+        asset = self.assets.get(name)
+        if asset is None:
+            raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+
+        encoding = choose_encoding(headers.get("accept-encoding", ""),
+                                   [encoding for encoding in PRECOMPRESSED.values() if encoding in asset.variants])
+        etag = f'"{asset.etag}-{encoding}"' if encoding else f'"{asset.etag}"'
+        response_headers = {"ETag": etag, "Cache-Control": asset.cache_control, "Vary": "Accept-Encoding"}
+
+        if_none_match = headers.get("if-none-match")
+        if if_none_match and (if_none_match.strip() == "*"
+                              or etag in [tag.strip().replace("W/", "", 1) for tag in if_none_match.split(",")]):
+            return Response(status_code=304, headers=response_headers)
+
+        if encoding:
+            response_headers["Content-Encoding"] = encoding
+        return Response(asset.variants[encoding], media_type=asset.media_type, headers=response_headers)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build do frontend (nomes com hash + gzip/brotli)")
+    parser.add_argument("--source", default=FRONTEND_DIR)
+    parser.add_argument("--output", default=ASSETS_DIR)
+    args = parser.parse_args()
+    print(json.dumps(build(args.source, args.output)["assets"], indent=2))
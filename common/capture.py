@@ -0,0 +1,198 @@
+"""
+Captura de requisições HTTP em arquivos JSONL rotativos
+
+O middleware ASGI registra método, caminho, os cabeçalhos que mudam o
+comportamento da requisição (CAPTURED_HEADERS), corpo, status e duração. A
+serialização e a escrita acontecem em uma thread de fundo que grava em lotes,
+então o custo no caminho da requisição é apenas enfileirar um dict. A fila é
+limitada: se o disco não acompanhar, as entradas excedentes são descartadas (e
+contadas) em vez de acumular memória; se a thread parar por erro, a captura é
+desativada. Os arquivos podem ser reproduzidos com benchmarks/replay.py.
+
+Formato de cada linha:
+    {"ts": 1700000000.123, "method": "POST", "path": "/gateway/purchase",
+     "content_type": "application/json", "headers": {"idempotency-key": "..."},
+     "body": "{...}", "status": 200, "duration_ms": 4.2}
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Cabeçalhos gravados (em minúsculas); os demais podem conter credenciais e não são guardados
+CAPTURED_HEADERS = (b"content-type", b"idempotency-key", b"prefer", b"traceparent")
+
+class RequestCapture:
+    """Escritor em segundo plano com rotação por tamanho"""
+
+    def __init__(self, path: str, max_bytes: int = 50 * 1024 * 1024, backups: int = 5,
+                 max_body: int = 64 * 1024, flush_interval: float = 0.5, max_queue: int = 10000):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.max_body = max_body
+        self.flush_interval = flush_interval
+        self.queue: "queue.Queue[Optional[dict]]" = queue.Queue(max_queue)
+        self.thread: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+        self.captured = 0
+        self.dropped = 0
+        # Thread de escrita parou por erro: nada mais é enfileirado
+        self.failed = False
+
+    def start(self):
+        with self.lock:
+            if self.thread is None and not self.failed:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self.thread = threading.Thread(target=self.run, name="request-capture", daemon=True)
+                self.thread.start()
+
+    def stop(self):
+        """Gravar o que estiver na fila e encerrar a thread"""
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is not None and thread.is_alive():
+            self.queue.put(None)
+            thread.join()
+
+    def record(self, entry: dict):
+        if self.thread is None:
+            if self.failed:
+                self.dropped += 1
+                return
+            self.start()
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def run(self):
+        file = None
+        try:
+            file = open(self.path, "ab")
+            running = True
+            while running:
+                batch = []
+                try:
+                    item = self.queue.get(timeout=self.flush_interval)
+                    while True:
+                        if item is None:
+                            running = False
+                            break
+                        batch.append(item)
+                        item = self.queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+                if batch:
+                    data = b"".join(json.dumps(entry, ensure_ascii=False).encode("utf-8") + b"\n" for entry in batch)
+                    file.write(data)
+                    file.flush()
+                    self.captured += len(batch)
+                    if file.tell() >= self.max_bytes:
+                        file.close()
+                        file = None
+                        self.rotate()
+                        file = open(self.path, "ab")
+        except Exception as e:
+            logger.error("Captura de requisições interrompida: %s", e)
+            self.failed = True
+            with self.lock:
+                self.thread = None
+            # Liberar a memória do que ainda estava na fila
+            while True:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                self.dropped += 1
+        finally:
+            if file is not None:
+                file.close()
+
+    def rotate(self):
+        """arquivo.jsonl -> arquivo.jsonl.1 -> ... -> arquivo.jsonl.N (o mais antigo é descartado)"""
+        for index in range(self.backups - 1, 0, -1):
+            source = self.path.with_name(f"{self.path.name}.{index}")
+            if source.exists():
+                os.replace(source, self.path.with_name(f"{self.path.name}.{index + 1}"))
+        if self.backups > 0:
+            os.replace(self.path, self.path.with_name(f"{self.path.name}.1"))
+        else:
+            self.path.unlink(missing_ok=True)
+
+    def stats(self) -> dict:
+        return {
+            "path": str(self.path),
+            "captured": self.captured,
+            "dropped": self.dropped,
+            "queued": self.queue.qsize(),
+            "failed": self.failed
+        }
+
+class CaptureMiddleware:
+    """Middleware ASGI que envia cada requisição para um RequestCapture"""
+
+    def __init__(self, app, capture: RequestCapture, exclude: Tuple[str, ...] = ("/static",)):
+        self.app = app
+        self.capture = capture
+        self.exclude = exclude
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.exclude):
+            await self.app(scope, receive, send)
+            return
+
+        started_at = time.time()
+        started = time.perf_counter()
+        body = bytearray()
+        truncated = False
+        status = 500
+        max_body = self.capture.max_body
+
+        async def capture_receive():
+            nonlocal truncated
+            message = await receive()
+            if message["type"] == "http.request":
+                chunk = message.get("body", b"")
+                room = max_body - len(body)
+                if len(chunk) > room:
+                    truncated = True
+                body.extend(chunk[:max(room, 0)])
+            return message
+
+        async def capture_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, capture_receive, capture_send)
+        finally:
+            path = scope["path"]
+            if scope.get("query_string"):
+                path += "?" + scope["query_string"].decode("latin-1")
+            headers = {
+                name.decode("latin-1"): value.decode("latin-1")
+                for name, value in scope.get("headers", []) if name in CAPTURED_HEADERS
+            }
+            entry = {
+                "ts": started_at,
+                "method": scope["method"],
+                "path": path,
+                "content_type": headers.pop("content-type", None),
+                "headers": headers,
+                "body": body.decode("utf-8", errors="replace") if body else None,
+                "status": status,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 3)
+            }
+            if truncated:
+                entry["truncated"] = True
+            self.capture.record(entry)
@@ -0,0 +1,122 @@
+"""
+Compressão das respostas JSON grandes (gzip ou brotli)
+
+O middleware comprime, conforme o Accept-Encoding do cliente, respostas JSON de
+corpo único a partir de COMPRESSION_MIN_SIZE bytes; abaixo disso o ganho não
+compensa a CPU. Respostas em streaming (NDJSON), já codificadas ou de outros
+tipos passam sem alteração. Brotli é usado quando o pacote está instalado
+(pip install brotli, opcional) e o cliente o aceita; senão, gzip.
+
+Configuração (variáveis de ambiente):
+    RESPONSE_COMPRESSION    1 (padrão) ativa o middleware; 0 desativa
+    COMPRESSION_MIN_SIZE    tamanho mínimo do corpo em bytes (padrão: 1024)
+    GZIP_LEVEL              nível do gzip nas respostas dinâmicas (padrão: 6)
+"""
+import gzip
+import os
+from typing import Dict, Iterable, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # dependência opcional: pip install brotli
+    brotli = None
+
+RESPONSE_COMPRESSION = os.getenv("RESPONSE_COMPRESSION", "1") != "0"
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+
+# Qualidade do brotli nas respostas dinâmicas (rápida; os estáticos usam a máxima)
+BROTLI_QUALITY = 4
+
+# Codificações suportadas, em ordem de preferência
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+def encoding_qualities(accept_encoding: str) -> Dict[str, float]:
+    """Codificação (ou "*") -> q do Accept-Encoding; q inválido conta como 0"""
+    qualities = {}
+    for item in accept_encoding.split(","):
+        name, *params = item.split(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params:
+            key, _, value = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value.strip())
+                except ValueError:
+                    quality = 0.0
+        qualities[name] = quality
+    return qualities
+
+def choose_encoding(accept_encoding: str, available: Iterable[str] = ENCODINGS) -> Optional[str]:
+    """
+    Codificação disponível de maior q aceita pelo cliente; no empate, a primeira
+    de `available` (None: sem compressão). Uma codificação listada vale pelo seu
+    q (q=0 recusa); uma não listada vale pelo q de "*", se houver.
+    """
+    qualities = encoding_qualities(accept_encoding)
+    wildcard = qualities.get("*", 0.0)
+    chosen, chosen_quality = None, 0.0
+    for encoding in available:
+        quality = qualities.get(encoding, wildcard)
+        if quality > chosen_quality:
+            chosen, chosen_quality = encoding, quality
+    return chosen
+
+def compress(data: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY if level is None else level)
+    return gzip.compress(data, GZIP_LEVEL if level is None else level, mtime=0)
+
+class CompressionMiddleware:
+    """Middleware ASGI que comprime as respostas JSON acima de minimum_size bytes"""
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE,
+                 media_types: Iterable[str] = ("application/json",)):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.media_types = tuple(media_types)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+
+        async def compress_send(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                # Segurar o início até ver o corpo (os cabeçalhos dependem dele)
+                start = message
+                return
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+
+            pending, start = start, None
+            headers = MutableHeaders(raw=pending["headers"])
+            body = message.get("body", b"")
+            if (message.get("more_body", False) or len(body) < self.minimum_size
+                    or "content-encoding" in headers
+                    or not headers.get("content-type", "").startswith(self.media_types)):
+                await send(pending)
+                await send(message)
+                return
+
+            body = compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            await send(pending)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, compress_send)
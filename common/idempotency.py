@@ -0,0 +1,171 @@
+"""
+Chaves de idempotência (cabeçalho Idempotency-Key) com supressão de duplicatas
+
+Cada chave guarda o hash do corpo da requisição e um future com o resultado:
+- requisições simultâneas com a mesma chave aguardam a mesma execução (single-flight);
+- repetições após a conclusão recebem o resultado guardado, sem novo trabalho;
+- a mesma chave com outro corpo é rejeitada (422);
+- falhas não são guardadas, então uma nova tentativa executa de novo.
+
+O armazenamento é em memória, limitado por quantidade (LRU) e por TTL. Com
+vários processos (WORKERS > 1 ou várias instâncias sobre o mesmo SQLite),
+SharedIdempotencyStore guarda as chaves também no banco do serviço: uma
+repetição que chega a outro processo recebe o resultado gravado, e o resultado
+é gravado na mesma transação dos registros da operação (complete() antes do
+commit), então não existe registro gravado sem a chave concluída.
+
+Configuração (variáveis de ambiente):
+    IDEMPOTENCY_LEASE   tempo (s) que uma execução em andamento segura a chave
+                        compartilhada antes de outro processo assumir (padrão: 60)
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from fastapi import HTTPException
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+IDEMPOTENCY_LEASE = float(os.getenv("IDEMPOTENCY_LEASE", "60"))
+
+# Intervalo entre consultas enquanto outro processo executa a mesma chave
+SHARED_POLL_INTERVAL = 0.05
+
+def derive_key(key: str, scope: str) -> str:
+    """
+    Chave para uma etapa da operação (ex.: a cobrança de um pedido) repassada a
+    outro serviço: hash de tamanho fixo, válido para qualquer chave recebida
+    """
+    return hashlib.sha256(f"{key}\0{scope}".encode()).hexdigest()
+
+class IdempotencyEntry:
+    __slots__ = ("fingerprint", "future", "expires_at")
+
+    def __init__(self, fingerprint: str, future: asyncio.Future, expires_at: float):
+        self.fingerprint = fingerprint
+        self.future = future
+        self.expires_at = expires_at
+
+class IdempotencyStore:
+    def __init__(self, max_keys: int, ttl: float):
+        self.max_keys = max_keys
+        self.ttl = ttl
+        self.entries: "OrderedDict[str, IdempotencyEntry]" = OrderedDict()
+        self.executed = 0
+        self.replayed = 0
+        self.coalesced = 0
+        self.conflicts = 0
+
+    async def run(self, key: str, payload: Any, operation: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Executar a operação uma única vez por chave; retorna (resultado, repetido)"""
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail=f"{IDEMPOTENCY_HEADER} inválida")
+        fingerprint = hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+        entry = self.entries.get(key)
+        if entry is not None and entry.future.done() and entry.expires_at <= time.monotonic():
+            del self.entries[key]
+            entry = None
+
+        if entry is not None:
+            if entry.fingerprint != fingerprint:
+                self.conflicts += 1
+                raise HTTPException(status_code=422, detail=f"{IDEMPOTENCY_HEADER} já usada com outra requisição")
+            if entry.future.done():
+                self.replayed += 1
+            else:
+                self.coalesced += 1
+            self.entries.move_to_end(key)
+            return await asyncio.shield(entry.future), True
+
+        entry = IdempotencyEntry(fingerprint, asyncio.get_running_loop().create_future(),
+                                 time.monotonic() + self.ttl)
+        self.entries[key] = entry
+        while len(self.entries) > self.max_keys:
+            self.entries.popitem(last=False)
+
+        try:
+            result, replayed = await self.execute(key, fingerprint, operation)
+        except BaseException as e:
+            if self.entries.get(key) is entry:
+                del self.entries[key]
+            if isinstance(e, asyncio.CancelledError):
+                entry.future.cancel()
+            else:
+                entry.future.set_exception(e)
+                # Evitar o aviso "exception was never retrieved" quando não há ninguém aguardando
+                entry.future.exception()
+            raise
+
+        entry.future.set_result(result)
+        return result, replayed
+
+    async def execute(self, key: str, fingerprint: str, operation: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        self.executed += 1
+        return await operation(), False
+
+    def complete(self, key: str, result: Any):
+        """Chamado pela operação antes do seu commit (só o armazenamento compartilhado usa)"""
+
+    def stats(self) -> dict:
+        return {
+            "keys": len(self.entries),
+            "max_keys": self.max_keys,
+            "ttl": self.ttl,
+            "executed": self.executed,
+            "replayed": self.replayed,
+            "coalesced": self.coalesced,
+            "conflicts": self.conflicts
+        }
+
+class SharedIdempotencyStore(IdempotencyStore):
+    """
+    Chaves de idempotência no SQLite do serviço, válidas entre processos
+
+    O cache em memória continua agrupando as requisições do mesmo processo; a
+    primeira de cada chave reserva a chave no banco. Se outro processo já
+    concluiu, o resultado dele é devolvido; se ainda está executando, esta
+    aguarda (até o fim do lease, quando assume a execução).
+    """
+
+    def __init__(self, store, max_keys: int, ttl: float, lease: float = IDEMPOTENCY_LEASE):
+        super().__init__(max_keys, ttl)
+        self.store = store
+        self.lease = lease
+
+    async def execute(self, key: str, fingerprint: str, operation: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        while True:
+            state, result = await self.store.run(self.store.begin_key, key, fingerprint, self.lease)
+            if state == "claimed":
+                break
+            if state == "done":
+                self.replayed += 1
+                return json.loads(result), True
+            if state == "conflict":
+                self.conflicts += 1
+                raise HTTPException(status_code=422, detail=f"{IDEMPOTENCY_HEADER} já usada com outra requisição")
+            await asyncio.sleep(SHARED_POLL_INTERVAL)
+
+        self.executed += 1
+        try:
+            return await operation(), False
+        except BaseException:
+            await asyncio.shield(self.store.run(self.store.release_key, key))
+            raise
+
+    def complete(self, key: str, result: Any):
+        self.store.put_result(key, result, self.ttl)
+
+async def run_idempotent(store: IdempotencyStore, key: Optional[str], payload: Any,
+                         operation: Callable[[], Awaitable[Any]], response) -> Any:
+    """Executar com idempotência quando a chave foi enviada (marca repetições no cabeçalho da resposta)"""
+    if key is None:
+        return await operation()
+    result, replayed = await store.run(key, payload, operation)
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
@@ -0,0 +1,157 @@
+"""
+Fila de jobs em processo com workers assíncronos
+
+submit() coloca o job em uma asyncio.Queue limitada e retorna imediatamente;
+um conjunto fixo de workers executa os jobs. Com a fila cheia, submit() falha
+(QueueFullError), e o chamador responde 503 em vez de acumular trabalho. O
+estado de cada job (queued, running, succeeded, failed) fica consultável até
+ser descartado pelo limite de jobs guardados (LRU).
+
+Cada job roda no contexto (contextvars) de quem o submeteu, então correlation
+id e trace da requisição original continuam valendo nos logs e spans do job.
+"""
+import asyncio
+import contextvars
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, List, Optional
+
+from fastapi import HTTPException
+
+from common.tracing import span
+
+logger = logging.getLogger(__name__)
+
+class QueueFullError(Exception):
+    pass
+
+class Job:
+    __slots__ = ("job_id", "payload", "status", "created_at", "started_at", "finished_at",
+                 "result", "error", "context")
+
+    def __init__(self, payload: Any):
+        self.job_id = uuid.uuid4().hex
+        self.payload = payload
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Any = None
+        self.error: Optional[dict] = None
+        self.context = contextvars.copy_context()
+
+    def to_dict(self) -> dict:
+        data = {
+            "job_id": self.job_id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+        if self.status == "succeeded":
+            data["result"] = self.result
+        elif self.status == "failed":
+            data["error"] = self.error
+        return data
+
+class JobQueue:
+    def __init__(self, name: str, handler: Callable[[Any], Awaitable[Any]], workers: int,
+                 max_depth: int, max_jobs: int):
+        self.name = name
+        self.handler = handler
+        self.worker_count = workers
+        self.max_depth = max_depth
+        self.max_jobs = max_jobs
+        self.queue: Optional[asyncio.Queue] = None
+        self.workers: List[asyncio.Task] = []
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self.running = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.succeeded = 0
+        self.failed = 0
+
+    async def start(self):
+        self.queue = asyncio.Queue(maxsize=self.max_depth)
+        self.workers = [asyncio.create_task(self.work()) for _ in range(self.worker_count)]
+
+    async def stop(self, drain_timeout: float):
+        """Aguardar os jobs pendentes (até drain_timeout) e encerrar os workers"""
+        if self.queue is None:
+            return
+        try:
+            await asyncio.wait_for(self.queue.join(), drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("%s: %s jobs pendentes descartados no encerramento", self.name, self.queue.qsize())
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        self.queue = None
+
+    def submit(self, payload: Any) -> Job:
+        if self.queue is None:
+            raise QueueFullError(f"Fila {self.name} não está em execução")
+        job = Job(payload)
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise QueueFullError(f"Fila {self.name} cheia ({self.max_depth} jobs)")
+        self.submitted += 1
+        self.jobs[job.job_id] = job
+        while len(self.jobs) > self.max_jobs:
+            self.jobs.popitem(last=False)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    async def work(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                # Task criada dentro do contexto do job: herda correlation id e trace
+                await job.context.run(asyncio.ensure_future, self.execute(job))
+            finally:
+                self.queue.task_done()
+
+    async def execute(self, job: Job):
+        job.status = "running"
+        job.started_at = time.time()
+        self.running += 1
+        try:
+            with span(f"job {self.name}", kind="consumer", job_id=job.job_id):
+                job.result = await self.handler(job.payload)
+            job.status = "succeeded"
+            self.succeeded += 1
+        except HTTPException as e:
+            job.status = "failed"
+            job.error = {"status_code": e.status_code, "detail": e.detail}
+            self.failed += 1
+        except Exception as e:
+            logger.error("%s: job %s falhou: %s", self.name, job.job_id, e)
+            job.status = "failed"
+            job.error = {"status_code": 500, "detail": str(e)}
+            self.failed += 1
+        finally:
+            self.running -= 1
+            job.finished_at = time.time()
+            # O payload não é mais necessário depois da execução
+            job.payload = None
+            job.context = None
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self.workers),
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+            "max_depth": self.max_depth,
+            "running": self.running,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "tracked_jobs": len(self.jobs)
+        }
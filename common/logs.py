@@ -0,0 +1,160 @@
+"""
+Logging assíncrono e estruturado
+
+O handler da thread da requisição apenas anota o correlation id e enfileira o
+LogRecord; a formatação (inclusive a interpolação "%s" da mensagem) e a
+escrita acontecem em uma thread de fundo (QueueListener). Logs INFO/DEBUG
+podem ser amostrados por requisição: todas as linhas de uma mesma requisição
+são mantidas ou descartadas juntas. WARNING e acima nunca são descartados.
+
+Variáveis de ambiente:
+    LOG_FORMAT=json|text   formato da saída (padrão json)
+    LOG_LEVEL=INFO         nível mínimo
+    LOG_SAMPLE_RATE=1.0    fração das requisições cujos logs INFO são mantidos
+
+O correlation id vem do cabeçalho X-Request-ID (ou é gerado) e fica disponível
+em get_correlation_id() para ser repassado às chamadas entre serviços.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import uuid
+import zlib
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+
+CORRELATION_HEADER = "x-request-id"
+CORRELATION_ID: ContextVar[Optional[str]] = ContextVar("correlation_id", default=None)
+
+LISTENER: Optional[logging.handlers.QueueListener] = None
+
+def get_correlation_id() -> Optional[str]:
+    return CORRELATION_ID.get()
+
+class ContextFilter(logging.Filter):
+    """Anotar o correlation id (lido na thread da requisição) e amostrar logs de baixa severidade"""
+
+    def __init__(self, sample_rate: float):
+        super().__init__()
+        # Limiar sobre crc32 do correlation id, para amostrar requisições inteiras
+        self.threshold = int(sample_rate * 0xFFFFFFFF)
+        self.sample_rate = sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        correlation_id = CORRELATION_ID.get()
+        record.correlation_id = correlation_id
+        if self.sample_rate >= 1.0 or record.levelno >= logging.WARNING:
+            return True
+        if correlation_id is None:
+            return random.random() < self.sample_rate
+        return zlib.crc32(correlation_id.encode()) <= self.threshold
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que não formata na thread da requisição (a fila é do próprio processo)"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+class JsonFormatter(logging.Formatter):
+    def __init__(self, service: str):
+        super().__init__()
+        self.service = service
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "service": self.service,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        correlation_id = getattr(record, "correlation_id", None)
+        if correlation_id:
+            entry["correlation_id"] = correlation_id
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+class TextFormatter(logging.Formatter):
+    """Formato original dos serviços, com o correlation id quando houver"""
+
+    def __init__(self, service: str):
+        super().__init__(f"[{service.upper()}] %(asctime)s - %(levelname)s - %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        correlation_id = getattr(record, "correlation_id", None)
+        return f"{line} [{correlation_id}]" if correlation_id else line
+
+def setup_logging(service: str):
+    """
+    Configurar o logger raiz com fila + thread de escrita. Como logging.basicConfig,
+    só a primeira chamada do processo tem efeito (serviços no mesmo processo
+    compartilham o pipeline).
+    """
+    global LISTENER
+    if LISTENER is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter(service) if LOG_FORMAT == "json" else TextFormatter(service))
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    handler = DeferredQueueHandler(log_queue)
+    handler.addFilter(ContextFilter(LOG_SAMPLE_RATE))
+
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(handler)
+
+    LISTENER = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    LISTENER.start()
+    atexit.register(stop_logging)
+
+def stop_logging():
+    """Escrever os registros pendentes e encerrar a thread de escrita"""
+    global LISTENER
+    if LISTENER is not None:
+        LISTENER.stop()
+        LISTENER = None
+
+class CorrelationIdMiddleware:
+    """Middleware ASGI: adotar (ou gerar) o X-Request-ID e devolvê-lo na resposta"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        correlation_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                correlation_id = value.decode("latin-1")[:128]
+                break
+        if not correlation_id:
+            correlation_id = uuid.uuid4().hex
+        header = (b"x-request-id", correlation_id.encode("latin-1"))
+
+        async def correlation_send(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [header]
+            await send(message)
+
+        token = CORRELATION_ID.set(correlation_id)
+        try:
+            await self.app(scope, receive, correlation_send)
+        finally:
+            CORRELATION_ID.reset(token)
@@ -0,0 +1,207 @@
+"""
+Métricas no formato texto do Prometheus (sem dependências externas)
+
+Contadores, gauges e histogramas guardam os valores em dicts e listas simples
+indexados pela tupla de labels. Toda atualização acontece no event loop do
+serviço (uma única thread), então não há locks no caminho da requisição; os
+buckets do histograma são acumulados apenas na exposição (GET /metrics).
+
+Uso em um serviço:
+    METRICS = setup_metrics(app, "orders")
+    UPSTREAM_LATENCY = METRICS.histogram("upstream_request_duration_seconds", "...", ("service",))
+"""
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import FastAPI
+from fastapi.responses import Response
+from starlette.routing import Mount
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Limites (em segundos) dos buckets de latência
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{escape_label(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.values: Dict[tuple, float] = {}
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{format_labels(self.labels, labels)} {format_value(value)}"
+                for labels, value in self.values.items()]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, labels: tuple = (), amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+    def set(self, value: float, labels: tuple = ()):
+        self.values[labels] = value
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [contagem por bucket (não acumulada, último = +Inf), soma]
+        self.values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, labels: tuple = ()):
+        series = self.values.get(labels)
+        if series is None:
+            series = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self) -> List[str]:
+        lines = []
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{format_labels(self.labels, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, labels)} {format_value(total)}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, labels)} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    """Conjunto de métricas de um serviço"""
+
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Métrica já registrada: {metric.name}")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, labels: Tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+class RouteResolver:
+    """Rota registrada (ex.: /orders/{order_id}) de uma requisição, a partir do endpoint no scope"""
+
+    def __init__(self, router):
+        self.router = router
+        self.route_paths: Dict[object, str] = {}
+
+    def resolve(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        path = self.route_paths.get(endpoint)
+        if path is None:
+            # Rotas podem ser adicionadas depois do middleware (ex.: mounts), então o mapa é lazy
+            self.collect(self.router.routes, "")
+            path = self.route_paths.setdefault(endpoint, "unmatched")
+        return path
+
+    def collect(self, routes, prefix: str):
+        """Mapear endpoint -> rota, entrando nos apps montados (ex.: /services/orders/orders/{order_id})"""
+        for route in routes:
+            if isinstance(route, Mount):
+                # O próprio app montado responde pelas rotas que ele não conhece
+                self.route_paths[route.app] = prefix + route.path
+                self.collect(route.routes, prefix + route.path)
+            else:
+                self.route_paths[getattr(route, "endpoint", None) or getattr(route, "app", None)] = prefix + route.path
+
+class MetricsMiddleware:
+    """Middleware ASGI com contagem, status, requisições em andamento e latência por rota"""
+
+    def __init__(self, app, requests: Counter, in_flight: Gauge, latency: Histogram, router):
+        self.app = app
+        self.requests = requests
+        self.in_flight = in_flight
+        self.latency = latency
+        # Rota e não o caminho, para limitar a cardinalidade dos labels
+        self.routes = RouteResolver(router)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        started = time.perf_counter()
+
+        async def metrics_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        self.in_flight.inc()
+        try:
+            await self.app(scope, receive, metrics_send)
+        finally:
+            self.in_flight.dec()
+            route = self.routes.resolve(scope)
+            method = scope["method"]
+            self.requests.inc((method, route, str(status)))
+            self.latency.observe(time.perf_counter() - started, (method, route))
+
+def setup_metrics(app: FastAPI, service: str, registry: Optional[MetricsRegistry] = None) -> MetricsRegistry:
+    """Registrar o middleware de métricas e o endpoint GET /metrics em um app"""
+    registry = registry or MetricsRegistry()
+    registry.gauge("service_info", "Identificação do serviço", ("service",)).set(1, (service,))
+    app.add_middleware(
+        MetricsMiddleware,
+        requests=registry.counter(
+            "http_requests_total", "Requisições HTTP por método, rota e status", ("method", "route", "status")),
+        in_flight=registry.gauge("http_requests_in_flight", "Requisições HTTP em andamento"),
+        latency=registry.histogram(
+            "http_request_duration_seconds", "Latência das requisições HTTP", ("method", "route")),
+        router=app.router
+    )
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        return Response(registry.render(), media_type=CONTENT_TYPE)
+
+    return registry
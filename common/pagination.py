@@ -0,0 +1,102 @@
+"""
+Paginação por cursor e exportação em NDJSON compartilhadas pelos microserviços
+
+Os registros de cada serviço usam IDs sequenciais e nunca são removidos, então
+uma página é lida diretamente a partir do cursor (último ID retornado) sem
+materializar a tabela inteira.
+
+Com intervalo de tempo (from/to), os registros vêm de um TimeIndex em ordem de
+(timestamp, id): a busca binária encontra o início do intervalo e o cursor
+continua sendo o último ID retornado.
+"""
+from datetime import datetime
+from typing import Callable, Iterator, List, Optional, Tuple
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+from common.records import ColumnTable, TimeIndex, to_epoch_micros
+from common.serialization import dumps
+
+# Tamanho das páginas nas listagens JSON
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Quantidade de registros enviados por bloco no modo NDJSON
+NDJSON_CHUNK_SIZE = 500
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+RecordGetter = Callable[[int], Optional[dict]]
+Records = Iterator[Tuple[int, dict]]
+
+def iter_records(get_record: RecordGetter, first_id: int, next_id: int,
+                 cursor: Optional[int] = None) -> Iterator[Tuple[int, dict]]:
+    """Percorrer os registros com ID maior que o cursor, em ordem crescente"""
+    current = first_id if cursor is None else max(cursor + 1, first_id)
+    while current < next_id:
+        record = get_record(current)
+        if record is not None:
+            yield current, record
+        current += 1
+
+def time_bounds(start: Optional[datetime], end: Optional[datetime]) -> Tuple[Optional[int], Optional[int]]:
+    """Converter os limites from/to em microssegundos desde a época"""
+    return (None if start is None else to_epoch_micros(start),
+            None if end is None else to_epoch_micros(end))
+
+def time_cursor(table: ColumnTable, field: str, cursor: Optional[int]) -> Optional[Tuple[int, int]]:
+    """Chave (timestamp, id) do último registro retornado, para continuar uma listagem por tempo"""
+    if cursor is None:
+        return None
+    if cursor not in table:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return table.get_raw(cursor, field), cursor
+
+def iter_time_range(index: TimeIndex, get_record: RecordGetter, start: Optional[int], end: Optional[int],
+                    after: Optional[Tuple[int, int]] = None) -> Records:
+    """Percorrer os registros com start <= timestamp < end em ordem de (timestamp, id), depois de `after`"""
+    low, high = index.bounds(start, end)
+    if after is not None:
+        low = max(low, index.position_after(*after))
+    for position in range(low, high):
+        record_id = index.ids[position]
+        record = get_record(record_id)
+        if record is not None:
+            yield record_id, record
+
+def take_page(records: Records, limit: int) -> Tuple[List[dict], Optional[int]]:
+    """Retornar uma página de registros e o cursor da próxima página (None no fim)"""
+    items = []
+    last_id = None
+    for record_id, record in records:
+        if len(items) == limit:
+            return items, last_id
+        items.append(record)
+        last_id = record_id
+    return items, None
+
+def page_by_id(get_record: RecordGetter, first_id: int, next_id: int,
+               cursor: Optional[int], limit: int) -> Tuple[List[dict], Optional[int]]:
+    return take_page(iter_records(get_record, first_id, next_id, cursor), limit)
+
+def iter_ndjson(records: Records, limit: Optional[int] = None) -> Iterator[bytes]:
+    """Gerar os registros em NDJSON, agrupados em blocos de NDJSON_CHUNK_SIZE linhas"""
+    chunk = []
+    sent = 0
+    for _, record in records:
+        if limit is not None and sent == limit:
+            break
+        chunk.append(dumps(record))
+        sent += 1
+        if len(chunk) == NDJSON_CHUNK_SIZE:
+            yield b"\n".join(chunk) + b"\n"
+            chunk = []
+    if chunk:
+        yield b"\n".join(chunk) + b"\n"
+
+def ndjson_response(get_record: RecordGetter, first_id: int, next_id: int,
+                    cursor: Optional[int] = None, limit: Optional[int] = None) -> StreamingResponse:
+    """Resposta em streaming (memória limitada, primeiro byte imediato)"""
+    return ndjson_records_response(iter_records(get_record, first_id, next_id, cursor), limit)
+
+def ndjson_records_response(records: Records, limit: Optional[int] = None) -> StreamingResponse:
+    return StreamingResponse(iter_ndjson(records, limit), media_type=NDJSON_MEDIA_TYPE)
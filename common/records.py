@@ -0,0 +1,256 @@
+"""
+Armazenamento compacto (colunar) de registros
+
+Em vez de um dict por registro, cada campo fica em um array tipado indexado
+por (id - first_id). Strings repetidas (status, produto, método de pagamento)
+são internadas em uma tabela de símbolos e guardadas como códigos inteiros, e
+timestamps ISO viram microssegundos inteiros desde a época.
+
+A tabela se comporta como um dict[int, dict] (get, [], in, len, items, values,
+update), então os endpoints, a paginação e o armazenamento persistente
+continuam trabalhando com dicts. Os dicts são montados na leitura; para
+alterar um registro é preciso gravá-lo de volta (table[id] = registro).
+
+TimeIndex guarda pares (timestamp, id) ordenados para consultas por intervalo
+de tempo com busca binária. Os índices secundários chave -> [id] dos serviços
+usam array("q") (index_ids): 8 bytes por ID, em vez de um ponteiro para um int.
+"""
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+EPOCH = datetime(1970, 1, 1)
+ONE_MICROSECOND = timedelta(microseconds=1)
+
+# Tipo de cada coluna -> typecode do array
+COLUMN_TYPECODES = {
+    "int": "q",
+    "float": "d",
+    "symbol": "I",
+    "timestamp": "q",
+}
+
+def to_epoch_micros(value) -> int:
+    """Converter datetime (ou string ISO) em microssegundos desde a época"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        # Os timestamps gravados são locais (datetime.now()) e sem fuso
+        value = value.astimezone().replace(tzinfo=None)
+    return (value - EPOCH) // ONE_MICROSECOND
+
+def from_epoch_micros(value: int) -> str:
+    """Converter microssegundos desde a época em string ISO"""
+    return (EPOCH + timedelta(microseconds=value)).isoformat()
+
+class SymbolTable:
+    """Internação de strings repetidas: cada valor distinto é guardado uma única vez"""
+
+    def __init__(self):
+        self.values: List[str] = []
+        self.codes: Dict[str, int] = {}
+
+    def encode(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            value = sys.intern(value)
+            self.values.append(value)
+            self.codes[value] = code
+        return code
+
+    def decode(self, code: int) -> str:
+        return self.values[code]
+
+    def copy(self) -> "SymbolTable":
+        table = SymbolTable()
+        table.values = list(self.values)
+        table.codes = dict(self.codes)
+        return table
+
+class ColumnTable:
+    """Tabela colunar indexada por IDs sequenciais a partir de first_id"""
+
+    def __init__(self, key: str, first_id: int, columns: Dict[str, str]):
+        self.key = key
+        self.first_id = first_id
+        self.columns = dict(columns)
+        self.present = array("b")
+        self.data = {name: array(COLUMN_TYPECODES[kind]) for name, kind in self.columns.items()}
+        self.symbols = {name: SymbolTable() for name, kind in self.columns.items() if kind == "symbol"}
+        self.count = 0
+
+    # Leitura
+    def __len__(self) -> int:
+        return self.count
+
+    def __contains__(self, record_id) -> bool:
+        row = record_id - self.first_id
+        return 0 <= row < len(self.present) and self.present[row] == 1
+
+    def __iter__(self) -> Iterator[int]:
+        first_id = self.first_id
+        for row, flag in enumerate(self.present):
+            if flag:
+                yield first_id + row
+
+    def keys(self) -> Iterator[int]:
+        return iter(self)
+
+    def get(self, record_id: int, default: Optional[dict] = None) -> Optional[dict]:
+        if record_id not in self:
+            return default
+        return self.build(record_id - self.first_id)
+
+    def __getitem__(self, record_id: int) -> dict:
+        record = self.get(record_id)
+        if record is None:
+            raise KeyError(record_id)
+        return record
+
+    def get_field(self, record_id: int, name: str):
+        """Ler um único campo sem montar o registro inteiro"""
+        return self.decode(name, self.get_raw(record_id, name))
+
+    def get_raw(self, record_id: int, name: str):
+        """Ler o valor guardado de um campo (código do símbolo, timestamp em microssegundos)"""
+        if record_id not in self:
+            raise KeyError(record_id)
+        return self.data[name][record_id - self.first_id]
+
+    def values(self) -> Iterator[dict]:
+        for row, flag in enumerate(self.present):
+            if flag:
+                yield self.build(row)
+
+    def items(self) -> Iterator[Tuple[int, dict]]:
+        first_id = self.first_id
+        for row, flag in enumerate(self.present):
+            if flag:
+                yield first_id + row, self.build(row)
+
+    def build(self, row: int) -> dict:
+        record = {self.key: self.first_id + row}
+        for name in self.columns:
+            record[name] = self.decode(name, self.data[name][row])
+        return record
+
+    def decode(self, name: str, raw):
+        kind = self.columns[name]
+        if kind == "symbol":
+            return self.symbols[name].decode(raw)
+        if kind == "timestamp":
+            return from_epoch_micros(raw)
+        return raw
+
+    def encode(self, name: str, value):
+        kind = self.columns[name]
+        if kind == "symbol":
+            return self.symbols[name].encode(value)
+        if kind == "timestamp":
+            return to_epoch_micros(value)
+        return value
+
+    # Escrita
+    def __setitem__(self, record_id: int, record: dict):
+        row = record_id - self.first_id
+        if row < 0:
+            raise KeyError(record_id)
+
+        # Preencher lacunas (IDs que nunca chegaram a ser gravados)
+        while len(self.present) < row:
+            self.present.append(0)
+            for column in self.data.values():
+                column.append(0)
+
+        if row == len(self.present):
+            self.present.append(1)
+            for name, column in self.data.items():
+                column.append(self.encode(name, record[name]))
+            self.count += 1
+            return
+
+        for name, column in self.data.items():
+            column[row] = self.encode(name, record[name])
+        if not self.present[row]:
+            self.present[row] = 1
+            self.count += 1
+
+    def update(self, other):
+        """Carregar registros de outra tabela (colunar ou dict)"""
+        if isinstance(other, ColumnTable) and not self.count and other.columns == self.columns \
+                and other.first_id == self.first_id:
+            # Snapshot colunar: adotar os arrays diretamente, sem montar dicts
+            self.present = other.present
+            self.data = other.data
+            self.symbols = other.symbols
+            self.count = other.count
+            return
+        for record_id, record in other.items():
+            self[record_id] = record
+
+    def copy(self) -> "ColumnTable":
+        """Cópia independente (usada pelos snapshots em segundo plano)"""
+        table = ColumnTable(self.key, self.first_id, self.columns)
+        table.present = self.present[:]
+        table.data = {name: column[:] for name, column in self.data.items()}
+        table.symbols = {name: symbols.copy() for name, symbols in self.symbols.items()}
+        table.count = self.count
+        return table
+
+    def memory_bytes(self) -> int:
+        """Bytes ocupados pelos arrays e pelas strings internadas"""
+        total = self.present.itemsize * len(self.present)
+        total += sum(column.itemsize * len(column) for column in self.data.values())
+        total += sum(sys.getsizeof(value) for symbols in self.symbols.values() for value in symbols.values)
+        return total
+
+# Resultado das consultas de chaves sem IDs nos índices secundários (somente leitura)
+EMPTY_IDS = array("q")
+
+def index_ids(index: dict, key) -> "array[int]":
+    """Lista de IDs de uma chave do índice secundário (criada vazia na primeira vez)"""
+    ids = index.get(key)
+    if ids is None:
+        ids = index[key] = array("q")
+    return ids
+
+class TimeIndex:
+    """
+    Pares (timestamp, id) em ordem crescente, em dois arrays compactos
+
+    Os registros chegam quase sempre em ordem (timestamp da criação e IDs
+    crescentes), então a inserção costuma ser um append; os que chegam fora de
+    ordem (ex.: gravados por outro processo) são inseridos na posição certa.
+    """
+
+    def __init__(self):
+        self.epochs = array("q")
+        self.ids = array("q")
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, record_id: int, timestamp):
+        epoch = to_epoch_micros(timestamp)
+        if not self.ids or (epoch, record_id) > (self.epochs[-1], self.ids[-1]):
+            self.epochs.append(epoch)
+            self.ids.append(record_id)
+            return
+        position = self.position_after(epoch, record_id - 1)
+        self.epochs.insert(position, epoch)
+        self.ids.insert(position, record_id)
+
+    def bounds(self, start: Optional[int] = None, end: Optional[int] = None) -> Tuple[int, int]:
+        """Posições [início, fim) dos itens com start <= timestamp < end (microssegundos)"""
+        low = 0 if start is None else bisect_left(self.epochs, start)
+        high = len(self.epochs) if end is None else bisect_left(self.epochs, end)
+        return low, max(low, high)
+
+    def position_after(self, epoch: int, record_id: int) -> int:
+        """Posição do primeiro item depois de (epoch, record_id)"""
+        low = bisect_left(self.epochs, epoch)
+        high = bisect_right(self.epochs, epoch, low)
+        return bisect_right(self.ids, record_id, low, high)
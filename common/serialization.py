@@ -0,0 +1,52 @@
+"""
+Caminho rápido de serialização JSON das respostas
+
+Endpoints com response_model fazem o FastAPI revalidar o dict retornado com o
+modelo Pydantic e convertê-lo com jsonable_encoder antes de serializar; nas
+listagens isso custa mais que a própria consulta. Os registros dos serviços já
+têm exatamente os campos dos modelos, então json_response() devolve os bytes
+prontos (orjson, se instalado; senão o json da biblioteca padrão) e o FastAPI
+entrega a resposta sem passar por essas etapas. Os modelos continuam no
+decorator, documentando o formato.
+
+Configuração (variáveis de ambiente):
+    FAST_JSON   1 (padrão) usa o caminho rápido; 0 volta ao caminho padrão do
+                FastAPI (para comparação, ver benchmarks/json_path.py)
+"""
+import json
+import os
+from typing import Any
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # dependência opcional: pip install orjson
+    orjson = None
+
+FAST_JSON = os.getenv("FAST_JSON", "1") != "0"
+
+JSON_MEDIA_TYPE = "application/json"
+
+def dumps(data: Any) -> bytes:
+    """Serializar em JSON compacto (UTF-8)"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
+
+def loads(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+class FastJSONResponse(Response):
+    media_type = JSON_MEDIA_TYPE
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+def json_response(content: Any, status_code: int = 200):
+    """Resposta já serializada (sem revalidar o response_model) quando FAST_JSON está ativo"""
+    if not FAST_JSON:
+        return content
+    return FastJSONResponse(content, status_code=status_code)
@@ -0,0 +1,55 @@
+"""
+Inicialização dos serviços com um ou vários processos (workers)
+
+Com WORKERS=1 (padrão) o app roda no próprio processo, como antes. Com
+WORKERS > 1 o uvicorn cria N processos que escutam na mesma porta (o sistema
+operacional distribui as conexões) e cada um importa o módulo do serviço pelo
+caminho "modulo:app". O estado de cada processo fica em memória, então todos
+precisam de um armazenamento compartilhado (STORAGE_BACKEND=sqlite); memory e
+log guardam os dados de um único processo e são recusados.
+
+Configuração (variáveis de ambiente):
+    WORKERS     quantidade de processos por serviço (padrão: 1)
+    PORT        porta do serviço (padrão: a porta fixa de cada um), para subir
+                mais instâncias do mesmo serviço em outras portas
+    UDS         caminho de um Unix domain socket; quando definido, o serviço
+                escuta nele em vez da porta TCP (no gateway, use a URL
+                unix://<caminho>)
+"""
+import os
+import stat
+from typing import List, Optional
+
+import uvicorn
+
+from common.storage import MemoryStore
+
+WORKERS = int(os.getenv("WORKERS", "1"))
+UDS = os.getenv("UDS")
+
+def prepare_socket(path: str):
+    """Criar o diretório do socket e remover um socket antigo deixado por uma execução anterior"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+def serve(app, import_path: str, port: int, stores: List[MemoryStore] = (), workers: int = WORKERS,
+          uds: Optional[str] = UDS):
+    """Executar o app na porta indicada (ou em PORT, ou no socket `uds`) com `workers` processos"""
+    port = int(os.getenv("PORT", port))
+    bind = {"host": "0.0.0.0", "port": port}
+    if uds:
+        prepare_socket(uds)
+        bind = {"uds": uds}
+    if workers > 1:
+        single = [f"{store.name} ({store.backend})" for store in stores if not store.shared]
+        if single:
+            raise SystemExit(f"WORKERS={workers} exige um armazenamento compartilhado (STORAGE_BACKEND=sqlite); "
+                             f"em uso: {', '.join(single)}")
+        # log_config=None: os logs do uvicorn (inclusive de acesso) também passam pela fila
+        uvicorn.run(import_path, workers=workers, log_config=None, **bind)
+    else:
+        uvicorn.run(app, log_config=None, **bind)
@@ -0,0 +1,594 @@
+"""
+Backends de armazenamento das tabelas dos microserviços
+
+- memory: apenas em memória (comportamento original, estado perdido ao reiniciar)
+- log: log append-only (write-ahead) + snapshots compactos periódicos
+- sqlite: banco SQLite em modo WAL compartilhado por vários processos (WORKERS > 1)
+
+No backend "log" cada alteração é registrada como um upsert do registro completo
+em um segmento de log (JSON lines). As escritas pendentes são gravadas com um
+único fsync para todas as requisições que aguardam ao mesmo tempo (group commit).
+A cada SNAPSHOT_INTERVAL alterações a tabela inteira é gravada em um snapshot
+(pickle) e os segmentos antigos são removidos. Na inicialização o snapshot é lido
+via mmap e apenas a cauda do log é reaplicada.
+
+No backend "sqlite" a tabela em memória de cada processo funciona como réplica:
+IDs são reservados atomicamente no banco (allocate_ids), unicidade (ex.: email)
+é garantida por insert_unique() (valor e registro na mesma transação), e antes de cada requisição sync() aplica as alterações
+gravadas pelos outros processos (em ordem de commit), avisando os serviços para
+que atualizem seus índices.
+
+Configuração (variáveis de ambiente):
+    STORAGE_BACKEND     memory | log | sqlite (padrão: memory)
+    DATA_DIR            diretório dos arquivos (padrão: data)
+    SNAPSHOT_INTERVAL   alterações entre snapshots (padrão: 100000)
+    GROUP_COMMIT_DELAY  espera (s) para agrupar escritas antes do fsync (padrão: 0.002)
+    SQLITE_SYNCHRONOUS  PRAGMA synchronous do SQLite: NORMAL | FULL (padrão: NORMAL)
+"""
+import asyncio
+import json
+import logging
+import mmap
+import os
+import pickle
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from common.tracing import span
+
+logger = logging.getLogger(__name__)
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "memory")
+DATA_DIR = os.getenv("DATA_DIR", "data")
+SNAPSHOT_INTERVAL = int(os.getenv("SNAPSHOT_INTERVAL", "100000"))
+GROUP_COMMIT_DELAY = float(os.getenv("GROUP_COMMIT_DELAY", "0.002"))
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT = 10.0
+
+# Chamado por sync() para cada registro alterado por outro processo: (id, anterior ou None, novo)
+ChangeListener = Callable[[int, Optional[dict], dict], None]
+
+class MemoryStore:
+    """Backend em memória: não persiste nada"""
+
+    backend = "memory"
+    # Pode ser usado por vários processos ao mesmo tempo
+    shared = False
+
+    def __init__(self, name: str, first_id: int = 1):
+        self.name = name
+        self.first_id = first_id
+        # Limite superior (exclusivo) dos IDs conhecidos, usado também na paginação
+        self.next_id = first_id
+        self.listeners: List[ChangeListener] = []
+
+    def load(self, table: Dict[int, dict]) -> Dict[int, dict]:
+        """Carregar a tabela persistida para dentro do dicionário do serviço"""
+        self.next_id = max(table, default=self.first_id - 1) + 1
+        return table
+
+    async def allocate_ids(self, count: int = 1) -> int:
+        """Reservar `count` IDs consecutivos e retornar o primeiro"""
+        first = self.next_id
+        self.next_id += count
+        return first
+
+    async def insert_unique(self, record_id: int, record: dict, namespace: str, value: str) -> bool:
+        """
+        Gravar um registro novo reservando um valor único (ex.: email) na mesma
+        transação; False (nada gravado) se o valor já estiver em uso em outro processo
+        """
+        self.put(record_id, record)
+        await self.commit()
+        return True
+
+    def subscribe(self, listener: ChangeListener):
+        """Registrar quem deve ser avisado das alterações feitas por outros processos"""
+        self.listeners.append(listener)
+
+    async def sync(self):
+        """Aplicar na tabela local as alterações feitas por outros processos"""
+
+    def put(self, record_id: int, record: dict):
+        """Registrar a versão atual de um registro"""
+
+    async def commit(self):
+        """Aguardar até que todas as alterações registradas estejam duráveis"""
+        # Span mesmo sem nada a gravar: os traces têm a mesma forma em todos os backends
+        with span(f"storage.commit {self.name}", backend=self.backend):
+            pass
+
+    async def close(self):
+        """Gravar o que estiver pendente e liberar os arquivos"""
+
+    def stats(self) -> dict:
+        return {"backend": self.backend}
+
+class LogStore(MemoryStore):
+    """Backend durável: log append-only com group commit + snapshots"""
+
+    backend = "log"
+
+    def __init__(self, name: str, first_id: int = 1, directory: str = DATA_DIR,
+                 snapshot_interval: int = SNAPSHOT_INTERVAL, group_commit_delay: float = GROUP_COMMIT_DELAY):
+        super().__init__(name, first_id)
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.snapshot_interval = snapshot_interval
+        self.group_commit_delay = group_commit_delay
+
+        self.table: Dict[int, dict] = {}
+        self.generation = 0
+        self.pending: List[str] = []
+        self.appended = 0
+        self.durable = 0
+        self.since_snapshot = 0
+        self.commits = 0
+        self.snapshots = 0
+        self.flushing: Optional[asyncio.Future] = None
+        self.snapshot_task: Optional[asyncio.Task] = None
+        self.file = None
+        self.file_generation = None
+
+    # Arquivos
+    @property
+    def snapshot_path(self) -> Path:
+        return self.directory / f"{self.name}.snapshot"
+
+    def segment_path(self, generation: int) -> Path:
+        return self.directory / f"{self.name}.{generation:08d}.log"
+
+    def segments(self) -> List[tuple]:
+        """Segmentos de log existentes, ordenados por geração"""
+        found = []
+        for path in self.directory.glob(f"{self.name}.*.log"):
+            try:
+                found.append((int(path.suffixes[-2].lstrip(".")), path))
+            except (IndexError, ValueError):
+                continue
+        return sorted(found)
+
+    # Inicialização
+    def load(self, table: Dict[int, dict]) -> Dict[int, dict]:
+        """Ler o snapshot via mmap e reaplicar os segmentos de log posteriores"""
+        started = time.perf_counter()
+        self.table = table
+        snapshot_generation = 0
+
+        if self.snapshot_path.exists() and self.snapshot_path.stat().st_size > 0:
+            with open(self.snapshot_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                snapshot = pickle.loads(data)
+            self.table.update(snapshot["records"])
+            snapshot_generation = snapshot["generation"]
+
+        replayed = 0
+        last_generation = snapshot_generation
+        for generation, path in self.segments():
+            if generation < snapshot_generation:
+                continue
+            last_generation = max(last_generation, generation)
+            with open(path, "rb") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Última linha incompleta (queda durante a escrita)
+                        logger.warning("Linha inválida ignorada em %s", path.name)
+                        continue
+                    self.table[entry["id"]] = entry["record"]
+                    replayed += 1
+
+        # Novas escritas sempre vão para um segmento novo
+        self.generation = last_generation + 1
+        self.since_snapshot = replayed
+        self.next_id = max(self.table, default=self.first_id - 1) + 1
+
+        logger.info(
+            f"{self.name}: {len(self.table)} registros carregados "
+            f"({replayed} do log) em {time.perf_counter() - started:.2f}s"
+        )
+        return self.table
+
+    # Escrita
+    def put(self, record_id: int, record: dict):
+        self.pending.append(json.dumps({"id": record_id, "record": record}, ensure_ascii=False))
+        self.appended += 1
+        self.since_snapshot += 1
+        if self.since_snapshot >= self.snapshot_interval and self.snapshot_task is None:
+            self.start_snapshot()
+
+    async def commit(self):
+        """Group commit: um único fsync atende todas as requisições que aguardam juntas"""
+        with span(f"storage.commit {self.name}", backend=self.backend):
+            await self.wait_durable(self.appended)
+
+    async def wait_durable(self, target: int):
+        while self.durable < target:
+            if self.flushing is not None:
+                # Outra requisição já está gravando; aguardar e verificar de novo
+                await asyncio.shield(self.flushing)
+                continue
+
+            self.flushing = asyncio.get_running_loop().create_future()
+            try:
+                if self.group_commit_delay:
+                    await asyncio.sleep(self.group_commit_delay)
+                lines, self.pending = self.pending, []
+                upto = self.appended
+                try:
+                    await asyncio.to_thread(self.write_lines, lines, self.generation)
+                except BaseException:
+                    self.pending[:0] = lines
+                    raise
+                self.durable = upto
+                self.commits += 1
+            finally:
+                self.flushing.set_result(None)
+                self.flushing = None
+
+    def write_lines(self, lines: List[str], generation: int):
+        """Anexar linhas ao segmento da geração indicada e fazer fsync"""
+        if self.file is None or self.file_generation != generation:
+            if self.file is not None:
+                self.file.close()
+            self.file = open(self.segment_path(generation), "ab")
+            self.file_generation = generation
+        if lines:
+            self.file.write(("\n".join(lines) + "\n").encode("utf-8"))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    # Snapshots
+    def start_snapshot(self):
+        """Trocar de segmento e gravar o snapshot em segundo plano"""
+        records = self.table.copy()
+        self.generation += 1
+        self.since_snapshot = 0
+        self.snapshot_task = asyncio.get_running_loop().create_task(self.snapshot(records, self.generation))
+
+    async def snapshot(self, records: Dict[int, dict], generation: int):
+        try:
+            await asyncio.to_thread(self.write_snapshot, records, generation)
+        except Exception as e:
+            logger.error("%s: falha ao gravar snapshot: %s", self.name, e)
+        finally:
+            self.snapshot_task = None
+
+    def write_snapshot(self, records: Dict[int, dict], generation: int):
+        """
+        Gravar o snapshot de forma atômica e remover os segmentos cobertos por ele.
+        Registros do segmento atual podem aparecer também no snapshot; como o log
+        guarda upserts completos, reaplicá-los é idempotente.
+        """
+        started = time.perf_counter()
+        temporary = self.snapshot_path.with_suffix(".tmp")
+        with open(temporary, "wb") as f:
+            pickle.dump({"generation": generation, "records": records}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.snapshot_path)
+        directory_fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(directory_fd)
+        finally:
+            os.close(directory_fd)
+
+        for segment_generation, path in self.segments():
+            if segment_generation < generation:
+                path.unlink(missing_ok=True)
+
+        self.snapshots += 1
+        logger.info(
+            f"{self.name}: snapshot com {len(records)} registros gravado em {time.perf_counter() - started:.2f}s"
+        )
+
+    async def close(self):
+        """Gravar pendências e um snapshot final (reinício rápido)"""
+        await self.commit()
+        if self.snapshot_task is not None:
+            await self.snapshot_task
+        self.generation += 1
+        await asyncio.to_thread(self.write_snapshot, self.table.copy(), self.generation)
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "records": len(self.table),
+            "generation": self.generation,
+            "appended": self.appended,
+            "durable": self.durable,
+            "commits": self.commits,
+            "snapshots": self.snapshots,
+            "since_snapshot": self.since_snapshot
+        }
+
+class SqliteStore(MemoryStore):
+    """
+    Backend compartilhado entre processos: SQLite em modo WAL
+
+    Cada commit grava os registros com um número de sequência crescente (os
+    escritores são serializados por BEGIN IMMEDIATE), e sync() lê apenas o que
+    tem sequência maior que a última aplicada. As chamadas ao SQLite rodam em
+    uma thread dedicada por tabela: a espera pelo lock de escrita de outro
+    processo (até SQLITE_BUSY_TIMEOUT) não bloqueia o event loop. sync() só
+    consulta a tabela quando o PRAGMA data_version (uma leitura em memória
+    compartilhada, sem lock) indica commits de outras conexões.
+    """
+
+    backend = "sqlite"
+    shared = True
+
+    def __init__(self, name: str, first_id: int = 1, directory: str = DATA_DIR,
+                 synchronous: str = SQLITE_SYNCHRONOUS):
+        super().__init__(name, first_id)
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        self.path = Path(directory) / f"{name}.db"
+        # Usada só pela thread do executor (e na inicialização, antes dela)
+        self.connection = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT, isolation_level=None,
+                                          check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(f"PRAGMA synchronous={synchronous}")
+        with self.transaction():
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS records (id INTEGER PRIMARY KEY, record TEXT NOT NULL, seq INTEGER NOT NULL)"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS records_seq ON records (seq)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS claims (namespace TEXT NOT NULL, value TEXT NOT NULL, "
+                "PRIMARY KEY (namespace, value))"
+            )
+            # Chaves de idempotência compartilhadas (result NULL: execução em andamento até expires_at)
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS idempotency (key TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, "
+                "result TEXT, expires_at REAL NOT NULL)"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS idempotency_expires ON idempotency (expires_at)")
+            self.connection.execute("INSERT OR IGNORE INTO counters VALUES ('next_id', ?), ('seq', 0)", (first_id,))
+        # Conexão separada, usada no event loop apenas para ler o data_version
+        self.probe = sqlite3.connect(self.path, isolation_level=None)
+        self.data_version = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"sqlite-{name}")
+
+        self.table: Dict[int, dict] = {}
+        self.pending: List[Tuple[int, str]] = []
+        # Resultados de idempotência gravados no mesmo commit dos registros: (chave, resultado, expira em)
+        self.results: List[Tuple[str, str, float]] = []
+        # IDs com escrita local ainda não confirmada: o sync() não os sobrescreve
+        self.writing: Dict[int, int] = {}
+        self.last_seq = 0
+        self.commits = 0
+        self.syncs = 0
+        self.synced = 0
+
+    def transaction(self):
+        """BEGIN IMMEDIATE ... COMMIT (ROLLBACK em caso de erro)"""
+        return SqliteTransaction(self.connection)
+
+    async def run(self, function, *args):
+        """Executar uma operação do SQLite na thread da tabela"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    def counter(self, name: str) -> int:
+        return self.connection.execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()[0]
+
+    def load(self, table: Dict[int, dict]) -> Dict[int, dict]:
+        started = time.perf_counter()
+        self.table = table
+        self.changed()
+        # Leitura em uma única transação: registros e sequência do mesmo instante
+        self.connection.execute("BEGIN")
+        try:
+            for record_id, data in self.connection.execute("SELECT id, record FROM records ORDER BY id"):
+                self.table[record_id] = json.loads(data)
+            self.last_seq = self.counter("seq")
+            allocated = self.counter("next_id")
+        finally:
+            self.connection.execute("COMMIT")
+        self.next_id = max(allocated, max(self.table, default=self.first_id - 1) + 1)
+        logger.info("%s: %s registros carregados do SQLite em %.2fs", self.name, len(self.table),
+                    time.perf_counter() - started)
+        return self.table
+
+    def reserve_ids(self, count: int) -> int:
+        with self.transaction():
+            first = self.counter("next_id")
+            self.connection.execute("UPDATE counters SET value = value + ? WHERE name = 'next_id'", (count,))
+        return first
+
+    async def allocate_ids(self, count: int = 1) -> int:
+        first = await self.run(self.reserve_ids, count)
+        self.next_id = max(self.next_id, first + count)
+        return first
+
+    def write_unique(self, record_id: int, data: str, namespace: str, value: str) -> Optional[int]:
+        with self.transaction():
+            try:
+                self.connection.execute("INSERT INTO claims (namespace, value) VALUES (?, ?)", (namespace, value))
+            except sqlite3.IntegrityError:
+                return None
+            seq = self.counter("seq") + 1
+            self.connection.execute("UPDATE counters SET value = ? WHERE name = 'seq'", (seq,))
+            self.connection.execute("INSERT INTO records (id, record, seq) VALUES (?, ?, ?)", (record_id, data, seq))
+        return seq
+
+    async def insert_unique(self, record_id: int, record: dict, namespace: str, value: str) -> bool:
+        row = (record_id, json.dumps(record, ensure_ascii=False))
+        self.writing[record_id] = self.writing.get(record_id, 0) + 1
+        try:
+            with span(f"storage.commit {self.name}", backend=self.backend):
+                seq = await self.run(self.write_unique, *row, namespace, value)
+        finally:
+            self.written([row])
+        if seq is None:
+            return False
+        if seq == self.last_seq + 1:
+            self.last_seq = seq
+        self.commits += 1
+        return True
+
+    # Idempotência compartilhada entre processos (usada por SharedIdempotencyStore)
+    def begin_key(self, key: str, fingerprint: str, lease: float) -> Tuple[str, Optional[str]]:
+        """("claimed", None): executar; ("done", resultado); ("busy", None); ("conflict", None)"""
+        now = time.time()
+        with self.transaction():
+            row = self.connection.execute(
+                "SELECT fingerprint, result, expires_at FROM idempotency WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and row[2] > now:
+                if row[0] != fingerprint:
+                    return "conflict", None
+                return ("done", row[1]) if row[1] is not None else ("busy", None)
+            self.connection.execute("INSERT OR REPLACE INTO idempotency VALUES (?, ?, NULL, ?)",
+                                    (key, fingerprint, now + lease))
+        return "claimed", None
+
+    def release_key(self, key: str):
+        """Liberar a chave de uma execução que falhou (uma nova tentativa executa de novo)"""
+        with self.transaction():
+            self.connection.execute("DELETE FROM idempotency WHERE key = ? AND result IS NULL", (key,))
+
+    def put_result(self, key: str, result: dict, ttl: float):
+        """Registrar o resultado de uma chave para gravar no mesmo commit dos registros da operação"""
+        self.results.append((key, json.dumps(result, ensure_ascii=False, default=str), time.time() + ttl))
+
+    def changed(self) -> bool:
+        """Houve commit de outra conexão desde a última verificação?"""
+        version = self.probe.execute("PRAGMA data_version").fetchone()[0]
+        if version == self.data_version:
+            return False
+        self.data_version = version
+        return True
+
+    def read_changes(self, after_seq: int) -> List[Tuple[int, str, int]]:
+        return self.connection.execute(
+            "SELECT id, record, seq FROM records WHERE seq > ? ORDER BY seq", (after_seq,)
+        ).fetchall()
+
+    async def sync(self):
+        if not self.changed():
+            return
+        self.syncs += 1
+        rows = await self.run(self.read_changes, self.last_seq)
+        for record_id, data, seq in rows:
+            if seq <= self.last_seq:
+                continue
+            self.last_seq = seq
+            if record_id >= self.next_id:
+                self.next_id = record_id + 1
+            if record_id in self.writing:
+                # A versão local (ainda sendo gravada) é mais recente que a lida
+                continue
+            record = json.loads(data)
+            previous = self.table.get(record_id)
+            if previous != record:
+                self.table[record_id] = record
+                self.synced += 1
+                for listener in self.listeners:
+                    listener(record_id, previous, record)
+
+    def put(self, record_id: int, record: dict):
+        self.pending.append((record_id, json.dumps(record, ensure_ascii=False)))
+        self.writing[record_id] = self.writing.get(record_id, 0) + 1
+
+    def write_rows(self, rows: List[Tuple[int, str]], results: List[Tuple[str, str, float]]) -> int:
+        with self.transaction():
+            seq = self.counter("seq") + 1
+            self.connection.execute("UPDATE counters SET value = ? WHERE name = 'seq'", (seq,))
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO records (id, record, seq) VALUES (?, ?, ?)",
+                [(record_id, data, seq) for record_id, data in rows]
+            )
+            if results:
+                self.connection.executemany(
+                    "UPDATE idempotency SET result = ?, expires_at = ? WHERE key = ?",
+                    [(result, expires_at, key) for key, result, expires_at in results]
+                )
+                self.connection.execute("DELETE FROM idempotency WHERE expires_at < ?", (time.time(),))
+        return seq
+
+    def written(self, rows: List[Tuple[int, str]]):
+        for record_id, _ in rows:
+            remaining = self.writing[record_id] - 1
+            if remaining:
+                self.writing[record_id] = remaining
+            else:
+                del self.writing[record_id]
+
+    async def commit(self):
+        with span(f"storage.commit {self.name}", backend=self.backend):
+            if not self.pending and not self.results:
+                return
+            rows, self.pending = self.pending, []
+            results, self.results = self.results, []
+            try:
+                seq = await self.run(self.write_rows, rows, results)
+            except BaseException:
+                self.pending[:0] = rows
+                self.results[:0] = results
+                raise
+            self.written(rows)
+            # Sem commits de outros processos no meio: não há o que reaplicar no próximo sync()
+            if seq == self.last_seq + 1:
+                self.last_seq = seq
+            self.commits += 1
+
+    async def close(self):
+        await self.commit()
+        await self.run(self.connection.close)
+        self.executor.shutdown()
+        self.probe.close()
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "records": len(self.table),
+            "path": str(self.path),
+            "last_seq": self.last_seq,
+            "commits": self.commits,
+            "syncs": self.syncs,
+            "synced_from_other_workers": self.synced
+        }
+
+class SqliteTransaction:
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.connection.execute("ROLLBACK" if exc_type is not None else "COMMIT")
+        return False
+
+class StoreSyncMiddleware:
+    """Middleware ASGI: aplicar as alterações dos outros processos (se houver) antes de cada requisição"""
+
+    def __init__(self, app, stores: List[MemoryStore]):
+        self.app = app
+        self.stores = stores
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            for store in self.stores:
+                await store.sync()
+        await self.app(scope, receive, send)
+
+STORE_BACKENDS = {
+    "memory": MemoryStore,
+    "log": LogStore,
+    "sqlite": SqliteStore,
+}
+
+def open_store(name: str, backend: str = STORAGE_BACKEND, first_id: int = 1) -> MemoryStore:
+    """Criar o backend configurado para a tabela indicada"""
+    if backend not in STORE_BACKENDS:
+        raise ValueError(f"Backend de armazenamento desconhecido: {backend}")
+    return STORE_BACKENDS[backend](name, first_id)
@@ -0,0 +1,299 @@
+"""
+Rastreamento distribuído (trace/span) entre gateway e microserviços
+
+O contexto segue o formato W3C (cabeçalho traceparent:
+"00-<trace_id>-<span_id>-<flags>"). Em cada serviço:
+- o middleware abre um span "servidor" por requisição (continuando o trace
+  recebido no cabeçalho, que decide se a requisição é amostrada, ou iniciando
+  um novo para uma fração TRACE_SAMPLE_RATE das requisições, padrão 10%);
+- TracedRoute separa leitura/validação do corpo ("parse"), o endpoint
+  ("handler") e a serialização da resposta ("serialize");
+- span() mede trechos internos (ex.: commit no armazenamento) e, no gateway,
+  cada chamada a um microserviço (o traceparent enviado aponta para esse span).
+
+Spans finalizados ficam em memória (últimos TRACE_BUFFER_TRACES traces,
+consultáveis em GET /traces/{trace_id}) e, com TRACE_FILE definido, também são
+gravados em JSONL por uma thread de fundo (ver benchmarks/waterfall.py).
+"""
+import atexit
+import inspect
+import os
+import random
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI, HTTPException
+from fastapi.routing import APIRoute
+
+from common.capture import RequestCapture
+from common.metrics import RouteResolver
+
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.1"))
+TRACE_BUFFER_TRACES = int(os.getenv("TRACE_BUFFER_TRACES", "1000"))
+TRACE_FILE = os.getenv("TRACE_FILE")
+
+TRACEPARENT_HEADER = "traceparent"
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "service", "kind",
+                 "start_us", "started", "duration_us", "attributes")
+
+    def __init__(self, trace_id: str, parent_id: Optional[str], name: str, service: str,
+                 kind: str = "internal", attributes: Optional[dict] = None):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.service = service
+        self.kind = kind
+        self.start_us = time.time_ns() // 1000
+        self.started = time.perf_counter()
+        self.duration_us = 0
+        self.attributes = attributes or {}
+
+    def child(self, name: str, kind: str = "internal", attributes: Optional[dict] = None) -> "Span":
+        return Span(self.trace_id, self.span_id, name, self.service, kind, attributes)
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def finish(self, end: Optional[float] = None):
+        self.duration_us = int(((end or time.perf_counter()) - self.started) * 1_000_000)
+        COLLECTOR.export(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "service": self.service,
+            "kind": self.kind,
+            "start_us": self.start_us,
+            "duration_us": self.duration_us,
+            "attributes": self.attributes
+        }
+
+CURRENT_SPAN: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+class SpanCollector:
+    """Spans finalizados agrupados por trace (LRU) e, opcionalmente, exportados para arquivo"""
+
+    def __init__(self, max_traces: int, path: Optional[str] = None):
+        self.max_traces = max_traces
+        self.traces: "OrderedDict[str, List[dict]]" = OrderedDict()
+        self.writer = RequestCapture(path) if path else None
+        if self.writer is not None:
+            atexit.register(self.writer.stop)
+
+    def export(self, span: Span):
+        data = span.to_dict()
+        spans = self.traces.get(span.trace_id)
+        if spans is None:
+            spans = self.traces[span.trace_id] = []
+            while len(self.traces) > self.max_traces:
+                self.traces.popitem(last=False)
+        spans.append(data)
+        if self.writer is not None:
+            self.writer.record(data)
+
+    def get(self, trace_id: str) -> List[dict]:
+        return list(self.traces.get(trace_id, ()))
+
+    def recent(self, limit: int) -> List[dict]:
+        """Resumo dos traces mais recentes que têm o span raiz neste processo"""
+        summaries = []
+        for trace_id in reversed(self.traces):
+            roots = [span for span in self.traces[trace_id] if span["parent_id"] is None]
+            if roots:
+                summaries.append({
+                    "trace_id": trace_id,
+                    "name": roots[0]["name"],
+                    "duration_ms": roots[0]["duration_us"] / 1000,
+                    "start_us": roots[0]["start_us"]
+                })
+                if len(summaries) >= limit:
+                    break
+        return summaries
+
+COLLECTOR = SpanCollector(TRACE_BUFFER_TRACES, TRACE_FILE)
+
+def current_span() -> Optional[Span]:
+    return CURRENT_SPAN.get()
+
+@contextmanager
+def span(name: str, kind: str = "internal", **attributes):
+    """Medir um trecho como filho do span atual (sem efeito se a requisição não é rastreada)"""
+    parent = CURRENT_SPAN.get()
+    if parent is None:
+        yield None
+        return
+    child = parent.child(name, kind, attributes)
+    token = CURRENT_SPAN.set(child)
+    try:
+        yield child
+    finally:
+        CURRENT_SPAN.reset(token)
+        child.finish()
+
+def parse_traceparent(value: str) -> Optional[tuple]:
+    """Retornar (trace_id, span_id, amostrado) ou None se o cabeçalho for inválido"""
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        sampled = bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None
+    return parts[1], parts[2], sampled
+
+class TracingMiddleware:
+    """Middleware ASGI: span servidor por requisição e cabeçalho x-trace-id na resposta"""
+
+    def __init__(self, app, service: str, router):
+        self.app = app
+        self.service = service
+        self.routes = RouteResolver(router)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace_id, parent_id, sampled = None, None, None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                context = parse_traceparent(value.decode("latin-1"))
+                if context is not None:
+                    trace_id, parent_id, sampled = context
+                break
+        if sampled is None:
+            sampled = TRACE_SAMPLE_RATE >= 1.0 or random.random() < TRACE_SAMPLE_RATE
+        if not sampled:
+            await self.app(scope, receive, send)
+            return
+
+        server_span = Span(trace_id or os.urandom(16).hex(), parent_id, scope["path"], self.service, "server")
+        server_span.attributes["http.method"] = scope["method"]
+        header = (b"x-trace-id", server_span.trace_id.encode())
+
+        async def tracing_send(message):
+            if message["type"] == "http.response.start":
+                server_span.attributes["http.status_code"] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [header]
+            await send(message)
+
+        token = CURRENT_SPAN.set(server_span)
+        try:
+            await self.app(scope, receive, tracing_send)
+        finally:
+            CURRENT_SPAN.reset(token)
+            server_span.name = f"{scope['method']} {self.routes.resolve(scope)}"
+            server_span.finish()
+
+class TracedRoute(APIRoute):
+    """Rota que registra os spans parse -> handler -> serialize dentro do span servidor"""
+
+    def get_route_handler(self):
+        endpoint = self.dependant.call
+        handler_name = getattr(endpoint, "__name__", "handler")
+
+        if inspect.iscoroutinefunction(endpoint) and not getattr(endpoint, "__traced__", False):
+            # Só endpoints async: o wrapper roda na mesma task e vê o span atual
+            async def traced_endpoint(**values):
+                with span(f"handler {handler_name}") as handler_span:
+                    result = await endpoint(**values)
+                if handler_span is not None:
+                    marks = ROUTE_MARKS.get()
+                    if marks is not None:
+                        marks.extend((handler_span.started, time.perf_counter()))
+                return result
+
+            traced_endpoint.__traced__ = True
+            self.dependant.call = traced_endpoint
+
+        route_handler = super().get_route_handler()
+
+        async def traced_route_handler(request):
+            parent = CURRENT_SPAN.get()
+            if parent is None:
+                return await route_handler(request)
+            started = time.perf_counter()
+            marks: list = []
+            token = ROUTE_MARKS.set(marks)
+            try:
+                response = await route_handler(request)
+            finally:
+                ROUTE_MARKS.reset(token)
+            if marks:
+                handler_started, handler_finished = marks[0], marks[1]
+                record_interval(parent, "parse", started, handler_started)
+                record_interval(parent, "serialize", handler_finished, time.perf_counter())
+            return response
+
+        return traced_route_handler
+
+# Instantes (início, fim) do endpoint, para derivar parse e serialize na rota
+ROUTE_MARKS: ContextVar[Optional[list]] = ContextVar("route_marks", default=None)
+
+def record_interval(parent: Span, name: str, started: float, finished: float):
+    """Registrar um span a partir de instantes já medidos (perf_counter)"""
+    child = parent.child(name)
+    child.start_us = parent.start_us + int((started - parent.started) * 1_000_000)
+    child.started = started
+    child.finish(finished)
+
+def build_waterfall(spans: List[dict]) -> dict:
+    """Ordenar spans em árvore (pai antes dos filhos) com deslocamento relativo ao início do trace"""
+    unique = {span["span_id"]: span for span in spans}
+    if not unique:
+        return {"spans": [], "waterfall": []}
+    children: Dict[Optional[str], List[dict]] = {}
+    for data in unique.values():
+        parent_id = data["parent_id"] if data["parent_id"] in unique else None
+        children.setdefault(parent_id, []).append(data)
+
+    trace_start = min(data["start_us"] for data in unique.values())
+    trace_end = max(data["start_us"] + data["duration_us"] for data in unique.values())
+    total = max(trace_end - trace_start, 1)
+    width = 40
+
+    ordered, lines = [], []
+
+    def visit(parent_id: Optional[str], depth: int):
+        for data in sorted(children.get(parent_id, []), key=lambda item: item["start_us"]):
+            offset = data["start_us"] - trace_start
+            ordered.append({
+                **data,
+                "depth": depth,
+                "offset_ms": round(offset / 1000, 3),
+                "duration_ms": round(data["duration_us"] / 1000, 3)
+            })
+            begin = int(offset * width / total)
+            length = max(1, int(data["duration_us"] * width / total))
+            bar = " " * begin + "█" * min(length, width - begin)
+            lines.append(f"{bar:<{width}} {data['duration_us'] / 1000:8.2f} ms  "
+                         f"{'  ' * depth}{data['name']} [{data['service']}]")
+            visit(data["span_id"], depth + 1)
+
+    visit(None, 0)
+    return {"duration_ms": round(total / 1000, 3), "spans": ordered, "waterfall": lines}
+
+def setup_tracing(app: FastAPI, service: str):
+    """Ativar o rastreamento em um app (chamar antes de declarar os endpoints)"""
+    app.router.route_class = TracedRoute
+    app.add_middleware(TracingMiddleware, service=service, router=app.router)
+
+    @app.get("/traces", include_in_schema=False)
+    async def recent_traces(limit: int = 20):
+        return {"traces": COLLECTOR.recent(limit)}
+
+    @app.get("/traces/{trace_id}", include_in_schema=False)
+    async def get_trace(trace_id: str):
+        spans = COLLECTOR.get(trace_id)
+        if not spans:
+            raise HTTPException(status_code=404, detail="Trace não encontrado")
+        return {"trace_id": trace_id, "spans": spans}
@@ -3,30 +3,639 @@ API Gateway
 Porta: 8000
 Responsabilidades: Orquestração de requisições entre microserviços
 """
-from fastapi import FastAPI, HTTPException
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, EmailStr
 import httpx
-import uvicorn
 import logging
-from typing import Optional
+import asyncio
+import hashlib
+import importlib
+import os
+import random
+import time
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Dict, List, Optional
 from pathlib import Path
+from urllib.parse import urlencode
 
-# Configuração de logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='[GATEWAY] %(asctime)s - %(levelname)s - %(message)s'
-)
+from common.assets import StaticAssets, ensure_built
+from common.capture import CaptureMiddleware, RequestCapture
+from common.compression import RESPONSE_COMPRESSION, CompressionMiddleware
+from common.jobs import JobQueue, QueueFullError
+from common.idempotency import IDEMPOTENCY_HEADER, IdempotencyStore, derive_key, run_idempotent
+from common.logs import CORRELATION_HEADER, CorrelationIdMiddleware, get_correlation_id, setup_logging
+from common.metrics import setup_metrics
+from common.serialization import FAST_JSON, JSON_MEDIA_TYPE, dumps, loads
+from common.server import serve
+from common.tracing import COLLECTOR, TRACEPARENT_HEADER, build_waterfall, setup_tracing, span
+
+# Configuração de logging (fila + thread de escrita, JSON por padrão; ver common/logs.py)
+setup_logging("gateway")
+# Uma linha INFO do httpx por chamada a microserviço é redundante com as métricas de upstream
+logging.getLogger("httpx").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
+# URLs dos microserviços (uma ou mais instâncias separadas por vírgula,
+# ex.: ORDERS_SERVICE_URL=http://localhost:8002,http://localhost:8012). Instâncias no
+# mesmo host podem ser acessadas por Unix domain socket, sem a pilha TCP:
+# ORDERS_SERVICE_URL=unix:///tmp/sba/orders.sock (o serviço sobe com UDS=/tmp/sba/orders.sock)
+USERS_SERVICE_URL = os.getenv("USERS_SERVICE_URL", "http://localhost:8001")
+ORDERS_SERVICE_URL = os.getenv("ORDERS_SERVICE_URL", "http://localhost:8002")
+BILLING_SERVICE_URL = os.getenv("BILLING_SERVICE_URL", "http://localhost:8003")
+
+# Balanceamento entre instâncias: p2c (melhor de duas escolhas aleatórias) ou
+# least_outstanding (menos chamadas em andamento entre todas)
+LOAD_BALANCER = os.getenv("LOAD_BALANCER", "p2c")
+
+# Verificação ativa de saúde das instâncias (GET /health), em segundos; 0 desativa.
+# Só roda para serviços com mais de uma instância.
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", "5.0"))
+
+# Pontos de cada instância no anel de hash consistente (afinidade por user_id)
+HASH_RING_REPLICAS = 100
+
+UNIX_SCHEME = "unix://"
+
+# Como o gateway chega aos microserviços: http (processos separados, URLs acima) ou
+# inprocess (modo co-localizado: os apps dos serviços rodam no processo do gateway e
+# call_service os chama via ASGI, sem TCP nem parsing HTTP; montados em /services/<nome>)
+UPSTREAM_MODE = os.getenv("UPSTREAM_MODE", "http")
+
+# Módulo e armazenamento de cada microserviço, para o modo inprocess
+COLOCATED_SERVICES = {
+    "users": ("users_service", "USERS_STORE"),
+    "orders": ("orders_service", "ORDERS_STORE"),
+    "billing": ("billing_service", "TRANSACTIONS_STORE"),
+}
+
+# Timeout para requisições (em segundos); com o timeout adaptativo, passa a ser o teto
+REQUEST_TIMEOUT = 5.0
+
+# Timeout adaptativo: p99 das latências recentes x multiplicador, limitado a [mínimo, REQUEST_TIMEOUT]
+ADAPTIVE_TIMEOUT_MULTIPLIER = float(os.getenv("ADAPTIVE_TIMEOUT_MULTIPLIER", "3.0"))
+ADAPTIVE_TIMEOUT_MIN = float(os.getenv("ADAPTIVE_TIMEOUT_MIN", "0.25"))
+LATENCY_WINDOW = 200
+LATENCY_MIN_SAMPLES = 20
+# Só métodos sem efeito colateral usam o timeout adaptativo: um POST cortado cedo
+# pode continuar executando no serviço (pedido ou cobrança órfãos)
+ADAPTIVE_TIMEOUT_METHODS = ("GET", "HEAD")
+
+# Circuit breaker: falhas consecutivas para abrir e tempo (em segundos) até a tentativa de recuperação
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RECOVERY_TIME = float(os.getenv("CIRCUIT_RECOVERY_TIME", "10.0"))
+
+# Bulkhead: tempo máximo (em segundos) de espera por uma vaga de concorrência no serviço
+BULKHEAD_WAIT_TIMEOUT = float(os.getenv("BULKHEAD_WAIT_TIMEOUT", "1.0"))
+
+# Timeout das chamadas em lote (mais itens por requisição) e tamanho máximo do lote
+BATCH_REQUEST_TIMEOUT = float(os.getenv("BATCH_REQUEST_TIMEOUT", "30.0"))
+MAX_PURCHASE_BATCH_SIZE = 1000
+
+# Timeout de cada verificação de saúde e tempo de cache do resultado agregado (em segundos)
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", "2.0"))
+HEALTH_CACHE_TTL = float(os.getenv("HEALTH_CACHE_TTL", "5.0"))
+
+# Limites do pool de conexões e de chamadas simultâneas (bulkhead) por microserviço,
+# configuráveis via variáveis de ambiente (ex.: BILLING_MAX_CONNECTIONS=200,
+# BILLING_MAX_KEEPALIVE=50, BILLING_MAX_CONCURRENT=50)
+UPSTREAMS = {
+    "users": {
+        "urls": USERS_SERVICE_URL.split(","),
+        "max_connections": int(os.getenv("USERS_MAX_CONNECTIONS", "100")),
+        "max_keepalive": int(os.getenv("USERS_MAX_KEEPALIVE", "20")),
+        "max_concurrent": int(os.getenv("USERS_MAX_CONCURRENT", "100")),
+    },
+    "orders": {
+        "urls": ORDERS_SERVICE_URL.split(","),
+        "max_connections": int(os.getenv("ORDERS_MAX_CONNECTIONS", "100")),
+        "max_keepalive": int(os.getenv("ORDERS_MAX_KEEPALIVE", "20")),
+        "max_concurrent": int(os.getenv("ORDERS_MAX_CONCURRENT", "100")),
+    },
+    "billing": {
+        "urls": BILLING_SERVICE_URL.split(","),
+        "max_connections": int(os.getenv("BILLING_MAX_CONNECTIONS", "100")),
+        "max_keepalive": int(os.getenv("BILLING_MAX_KEEPALIVE", "20")),
+        "max_concurrent": int(os.getenv("BILLING_MAX_CONCURRENT", "100")),
+    },
+}
+
+# Tempo (em segundos) que uma conexão ociosa permanece aberta no pool
+KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30"))
+
+# Cache de usuários: tamanho máximo, TTL e TTL das respostas 404 (cache negativo), em segundos
+USER_CACHE_MAX_SIZE = int(os.getenv("USER_CACHE_MAX_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+USER_CACHE_NEGATIVE_TTL = float(os.getenv("USER_CACHE_NEGATIVE_TTL", "5"))
+
+# Chaves de idempotência das compras: quantidade máxima guardada e TTL (em segundos)
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "3600"))
+
+# Compras assíncronas (Prefer: respond-async): workers, profundidade máxima da fila,
+# jobs guardados para consulta e tempo (em segundos) para concluir a fila no encerramento
+PURCHASE_WORKERS = int(os.getenv("PURCHASE_WORKERS", "32"))
+PURCHASE_QUEUE_DEPTH = int(os.getenv("PURCHASE_QUEUE_DEPTH", "1000"))
+PURCHASE_JOBS_MAX = int(os.getenv("PURCHASE_JOBS_MAX", "10000"))
+PURCHASE_DRAIN_TIMEOUT = float(os.getenv("PURCHASE_DRAIN_TIMEOUT", "10"))
+
+# Captura de requisições (desabilitada se CAPTURE_FILE não estiver definido)
+CAPTURE_FILE = os.getenv("CAPTURE_FILE")
+CAPTURE_MAX_BYTES = int(os.getenv("CAPTURE_MAX_BYTES", str(50 * 1024 * 1024)))
+CAPTURE_BACKUPS = int(os.getenv("CAPTURE_BACKUPS", "5"))
+REQUEST_CAPTURE = RequestCapture(CAPTURE_FILE, CAPTURE_MAX_BYTES, CAPTURE_BACKUPS) if CAPTURE_FILE else None
+
+# Modelos Pydantic
+class UserCreateRequest(BaseModel):
+    name: str
+    email: EmailStr
+
+class LoginRequest(BaseModel):
+    email: EmailStr
+
+class PurchaseRequest(BaseModel):
+    user_id: int
+    amount: float
+    product_name: str = "Produto Genérico"
+    payment_method: str = "credit_card"
+
+class PurchaseBatchRequest(BaseModel):
+    purchases: List[PurchaseRequest]
+
+# Proteções por microserviço
+class CircuitOpenError(Exception):
+    """Chamada rejeitada sem tentar o serviço (circuito aberto ou bulkhead cheio)"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """
+    Circuit breaker por serviço:
+    - closed: chamadas normais; CIRCUIT_FAILURE_THRESHOLD falhas seguidas abrem o circuito
+    - open: chamadas falham imediatamente até passar recovery_time
+    - half_open: uma única chamada de teste; sucesso fecha, falha reabre
+    """
+
+    def __init__(self, failure_threshold: int, recovery_time: float):
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.times_opened = 0
+        self.rejected_total = 0
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.recovery_time:
+            self.state = "half_open"
+        if self.state == "half_open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        self.rejected_total += 1
+        return False
+
+    def ready(self) -> bool:
+        """Se allow() aceitaria uma chamada agora (sem alterar o estado)"""
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            return time.monotonic() - self.opened_at >= self.recovery_time
+        return not self.trial_in_flight
+
+    def retry_after(self) -> float:
+        return max(0.0, self.recovery_time - (time.monotonic() - self.opened_at))
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.trial_in_flight = False
+        self.state = "closed"
+
+    def release_trial(self):
+        """Liberar a vaga de teste do half-open sem resultado (chamada não concluída)"""
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self.trial_in_flight = False
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                self.times_opened += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "rejected_total": self.rejected_total,
+            "retry_after": round(self.retry_after(), 3) if self.state != "closed" else 0.0
+        }
+
+class AdaptiveTimeout:
+    """Timeout derivado do p99 das últimas LATENCY_WINDOW chamadas"""
+
+    def __init__(self, ceiling: float):
+        self.ceiling = ceiling
+        self.samples: "deque[float]" = deque(maxlen=LATENCY_WINDOW)
+        self.current = ceiling
+        self.pending_samples = 0
+
+    def observe(self, latency: float):
+        self.samples.append(latency)
+        self.pending_samples += 1
+        # Recalcular o percentil periodicamente, não a cada chamada
+        if self.pending_samples >= LATENCY_MIN_SAMPLES:
+            self.pending_samples = 0
+            ordered = sorted(self.samples)
+            p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+            self.current = min(self.ceiling, max(ADAPTIVE_TIMEOUT_MIN, p99 * ADAPTIVE_TIMEOUT_MULTIPLIER))
+
+    def stats(self) -> dict:
+        return {"timeout": round(self.current, 3), "ceiling": self.ceiling, "samples": len(self.samples)}
+
+# Pool de conexões por microserviço
+class UpstreamPool:
+    """Cliente HTTP de longa duração (keep-alive HTTP/1.1) para um microserviço"""
+
+    def __init__(self, name: str, url: str, max_connections: int, max_keepalive: int,
+                 transport: Optional[httpx.AsyncBaseTransport] = None, max_concurrent: Optional[int] = None):
+        self.name = name
+        self.url = url
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=KEEPALIVE_EXPIRY
+        )
+        base_url = url
+        if transport is None and url.startswith(UNIX_SCHEME):
+            # unix:///caminho.sock: conexões pelo socket; o host da URL base só vai no cabeçalho Host
+            transport = httpx.AsyncHTTPTransport(uds=url[len(UNIX_SCHEME):], limits=self.limits)
+            base_url = f"http://{name}"
+        self.transport = transport or httpx.AsyncHTTPTransport(limits=self.limits)
+        self.client = httpx.AsyncClient(base_url=base_url, transport=self.transport, timeout=REQUEST_TIMEOUT)
+        self.requests_total = 0
+        self.errors_total = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.max_concurrent = max_concurrent or max_connections
+        self.bulkhead = asyncio.Semaphore(self.max_concurrent)
+        self.bulkhead_rejected = 0
+        self.breaker = CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RECOVERY_TIME)
+        self.timeout = AdaptiveTimeout(REQUEST_TIMEOUT)
+        # Resultado da última verificação ativa de saúde
+        self.healthy = True
+
+    async def request(self, method: str, path: str, json_data: Optional[dict] = None,
+                      timeout: Optional[float] = None, headers: Optional[dict] = None) -> httpx.Response:
+        """
+        Chamar o serviço respeitando circuit breaker e bulkhead. Sem timeout explícito,
+        GET/HEAD usam o timeout adaptativo e os demais métodos REQUEST_TIMEOUT. Timeouts, erros de conexão e respostas 5xx contam
+        como falha; respostas 4xx são erros de negócio e não abrem o circuito.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"Circuito aberto para {self.name}", self.breaker.retry_after())
+
+        if self.bulkhead.locked():
+            try:
+                await asyncio.wait_for(self.bulkhead.acquire(), BULKHEAD_WAIT_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.bulkhead_rejected += 1
+                # Não conta como falha do serviço, mas libera a vaga de teste do half-open
+                self.breaker.release_trial()
+                raise CircuitOpenError(f"Limite de chamadas simultâneas atingido para {self.name}",
+                                       BULKHEAD_WAIT_TIMEOUT)
+            except BaseException:
+                # Cancelada durante a espera
+                self.breaker.release_trial()
+                raise
+        else:
+            await self.bulkhead.acquire()
+
+        self.requests_total += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        adaptive = timeout is None and method in ADAPTIVE_TIMEOUT_METHODS
+        if timeout is None:
+            timeout = self.timeout.current if adaptive else REQUEST_TIMEOUT
+        started = time.perf_counter()
+        headers = dict(headers) if headers else {}
+        correlation_id = get_correlation_id()
+        if correlation_id:
+            headers[CORRELATION_HEADER] = correlation_id
+        try:
+            with span(f"{self.name} {method} {path.split('?', 1)[0]}", kind="client") as call_span:
+                if call_span is not None:
+                    headers[TRACEPARENT_HEADER] = call_span.traceparent()
+                response = await self.client.request(method, path, json=json_data, headers=headers,
+                                                     timeout=timeout)
+                if call_span is not None:
+                    call_span.attributes["http.status_code"] = response.status_code
+        except httpx.TimeoutException:
+            self.errors_total += 1
+            self.breaker.record_failure()
+            # Amostra censurada: o serviço levou pelo menos o timeout
+            if adaptive:
+                self.timeout.observe(timeout)
+            raise
+        except Exception:
+            self.errors_total += 1
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # Cancelada (ex.: cliente desconectou): sem resultado, mas a vaga de teste não pode ficar presa
+            self.breaker.release_trial()
+            raise
+        finally:
+            self.in_flight -= 1
+            self.bulkhead.release()
+
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        if adaptive:
+            self.timeout.observe(time.perf_counter() - started)
+        return response
+
+    async def probe(self):
+        """Verificação ativa: GET /health direto (fora do circuit breaker e do bulkhead)"""
+        try:
+            response = await self.client.get("/health", timeout=HEALTH_CHECK_TIMEOUT)
+            healthy = response.status_code == 200
+        except Exception:
+            healthy = False
+        if healthy != self.healthy:
+            logger.warning("Instância %s de %s agora está %s", self.url, self.name,
+                           "saudável" if healthy else "fora do balanceamento")
+        self.healthy = healthy
+
+    def stats(self) -> dict:
+        """Estatísticas do pool para acompanhar saturação"""
+        # O pool do httpcore só existe no transporte HTTP padrão
+        pool = getattr(self.transport, "_pool", None)
+        connections = list(getattr(pool, "connections", []))
+        idle = sum(1 for conn in connections if conn.is_idle())
+        return {
+            "url": self.url,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive": self.limits.max_keepalive_connections,
+            "open_connections": len(connections),
+            "idle_connections": idle,
+            "active_connections": len(connections) - idle,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "requests_total": self.requests_total,
+            "errors_total": self.errors_total,
+            "saturation": round(self.in_flight / self.limits.max_connections, 3) if self.limits.max_connections else 0.0,
+            "max_concurrent": self.max_concurrent,
+            "bulkhead_rejected": self.bulkhead_rejected,
+            "circuit": self.breaker.stats(),
+            "adaptive_timeout": self.timeout.stats(),
+            "healthy": self.healthy
+        }
+
+    async def close(self):
+        await self.client.aclose()
+
+# Balanceamento entre instâncias de um microserviço
+def ring_hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+class UpstreamGroup:
+    """
+    Instâncias de um microserviço, cada uma com seu pool, circuit breaker e bulkhead.
+
+    Uma instância sai do balanceamento quando o circuito dela está aberto (falhas
+    passivas) ou quando a última verificação ativa de /health falhou. Chamadas com
+    chave de afinidade (ex.: user_id nos pedidos) seguem o anel de hash consistente,
+    indo para a próxima instância disponível do anel se a preferida estiver fora;
+    as demais usam LOAD_BALANCER.
+    """
+
+    def __init__(self, name: str, instances: List[UpstreamPool], strategy: str = LOAD_BALANCER):
+        if strategy not in ("p2c", "least_outstanding"):
+            raise ValueError(f"Balanceamento desconhecido: {strategy}")
+        self.name = name
+        self.instances = instances
+        self.strategy = strategy
+        self.ring = sorted(
+            (ring_hash(f"{instance.url}#{replica}"), index)
+            for index, instance in enumerate(instances) for replica in range(HASH_RING_REPLICAS)
+        )
+        self.ring_keys = [point for point, _ in self.ring]
+        self.retried = 0
+        self.rejected = 0
+
+    def available(self, exclude: set) -> List[UpstreamPool]:
+        ready = [instance for instance in self.instances if instance not in exclude and instance.breaker.ready()]
+        healthy = [instance for instance in ready if instance.healthy]
+        # Se a verificação ativa marcou todas como fora, ainda vale tentar as que o circuito aceita
+        return healthy or ready
+
+    def choose(self, affinity: Optional[int] = None, exclude: set = frozenset()) -> UpstreamPool:
+        candidates = self.available(exclude)
+        if not candidates:
+            self.rejected += 1
+            retry_after = min(instance.breaker.retry_after() for instance in self.instances)
+            raise CircuitOpenError(f"Nenhuma instância disponível para {self.name}", retry_after)
+        if len(candidates) == 1:
+            return candidates[0]
+        if affinity is not None:
+            start = bisect_left(self.ring_keys, ring_hash(str(affinity)))
+            for offset in range(len(self.ring)):
+                instance = self.instances[self.ring[(start + offset) % len(self.ring)][1]]
+                if instance in candidates:
+                    return instance
+        if self.strategy == "p2c":
+            first, second = random.sample(candidates, 2)
+            return first if first.in_flight <= second.in_flight else second
+        # Empates (ex.: todas ociosas) são desfeitos aleatoriamente, não sempre na primeira instância
+        least = min(instance.in_flight for instance in candidates)
+        return random.choice([instance for instance in candidates if instance.in_flight == least])
+
+    async def request(self, method: str, path: str, json_data: Optional[dict] = None,
+                      timeout: Optional[float] = None, headers: Optional[dict] = None,
+                      affinity: Optional[int] = None) -> httpx.Response:
+        """
+        Chamar uma instância escolhida pelo balanceamento. Erros de conexão (a
+        requisição não chegou a ser enviada) são repetidos em outra instância.
+        """
+        tried = set()
+        while True:
+            instance = self.choose(affinity, tried)
+            try:
+                return await instance.request(method, path, json_data, timeout, headers)
+            except httpx.ConnectError:
+                tried.add(instance)
+                if not self.available(tried):
+                    raise
+                self.retried += 1
+                logger.warning("Falha de conexão com %s (%s), tentando outra instância", instance.url, self.name)
+            finally:
+                UPSTREAM_CIRCUIT_STATE.set(CIRCUIT_STATE_VALUES[instance.breaker.state], (self.name, instance.url))
+
+    async def check_health(self):
+        await asyncio.gather(*(instance.probe() for instance in self.instances))
+
+    def stats(self) -> dict:
+        return {
+            "strategy": self.strategy,
+            "retried": self.retried,
+            "rejected": self.rejected,
+            "instances": [instance.stats() for instance in self.instances]
+        }
+
+    async def close(self):
+        for instance in self.instances:
+            await instance.close()
+
+UPSTREAM_POOLS: Dict[str, UpstreamGroup] = {}
+
+# Cache de usuários
+class UserCache:
+    """Cache LRU com TTL dos usuários consultados no Users Service"""
+
+    def __init__(self, max_size: int, ttl: float, negative_ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        # user_id -> (expira_em, dados do usuário ou None quando o usuário não existe)
+        self.entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, user_id: int) -> tuple:
+        """Retornar (encontrado, dados); dados é None para um 404 em cache"""
+        entry = self.entries.get(user_id)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self.entries[user_id]
+            self.misses += 1
+            return False, None
+
+        self.entries.move_to_end(user_id)
+        if entry[1] is None:
+            self.negative_hits += 1
+        else:
+            self.hits += 1
+        return True, entry[1]
+
+    def store(self, user_id: int, user_data: Optional[dict]):
+        """Guardar um usuário (ou a ausência dele, com TTL menor)"""
+        ttl = self.ttl if user_data is not None else self.negative_ttl
+        self.entries[user_id] = (time.monotonic() + ttl, user_data)
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, user_id: int):
+        self.entries.pop(user_id, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "negative_ttl": self.negative_ttl,
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round((self.hits + self.negative_hits) / lookups, 3) if lookups else 0.0
+        }
+
+USER_CACHE = UserCache(USER_CACHE_MAX_SIZE, USER_CACHE_TTL, USER_CACHE_NEGATIVE_TTL)
+PURCHASE_IDEMPOTENCY = IdempotencyStore(IDEMPOTENCY_MAX_KEYS, IDEMPOTENCY_TTL)
+
+def colocated_module(service: str):
+    """Módulo do microserviço carregado no processo do gateway (modo inprocess)"""
+    return importlib.import_module(COLOCATED_SERVICES[service][0])
+
+def get_pool(service: str) -> UpstreamGroup:
+    """Obter (ou criar sob demanda) os pools de conexões das instâncias de um microserviço"""
+    group = UPSTREAM_POOLS.get(service)
+    if group is None and UPSTREAM_MODE == "inprocess":
+        config = UPSTREAMS[service]
+        # Mesma interface (breaker, bulkhead, métricas, tracing); só o transporte muda
+        group = UpstreamGroup(service, [
+            UpstreamPool(service, f"http://{service}", config["max_connections"], config["max_keepalive"],
+                         transport=httpx.ASGITransport(app=colocated_module(service).app),
+                         max_concurrent=config["max_concurrent"])
+        ])
+        UPSTREAM_POOLS[service] = group
+    elif group is None:
+        config = UPSTREAMS[service]
+        group = UpstreamGroup(service, [
+            UpstreamPool(service, url.strip(), config["max_connections"], config["max_keepalive"],
+                         max_concurrent=config["max_concurrent"])
+            for url in config["urls"]
+        ])
+        UPSTREAM_POOLS[service] = group
+    return group
+
+async def close_pools():
+    """Fechar todos os pools de conexões"""
+    for group in UPSTREAM_POOLS.values():
+        await group.close()
+    UPSTREAM_POOLS.clear()
+
+async def check_instances_health():
+    """Verificar periodicamente as instâncias dos serviços com mais de uma"""
+    while True:
+        groups = [group for group in UPSTREAM_POOLS.values() if len(group.instances) > 1]
+        await asyncio.gather(*(group.check_health() for group in groups))
+        await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Criar os pools na inicialização e fechá-los no encerramento"""
+    async with AsyncExitStack() as colocated:
+        # Modo inprocess: os apps montados não recebem o lifespan do gateway, então
+        # carregamento e gravação do estado de cada serviço são disparados aqui
+        if UPSTREAM_MODE == "inprocess":
+            for service in COLOCATED_SERVICES:
+                service_app = colocated_module(service).app
+                await colocated.enter_async_context(service_app.router.lifespan_context(service_app))
+            logger.info("Modo co-localizado: %s no processo do gateway", ', '.join(COLOCATED_SERVICES))
+
+        for service in UPSTREAMS:
+            get_pool(service)
+        logger.info("Pools de conexão criados: %s", ', '.join(
+            f"{service} ({len(group.instances)} instância(s))" for service, group in UPSTREAM_POOLS.items()
+        ))
+        health_task = asyncio.create_task(check_instances_health()) if HEALTH_CHECK_INTERVAL > 0 else None
+        await PURCHASE_JOBS.start()
+        if REQUEST_CAPTURE is not None:
+            REQUEST_CAPTURE.start()
+            logger.info("Capturando requisições em %s", CAPTURE_FILE)
+        yield
+        if health_task is not None:
+            health_task.cancel()
+        await PURCHASE_JOBS.stop(PURCHASE_DRAIN_TIMEOUT)
+        await close_pools()
+        logger.info("Pools de conexão encerrados")
+        if REQUEST_CAPTURE is not None:
+            REQUEST_CAPTURE.stop()
+
 # Criar app FastAPI sem Swagger
 app = FastAPI(
     title="API Gateway",
     version="1.0.0",
     docs_url=None,  # Desabilitar Swagger UI
-    redoc_url=None  # Desabilitar ReDoc
+    redoc_url=None,  # Desabilitar ReDoc
+    lifespan=lifespan
 )
 
 # Configurar CORS para permitir requisições do frontend
@@ -38,95 +647,215 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# URLs dos microserviços
-USERS_SERVICE_URL = "http://localhost:8001"
-ORDERS_SERVICE_URL = "http://localhost:8002"
-BILLING_SERVICE_URL = "http://localhost:8003"
+if REQUEST_CAPTURE is not None:
+    app.add_middleware(CaptureMiddleware, capture=REQUEST_CAPTURE)
 
-# Timeout para requisições (em segundos)
-REQUEST_TIMEOUT = 5.0
+# Métricas (GET /metrics), incluindo a latência das chamadas a cada microserviço
+METRICS = setup_metrics(app, "gateway")
+UPSTREAM_LATENCY = METRICS.histogram(
+    "upstream_request_duration_seconds",
+    "Latência das chamadas aos microserviços por resultado (2xx, 4xx, 5xx, timeout, rejected, error)",
+    ("service", "outcome")
+)
+UPSTREAM_CIRCUIT_STATE = METRICS.gauge(
+    "upstream_circuit_state", "Estado do circuit breaker por instância (0 = closed, 1 = half_open, 2 = open)",
+    ("service", "instance")
+)
+CIRCUIT_STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
 
-# Modelos Pydantic
-class UserCreateRequest(BaseModel):
-    name: str
-    email: EmailStr
+# Correlation id por requisição (X-Request-ID), repassado aos microserviços em call_service
+app.add_middleware(CorrelationIdMiddleware)
 
-class LoginRequest(BaseModel):
-    email: EmailStr
+# Rastreamento: o trace começa aqui e segue para os microserviços pelo cabeçalho traceparent
+setup_tracing(app, "gateway")
 
-class PurchaseRequest(BaseModel):
-    user_id: int
-    amount: float
-    product_name: str = "Produto Genérico"
-    payment_method: str = "credit_card"
+# Compressão (br/gzip) das respostas JSON grandes; os estáticos já vêm pré-comprimidos
+if RESPONSE_COMPRESSION:
+    app.add_middleware(CompressionMiddleware)
+
+# Frontend: build com nomes por conteúdo e versões .gz/.br (refeito se os fontes mudaram)
+ensure_built()
+FRONTEND_ASSETS = StaticAssets()
 
 # Funções auxiliares
-async def call_service(method: str, url: str, json_data: Optional[dict] = None):
-    """Realizar chamada HTTP para um microserviço"""
+async def call_service(service: str, method: str, path: str, json_data: Optional[dict] = None,
+                       timeout: Optional[float] = None, headers: Optional[dict] = None,
+                       affinity: Optional[int] = None, raw: bool = False):
+    """
+    Realizar chamada HTTP para um microserviço usando o pool de conexões de uma
+    das instâncias dele (com `affinity`, sempre a mesma instância para a mesma chave).
+    Com `raw`, retorna o corpo em bytes, sem decodificar o JSON.
+    """
+    group = get_pool(service)
+    url = f"{service}{path}"
+    outcome = "error"
+    started = time.perf_counter()
     try:
-        async with httpx.AsyncClient(timeout=REQUEST_TIMEOUT) as client:
-            if method == "GET":
-                response = await client.get(url)
-            elif method == "POST":
-                response = await client.post(url, json=json_data)
-            elif method == "PUT":
-                response = await client.put(url, json=json_data)
-            else:
-                raise ValueError(f"Método HTTP não suportado: {method}")
-
-            response.raise_for_status()
-            return response.json()
+        if method not in ("GET", "POST", "PUT"):
+            raise ValueError(f"Método HTTP não suportado: {method}")
+
+        response = await group.request(method, path, json_data, timeout, headers, affinity)
+        outcome = f"{response.status_code // 100}xx"
+        response.raise_for_status()
+        return response.content if raw else loads(response.content)
 
+    except CircuitOpenError as e:
+        outcome = "rejected"
+        logger.warning("Chamada a %s rejeitada: %s", url, e)
+        raise HTTPException(status_code=503, detail=f"Serviço temporariamente indisponível: {str(e)}",
+                            headers={"Retry-After": str(max(1, round(e.retry_after)))})
     except httpx.TimeoutException:
-        logger.error(f"Timeout ao chamar {url}")
+        outcome = "timeout"
+        logger.error("Timeout ao chamar %s", url)
         raise HTTPException(status_code=504, detail="Serviço não respondeu a tempo")
     except httpx.HTTPStatusError as e:
-        logger.error(f"Erro HTTP ao chamar {url}: {e.response.status_code}")
-        raise HTTPException(status_code=e.response.status_code, detail=e.response.json().get("detail", "Erro no serviço"))
+        logger.error("Erro HTTP ao chamar %s: %s", url, e.response.status_code)
+        raise HTTPException(status_code=e.response.status_code, detail=loads(e.response.content).get("detail", "Erro no serviço"))
     except Exception as e:
-        logger.error(f"Erro ao chamar {url}: {str(e)}")
+        logger.error("Erro ao chamar %s: %s", url, e)
         raise HTTPException(status_code=503, detail=f"Serviço indisponível: {str(e)}")
+    finally:
+        UPSTREAM_LATENCY.observe(time.perf_counter() - started, (service, outcome))
+
+async def call_services_concurrently(*calls: tuple) -> list:
+    """
+    Executar chamadas independentes em paralelo (latência = max() em vez de sum()).
+    Cada item é uma tupla com os argumentos de call_service. Retorna os resultados
+    na mesma ordem; falhas individuais são devolvidas como exceções.
+    """
+    return await asyncio.gather(*(call_service(*call) for call in calls), return_exceptions=True)
+
+async def get_user(user_id: int) -> dict:
+    """Buscar usuário passando pelo cache (inclusive para usuários inexistentes)"""
+    found, user_data = USER_CACHE.lookup(user_id)
+    if found:
+        if user_data is None:
+            raise HTTPException(status_code=404, detail="Usuário não encontrado")
+        return user_data
+
+    try:
+        user_data = await call_service("users", "GET", f"/users/{user_id}")
+    except HTTPException as e:
+        if e.status_code == 404:
+            USER_CACHE.store(user_id, None)
+        raise
+
+    USER_CACHE.store(user_id, user_data)
+    return user_data
+
+async def get_users(user_ids: List[int]) -> Dict[int, dict]:
+    """Buscar vários usuários: os que não estão em cache vão em uma única chamada em lote"""
+    users_by_id = {}
+    missing = []
+    for user_id in user_ids:
+        found, user_data = USER_CACHE.lookup(user_id)
+        if not found:
+            missing.append(user_id)
+        elif user_data is not None:
+            users_by_id[user_id] = user_data
+
+    if missing:
+        users_data = await call_service("users", "POST", "/users/batch", {"user_ids": missing},
+                                        BATCH_REQUEST_TIMEOUT)
+        for user_data in users_data["users"]:
+            USER_CACHE.store(user_data["user_id"], user_data)
+            users_by_id[user_data["user_id"]] = user_data
+        for user_id in users_data["missing"]:
+            USER_CACHE.store(user_id, None)
+
+    return users_by_id
+
+# Cache do health check agregado
+HEALTH_CACHE: dict = {"result": None, "expires_at": 0.0}
+HEALTH_LOCK = asyncio.Lock()
+
+async def probe_services() -> dict:
+    """Verificar todos os serviços em paralelo, com timeout por serviço"""
+    services = list(UPSTREAMS)
+    results = await call_services_concurrently(
+        *((service, "GET", "/health", None, HEALTH_CHECK_TIMEOUT) for service in services)
+    )
+
+    services_status = {}
+    for service_name, result in zip(services, results):
+        if isinstance(result, Exception):
+            services_status[service_name] = "unhealthy"
+        else:
+            services_status[service_name] = result.get("status", "unknown")
+    return services_status
 
 # Endpoints do Gateway
 @app.get("/health")
 async def health_check():
-    """Health check do gateway e todos os serviços"""
-    services_status = {}
+    """Health check do gateway e todos os serviços (resultado em cache por HEALTH_CACHE_TTL)"""
+    if HEALTH_CACHE["result"] is not None and time.monotonic() < HEALTH_CACHE["expires_at"]:
+        return HEALTH_CACHE["result"]
 
-    # Verificar cada serviço
-    services = {
-        "users": f"{USERS_SERVICE_URL}/health",
-        "orders": f"{ORDERS_SERVICE_URL}/health",
-        "billing": f"{BILLING_SERVICE_URL}/health"
-    }
+    # Apenas uma verificação por vez; requisições concorrentes reaproveitam o resultado
+    async with HEALTH_LOCK:
+        if HEALTH_CACHE["result"] is not None and time.monotonic() < HEALTH_CACHE["expires_at"]:
+            return HEALTH_CACHE["result"]
 
-    for service_name, health_url in services.items():
-        try:
-            result = await call_service("GET", health_url)
-            services_status[service_name] = result.get("status", "unknown")
-        except Exception:
-            services_status[service_name] = "unhealthy"
+        services_status = await probe_services()
+        all_healthy = all(status == "healthy" for status in services_status.values())
+
+        result = {
+            "status": "healthy" if all_healthy else "degraded",
+            "service": "gateway",
+            "services": services_status,
+            "circuit_breakers": {
+                service: {instance.url: instance.breaker.stats() for instance in get_pool(service).instances}
+                for service in UPSTREAMS
+            }
+        }
+        if REQUEST_CAPTURE is not None:
+            result["capture"] = REQUEST_CAPTURE.stats()
+        HEALTH_CACHE["result"] = result
+        HEALTH_CACHE["expires_at"] = time.monotonic() + HEALTH_CACHE_TTL
+        return result
 
-    all_healthy = all(status == "healthy" for status in services_status.values())
+@app.get("/gateway/pools")
+async def pool_stats():
+    """Estatísticas dos pools de conexões com os microserviços"""
+    return {service: get_pool(service).stats() for service in UPSTREAMS}
 
-    return {
-        "status": "healthy" if all_healthy else "degraded",
-        "service": "gateway",
-        "services": services_status
-    }
+@app.get("/gateway/cache")
+async def cache_stats():
+    """Estatísticas do cache de usuários e das chaves de idempotência"""
+    return {"users": USER_CACHE.stats(), "idempotency": PURCHASE_IDEMPOTENCY.stats()}
+
+@app.get("/gateway/traces/{trace_id}")
+async def get_trace_waterfall(trace_id: str):
+    """Trace completo de uma requisição (spans do gateway e dos serviços) em ordem de cascata"""
+    services = list(UPSTREAMS)
+    results = await call_services_concurrently(
+        *((service, "GET", f"/traces/{trace_id}", None, HEALTH_CHECK_TIMEOUT) for service in services)
+    )
+    spans = COLLECTOR.get(trace_id)
+    for result in results:
+        if not isinstance(result, Exception):
+            spans.extend(result["spans"])
+    if not spans:
+        raise HTTPException(status_code=404, detail="Trace não encontrado")
+    return {"trace_id": trace_id, **build_waterfall(spans)}
 
 @app.post("/gateway/register")
 async def register_user(user: UserCreateRequest):
     """Criar novo usuário via gateway"""
-    logger.info(f"[GATEWAY] Registrando usuário: {user.email}")
+    logger.info("[GATEWAY] Registrando usuário: %s", user.email)
 
     user_data = await call_service(
+        "users",
         "POST",
-        f"{USERS_SERVICE_URL}/users/create",
+        "/users/create",
         {"name": user.name, "email": user.email}
     )
 
-    logger.info(f"[GATEWAY] Usuário registrado: user_id={user_data['user_id']}")
+    # O ID pode estar em cache negativo (consultado antes de existir)
+    USER_CACHE.invalidate(user_data["user_id"])
+    USER_CACHE.store(user_data["user_id"], user_data)
+
+    logger.info("[GATEWAY] Usuário registrado: user_id=%s", user_data['user_id'])
     return {
         "message": "Usuário criado com sucesso",
         "user": user_data
@@ -135,70 +864,133 @@ async def register_user(user: UserCreateRequest):
 @app.post("/gateway/login")
 async def login_user(credentials: LoginRequest):
     """Autenticar usuário via gateway"""
-    logger.info(f"[GATEWAY] Autenticando usuário: {credentials.email}")
+    logger.info("[GATEWAY] Autenticando usuário: %s", credentials.email)
 
     user_data = await call_service(
+        "users",
         "POST",
-        f"{USERS_SERVICE_URL}/users/login",
+        "/users/login",
         {"email": credentials.email}
     )
 
-    logger.info(f"[GATEWAY] Login bem-sucedido: user_id={user_data['user_id']}")
+    logger.info("[GATEWAY] Login bem-sucedido: user_id=%s", user_data['user_id'])
     return {
         "message": "Login realizado com sucesso",
         "user": user_data
     }
 
 @app.post("/gateway/purchase")
-async def process_purchase(purchase: PurchaseRequest):
+async def process_purchase(purchase: PurchaseRequest, response: Response,
+                           idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
+                           prefer: Optional[str] = Header(None)):
     """
     Processar compra completa - orquestra chamadas para Users, Orders e Billing
     Fluxo: Gateway -> Users (validar) -> Orders (criar) -> Billing (cobrar)
+
+    Com Idempotency-Key, repetições da mesma compra (simultâneas ou não) recebem
+    o resultado da primeira execução em vez de criar outro pedido e outra cobrança.
+    Com "Prefer: respond-async", a compra vai para a fila e a resposta é 202 com
+    o job_id, consultável em GET /gateway/purchase/{job_id}.
     """
-    logger.info(f"[GATEWAY] Iniciando processamento de compra para user_id={purchase.user_id}")
+    if prefer is not None and "respond-async" in prefer.lower():
+        job_data = await run_idempotent(
+            PURCHASE_IDEMPOTENCY, idempotency_key, {"async": True, **purchase.model_dump()},
+            lambda: submit_purchase(purchase, idempotency_key), response
+        )
+        response.status_code = 202
+        response.headers["Location"] = job_data["status_url"]
+        return job_data
+
+    return await run_idempotent(
+        PURCHASE_IDEMPOTENCY, idempotency_key, purchase.model_dump(),
+        lambda: execute_purchase(purchase, idempotency_key), response
+    )
+
+async def submit_purchase(purchase: PurchaseRequest, idempotency_key: Optional[str]) -> dict:
+    """Enfileirar a compra (503 com a fila cheia, para o cliente tentar depois)"""
+    try:
+        job = PURCHASE_JOBS.submit((purchase, idempotency_key))
+    except QueueFullError as e:
+        logger.warning("[GATEWAY] Compra recusada: %s", e)
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    logger.info("[GATEWAY] Compra enfileirada: job_id=%s, user_id=%s", job.job_id, purchase.user_id)
+    return {
+        "message": "Compra recebida para processamento",
+        "job_id": job.job_id,
+        "status": job.status,
+        "status_url": f"/gateway/purchase/{job.job_id}"
+    }
+
+async def run_purchase_job(payload: tuple) -> dict:
+    purchase, idempotency_key = payload
+    return await execute_purchase(purchase, idempotency_key)
+
+PURCHASE_JOBS = JobQueue("purchases", run_purchase_job, PURCHASE_WORKERS, PURCHASE_QUEUE_DEPTH, PURCHASE_JOBS_MAX)
+
+@app.get("/gateway/purchase/{job_id}")
+async def get_purchase_job(job_id: str):
+    """Status de uma compra assíncrona (queued, running, succeeded ou failed)"""
+    job = PURCHASE_JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job.to_dict()
+
+@app.get("/gateway/jobs")
+async def job_stats():
+    """Estatísticas da fila de compras assíncronas"""
+    return {"purchases": PURCHASE_JOBS.stats()}
+
+async def execute_purchase(purchase: PurchaseRequest, idempotency_key: Optional[str] = None) -> dict:
+    """Fluxo da compra: validar usuário, criar pedido, cobrar e atualizar o status do pedido"""
+    logger.info("[GATEWAY] Iniciando processamento de compra para user_id=%s", purchase.user_id)
 
     try:
         # 1. Validar usuário
-        logger.info(f"[GATEWAY] Passo 1/3: Validando usuário {purchase.user_id}")
-        user_data = await call_service(
-            "GET",
-            f"{USERS_SERVICE_URL}/users/{purchase.user_id}"
-        )
-        logger.info(f"[GATEWAY] Usuário validado: {user_data['email']}")
+        logger.info("[GATEWAY] Passo 1/3: Validando usuário %s", purchase.user_id)
+        user_data = await get_user(purchase.user_id)
+        logger.info("[GATEWAY] Usuário validado: %s", user_data['email'])
 
         # 2. Criar pedido
-        logger.info(f"[GATEWAY] Passo 2/3: Criando pedido")
+        logger.info("[GATEWAY] Passo 2/3: Criando pedido")
         order_data = await call_service(
+            "orders",
             "POST",
-            f"{ORDERS_SERVICE_URL}/orders/create",
+            "/orders/create",
             {
                 "user_id": purchase.user_id,
                 "amount": purchase.amount,
                 "product_name": purchase.product_name
-            }
+            },
+            affinity=purchase.user_id
         )
-        logger.info(f"[GATEWAY] Pedido criado: order_id={order_data['order_id']}")
+        logger.info("[GATEWAY] Pedido criado: order_id=%s", order_data['order_id'])
 
         # 3. Processar pagamento
-        logger.info(f"[GATEWAY] Passo 3/3: Processando pagamento")
+        logger.info("[GATEWAY] Passo 3/3: Processando pagamento")
+        # A chave repassada ao Billing impede uma segunda cobrança do mesmo pedido
         billing_data = await call_service(
+            "billing",
             "POST",
-            f"{BILLING_SERVICE_URL}/billing/charge",
+            "/billing/charge",
             {
                 "order_id": order_data["order_id"],
                 "amount": purchase.amount,
                 "payment_method": purchase.payment_method
-            }
+            },
+            headers={IDEMPOTENCY_HEADER: derive_key(idempotency_key, f"order-{order_data['order_id']}")}
+            if idempotency_key else None
         )
-        logger.info(f"[GATEWAY] Pagamento processado: status={billing_data['status']}")
+        logger.info("[GATEWAY] Pagamento processado: status=%s", billing_data['status'])
 
         # 4. Atualizar status do pedido baseado no pagamento
         order_status = "completed" if billing_data["status"] == "paid" else "payment_failed"
         await call_service(
+            "orders",
             "PUT",
-            f"{ORDERS_SERVICE_URL}/orders/{order_data['order_id']}/status?status={order_status}"
+            f"/orders/{order_data['order_id']}/status?status={order_status}",
+            affinity=purchase.user_id
         )
-        logger.info(f"[GATEWAY] Status do pedido atualizado: {order_status}")
+        logger.info("[GATEWAY] Status do pedido atualizado: %s", order_status)
 
         # Resultado final
         result = {
@@ -209,42 +1001,193 @@ async def process_purchase(purchase: PurchaseRequest):
             "transaction": billing_data
         }
 
-        logger.info(f"[GATEWAY] Compra finalizada: order_id={order_data['order_id']}, status={billing_data['status']}")
+        logger.info("[GATEWAY] Compra finalizada: order_id=%s, status=%s", order_data['order_id'], billing_data['status'])
         return result
 
     except HTTPException as e:
-        logger.error(f"[GATEWAY] Erro no processamento da compra: {e.detail}")
+        logger.error("[GATEWAY] Erro no processamento da compra: %s", e.detail)
         raise
     except Exception as e:
-        logger.error(f"[GATEWAY] Erro inesperado: {str(e)}")
+        logger.error("[GATEWAY] Erro inesperado: %s", e)
         raise HTTPException(status_code=500, detail=f"Erro ao processar compra: {str(e)}")
 
-@app.get("/gateway/user/{user_id}/orders")
-async def get_user_orders(user_id: int):
-    """Buscar todos os pedidos de um usuário"""
-    logger.info(f"[GATEWAY] Buscando pedidos do usuário {user_id}")
+@app.post("/gateway/purchase/batch")
+async def process_purchase_batch(batch: PurchaseBatchRequest):
+    """
+    Processar várias compras com quatro chamadas em lote (em vez de 4 por compra)
+    Fluxo: Users (/users/batch) -> Orders (/orders/create/batch)
+           -> Billing (/billing/charge/batch) -> Orders (/orders/status/batch)
+    Compras com usuário inexistente ou amount inválido são rejeitadas individualmente.
+    """
+    purchases = batch.purchases
+    logger.info("[GATEWAY] Iniciando lote de %s compras", len(purchases))
+
+    if len(purchases) > MAX_PURCHASE_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Máximo de {MAX_PURCHASE_BATCH_SIZE} compras por lote")
+
+    results: List[Optional[dict]] = [None] * len(purchases)
+
+    # 1. Validar usuários (IDs únicos, passando pelo cache)
+    users_by_id = await get_users(list(dict.fromkeys(purchase.user_id for purchase in purchases)))
 
-    # Validar usuário
-    user_data = await call_service("GET", f"{USERS_SERVICE_URL}/users/{user_id}")
+    accepted = []
+    for index, purchase in enumerate(purchases):
+        if purchase.user_id not in users_by_id:
+            results[index] = {"index": index, "purchase_status": "rejected", "detail": "Usuário não encontrado"}
+        elif purchase.amount <= 0:
+            results[index] = {"index": index, "purchase_status": "rejected", "detail": "Amount deve ser maior que zero"}
+        else:
+            accepted.append(index)
+    logger.info("[GATEWAY] Lote: %s compras aceitas, %s rejeitadas", len(accepted), len(purchases) - len(accepted))
 
-    # Buscar pedidos
-    orders_data = await call_service("GET", f"{ORDERS_SERVICE_URL}/orders/user/{user_id}")
+    if accepted:
+        # 2. Criar pedidos
+        orders_data = await call_service("orders", "POST", "/orders/create/batch", {
+            "orders": [
+                {
+                    "user_id": purchases[index].user_id,
+                    "amount": purchases[index].amount,
+                    "product_name": purchases[index].product_name
+                }
+                for index in accepted
+            ]
+        }, BATCH_REQUEST_TIMEOUT)
+        orders = orders_data["orders"]
+
+        # 3. Processar pagamentos
+        billing_data = await call_service("billing", "POST", "/billing/charge/batch", {
+            "charges": [
+                {
+                    "order_id": order["order_id"],
+                    "amount": purchases[index].amount,
+                    "payment_method": purchases[index].payment_method
+                }
+                for index, order in zip(accepted, orders)
+            ]
+        }, BATCH_REQUEST_TIMEOUT)
+        transactions = billing_data["transactions"]
+
+        # 4. Atualizar status dos pedidos
+        updates = [
+            {
+                "order_id": order["order_id"],
+                "status": "completed" if transaction["status"] == "paid" else "payment_failed"
+            }
+            for order, transaction in zip(orders, transactions)
+        ]
+        status_data = await call_service("orders", "PUT", "/orders/status/batch", {"updates": updates},
+                                         BATCH_REQUEST_TIMEOUT)
+        updated_orders = {order["order_id"]: order for order in status_data["orders"]}
+
+        for index, order, transaction in zip(accepted, orders, transactions):
+            results[index] = {
+                "index": index,
+                "purchase_status": transaction["status"],
+                "user": users_by_id[purchases[index].user_id],
+                "order": updated_orders.get(order["order_id"], order),
+                "transaction": transaction
+            }
+
+    paid = sum(1 for result in results if result["purchase_status"] == "paid")
+    failed = sum(1 for result in results if result["purchase_status"] == "failed")
+    logger.info("[GATEWAY] Lote finalizado: %s pagas, %s recusadas", paid, failed)
 
     return {
-        "user": user_data,
-        "orders": orders_data["orders"],
-        "total_orders": orders_data["total"]
+        "results": results,
+        "total": len(results),
+        "paid": paid,
+        "failed": failed,
+        "rejected": len(results) - paid - failed
     }
 
+# Início da lista de pedidos no corpo JSON compacto de GET /orders/user/{user_id}
+ORDERS_FIELD = b',"orders":'
+
+def split_orders_page(body: bytes) -> tuple:
+    """
+    Separar uma página do Orders ({"total":...,"next_cursor":...,"orders":[...]})
+    em metadados decodificados e a lista de pedidos ainda em bytes. Os campos antes
+    de "orders" são escalares, então a primeira ocorrência é a do campo; em
+    qualquer outro formato o corpo é decodificado inteiro.
+    """
+    position = body.find(ORDERS_FIELD)
+    if position < 0 or not body.endswith(b"]}"):
+        page = loads(body)
+        return page, dumps(page["orders"])
+    return loads(body[:position] + b"}"), body[position + len(ORDERS_FIELD):-1]
+
+@app.get("/gateway/user/{user_id}/orders")
+async def get_user_orders(user_id: int, limit: Optional[int] = None, cursor: Optional[int] = None,
+                          status: Optional[str] = None, start: Optional[str] = Query(None, alias="from"),
+                          end: Optional[str] = Query(None, alias="to")):
+    """Buscar os pedidos de um usuário (paginação e filtros de status e from/to repassados ao Orders)"""
+    logger.info("[GATEWAY] Buscando pedidos do usuário %s", user_id)
+
+    params = {"limit": limit, "cursor": cursor, "status": status, "from": start, "to": end}
+    query = urlencode({key: value for key, value in params.items() if value is not None})
+
+    # Validar usuário e buscar pedidos em paralelo (as chamadas são independentes)
+    user_data, orders_body = await asyncio.gather(
+        get_user(user_id),
+        call_service("orders", "GET", f"/orders/user/{user_id}" + (f"?{query}" if query else ""),
+                     affinity=user_id, raw=True),
+        return_exceptions=True
+    )
+
+    # O usuário precisa existir; o erro dele tem precedência sobre o dos pedidos
+    if isinstance(user_data, Exception):
+        raise user_data
+    if isinstance(orders_body, Exception):
+        raise orders_body
+
+    if not FAST_JSON:
+        orders_data = loads(orders_body)
+        return {
+            "user": user_data,
+            "orders": orders_data["orders"],
+            "total_orders": orders_data["total"],
+            "next_cursor": orders_data.get("next_cursor")
+        }
+
+    # A lista de pedidos é repassada como veio do Orders, sem decodificar e recodificar
+    page, orders_json = split_orders_page(orders_body)
+    return Response(b"".join((
+        b'{"user":', dumps(user_data),
+        b',"orders":', orders_json,
+        b',"total_orders":', dumps(page["total"]),
+        b',"next_cursor":', dumps(page.get("next_cursor")),
+        b"}"
+    )), media_type=JSON_MEDIA_TYPE)
+
+@app.get("/gateway/analytics")
+async def get_analytics():
+    """Resumo de vendas para dashboards: agregados do Orders e do Billing em paralelo"""
+    orders, billing = await asyncio.gather(
+        call_service("orders", "GET", "/orders/analytics"),
+        call_service("billing", "GET", "/billing/analytics")
+    )
+    return {"orders": orders, "billing": billing}
+
 @app.get("/")
-async def root():
+async def root(request: Request):
     """Servir a interface web"""
-    return FileResponse("frontend/index.html")
+    return FRONTEND_ASSETS.response("index.html", request.headers)
+
+@app.get("/static/{name}")
+async def static_file(name: str, request: Request):
+    """Arquivos do frontend (nomes com hash: cache immutable; originais: revalidados por ETag)"""
+    return FRONTEND_ASSETS.response(name, request.headers)
 
-# Montar arquivos estáticos
-app.mount("/static", StaticFiles(directory="frontend"), name="static")
+# Modo co-localizado: APIs dos microserviços acessíveis em /services/<nome>
+if UPSTREAM_MODE == "inprocess":
+    for service in COLOCATED_SERVICES:
+        app.mount(f"/services/{service}", colocated_module(service).app, name=service)
 
 if __name__ == "__main__":
     logger.info("Iniciando API Gateway na porta 8000")
     logger.info("Interface web disponível em: http://localhost:8000")
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Com WORKERS > 1 cada processo tem seu próprio cache, chaves de idempotência e fila de jobs
+    stores = []
+    if UPSTREAM_MODE == "inprocess":
+        stores = [getattr(colocated_module(service), store) for service, (_, store) in COLOCATED_SERVICES.items()]
+    serve(app, "gateway:app", 8000, stores=stores)
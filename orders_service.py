@@ -3,25 +3,62 @@ Orders Microservice
 Porta: 8002
 Responsabilidades: Gerenciamento de pedidos (criar, buscar, listar)
 """
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Path, Query
 from pydantic import BaseModel
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
-import uvicorn
+from array import array
+from bisect import bisect_right, insort
+from contextlib import asynccontextmanager
 import logging
 
-# Configuração de logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='[ORDERS-SERVICE] %(asctime)s - %(levelname)s - %(message)s'
-)
+from common.analytics import Aggregates
+from common.records import EMPTY_IDS, ColumnTable, TimeIndex, index_ids
+from common.logs import CorrelationIdMiddleware, setup_logging
+from common.metrics import setup_metrics
+from common.storage import StoreSyncMiddleware, open_store
+from common.serialization import json_response
+from common.server import serve
+from common.tracing import setup_tracing
+from common.pagination import (DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, iter_time_range, ndjson_records_response,
+                               ndjson_response, page_by_id, take_page, time_bounds, time_cursor)
+
+# Configuração de logging (fila + thread de escrita, JSON por padrão; ver common/logs.py)
+setup_logging("orders-service")
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Orders Service", version="1.0.0", docs_url=None, redoc_url=None)
+# Armazenamento em memória (colunar: um array por campo em vez de um dict por pedido)
+FIRST_ORDER_ID = 1000
+ORDERS_DB = ColumnTable("order_id", FIRST_ORDER_ID, {
+    "user_id": "int",
+    "amount": "float",
+    "product_name": "symbol",
+    "status": "symbol",
+    "created_at": "timestamp"
+})
+
+# Índices secundários: user_id -> [order_id] e (user_id, status) -> [order_id].
+# Os IDs são crescentes, então as listas permanecem ordenadas por order_id. As listas
+# são array("q") (8 bytes por ID, em vez de um ponteiro para um int de 28 bytes)
+ORDERS_BY_USER: Dict[int, "array[int]"] = {}
+ORDERS_BY_USER_STATUS: Dict[Tuple[int, str], "array[int]"] = {}
+
+# Índice de tempo: (created_at, order_id) em ordem, para os filtros from/to
+ORDERS_BY_CREATED = TimeIndex()
+
+# Agregados para dashboards (pedidos e valor por usuário, produto, status e hora),
+# atualizados a cada criação e mudança de status; receita = pedidos concluídos
+ORDER_ANALYTICS = Aggregates({
+    "user": lambda order: order["user_id"],
+    "product": lambda order: order["product_name"],
+    "status": lambda order: order["status"],
+}, revenue_statuses=["completed"], time_field="created_at")
 
-# Armazenamento em memória
-ORDERS_DB: Dict[int, dict] = {}
-NEXT_ORDER_ID = 1000
+# Quantidade máxima de itens por requisição em lote
+MAX_BATCH_SIZE = 1000
+
+# Persistência (backend definido por STORAGE_BACKEND)
+ORDERS_STORE = open_store("orders", first_id=FIRST_ORDER_ID)
 
 # Modelos Pydantic
 class OrderCreate(BaseModel):
@@ -29,6 +66,16 @@ class OrderCreate(BaseModel):
     amount: float
     product_name: str = "Produto Genérico"
 
+class OrderCreateBatch(BaseModel):
+    orders: List[OrderCreate]
+
+class OrderStatusUpdate(BaseModel):
+    order_id: int
+    status: str
+
+class OrderStatusBatch(BaseModel):
+    updates: List[OrderStatusUpdate]
+
 class OrderResponse(BaseModel):
     order_id: int
     user_id: int
@@ -37,88 +84,295 @@ class OrderResponse(BaseModel):
     status: str
     created_at: str
 
+# Funções auxiliares
+def insert_order(order: OrderCreate, order_id: int) -> dict:
+    """Criar o registro do pedido (já validado, com ID reservado no armazenamento) e indexá-lo"""
+    order_data = {
+        "order_id": order_id,
+        "user_id": order.user_id,
+        "amount": order.amount,
+        "product_name": order.product_name,
+        "status": "pending",
+        "created_at": datetime.now().isoformat()
+    }
+
+    ORDERS_DB[order_id] = order_data
+    index_order(order_data)
+    ORDER_ANALYTICS.add(order_data)
+    ORDERS_STORE.put(order_id, order_data)
+    return order_data
+
+def set_order_status(order_data: dict, status: str):
+    """Atualizar o status de um pedido mantendo os índices consistentes"""
+    old_status = order_data["status"]
+    order_data["status"] = status
+    ORDERS_DB[order_data["order_id"]] = order_data
+    if old_status != status:
+        reindex_order_status(order_data, old_status)
+        ORDER_ANALYTICS.replace(dict(order_data, status=old_status), order_data)
+    ORDERS_STORE.put(order_data["order_id"], order_data)
+
+def index_order(order_data: dict):
+    """Registrar um pedido novo nos índices secundários"""
+    index_ids(ORDERS_BY_USER, order_data["user_id"]).append(order_data["order_id"])
+    index_ids(ORDERS_BY_USER_STATUS, (order_data["user_id"], order_data["status"])).append(order_data["order_id"])
+    ORDERS_BY_CREATED.add(order_data["order_id"], order_data["created_at"])
+
+def reindex_order_status(order_data: dict, old_status: str):
+    """Mover um pedido entre os índices de status após uma atualização"""
+    order_id = order_data["order_id"]
+    old_key = (order_data["user_id"], old_status)
+    old_ids = ORDERS_BY_USER_STATUS.get(old_key, EMPTY_IDS)
+    position = bisect_right(old_ids, order_id) - 1
+    if position >= 0 and old_ids[position] == order_id:
+        del old_ids[position]
+    if not old_ids:
+        ORDERS_BY_USER_STATUS.pop(old_key, None)
+    insort(index_ids(ORDERS_BY_USER_STATUS, (order_data["user_id"], order_data["status"])), order_id)
+
+def index_synced_order(order_id: int, previous: Optional[dict], order_data: dict):
+    """Indexar pedidos criados ou alterados por outros processos (ver StoreSyncMiddleware)"""
+    if previous is None:
+        # Pode chegar depois de pedidos com ID maior: inserir mantendo a ordem
+        insort(index_ids(ORDERS_BY_USER, order_data["user_id"]), order_id)
+        insort(index_ids(ORDERS_BY_USER_STATUS, (order_data["user_id"], order_data["status"])), order_id)
+        ORDERS_BY_CREATED.add(order_id, order_data["created_at"])
+    elif previous["status"] != order_data["status"]:
+        reindex_order_status(order_data, previous["status"])
+    ORDER_ANALYTICS.replace(previous, order_data)
+
+def paginate_ids(ids: "array[int]", cursor: Optional[int], limit: int) -> Tuple[List[int], Optional[int]]:
+    """Retornar a página de IDs após o cursor e o cursor da próxima página"""
+    start = bisect_right(ids, cursor) if cursor is not None else 0
+    page = list(ids[start:start + limit])
+    next_cursor = page[-1] if page and start + limit < len(ids) else None
+    return page, next_cursor
+
+def user_orders_in_range(user_id: int, status: Optional[str], order_ids: "array[int]",
+                         start: Optional[int], end: Optional[int]) -> List[Tuple[int, int]]:
+    """
+    Chaves (created_at, order_id) dos pedidos de order_ids criados em [start, end), em
+    ordem. Percorre o menor dos dois conjuntos: a lista do usuário (filtrada pelo
+    timestamp) ou o trecho do índice de tempo (filtrado por usuário e status).
+    """
+    low, high = ORDERS_BY_CREATED.bounds(start, end)
+    if len(order_ids) <= high - low:
+        keys = []
+        for order_id in order_ids:
+            created = ORDERS_DB.get_raw(order_id, "created_at")
+            if (start is None or created >= start) and (end is None or created < end):
+                keys.append((created, order_id))
+        keys.sort()
+        return keys
+    return [
+        (ORDERS_BY_CREATED.epochs[position], ORDERS_BY_CREATED.ids[position])
+        for position in range(low, high)
+        if ORDERS_DB.get_raw(ORDERS_BY_CREATED.ids[position], "user_id") == user_id
+        and (status is None or ORDERS_DB.get_field(ORDERS_BY_CREATED.ids[position], "status") == status)
+    ]
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Carregar o estado persistido na inicialização e gravá-lo no encerramento"""
+    ORDERS_STORE.load(ORDERS_DB)
+    # Os pedidos são carregados em ordem de order_id, mantendo os índices ordenados
+    for order_data in ORDERS_DB.values():
+        index_order(order_data)
+        ORDER_ANALYTICS.add(order_data)
+    ORDERS_STORE.subscribe(index_synced_order)
+
+    yield
+
+    await ORDERS_STORE.close()
+
+app = FastAPI(title="Orders Service", version="1.0.0", docs_url=None, redoc_url=None, lifespan=lifespan)
+METRICS = setup_metrics(app, "orders")
+app.add_middleware(CorrelationIdMiddleware)
+if ORDERS_STORE.shared:
+    app.add_middleware(StoreSyncMiddleware, stores=[ORDERS_STORE])
+setup_tracing(app, "orders")
+
 # Endpoints
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "service": "orders"}
+    return {"status": "healthy", "service": "orders", "storage": ORDERS_STORE.stats()}
 
 @app.post("/orders/create", response_model=OrderResponse, status_code=201)
 async def create_order(order: OrderCreate):
     """Criar novo pedido"""
-    global NEXT_ORDER_ID
-
-    logger.info(f"Criando pedido para user_id={order.user_id}, amount={order.amount}")
+    logger.info("Criando pedido para user_id=%s, amount=%s", order.user_id, order.amount)
 
     # Validar amount
     if order.amount <= 0:
-        logger.warning(f"Amount inválido: {order.amount}")
+        logger.warning("Amount inválido: %s", order.amount)
         raise HTTPException(status_code=400, detail="Amount deve ser maior que zero")
 
     # Criar pedido
-    order_id = NEXT_ORDER_ID
-    NEXT_ORDER_ID += 1
+    order_data = insert_order(order, await ORDERS_STORE.allocate_ids())
+    await ORDERS_STORE.commit()
 
-    order_data = {
-        "order_id": order_id,
-        "user_id": order.user_id,
-        "amount": order.amount,
-        "product_name": order.product_name,
-        "status": "pending",
-        "created_at": datetime.now().isoformat()
-    }
+    logger.info("Pedido criado com sucesso: order_id=%s", order_data['order_id'])
+    return json_response(order_data, 201)
 
-    ORDERS_DB[order_id] = order_data
+@app.post("/orders/create/batch", status_code=201)
+async def create_orders_batch(batch: OrderCreateBatch):
+    """Criar vários pedidos em uma única requisição (tudo ou nada na validação)"""
+    logger.info("Criando %s pedidos em lote", len(batch.orders))
 
-    logger.info(f"Pedido criado com sucesso: order_id={order_id}")
-    return order_data
+    if len(batch.orders) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Máximo de {MAX_BATCH_SIZE} pedidos por requisição")
+
+    invalid = [index for index, order in enumerate(batch.orders) if order.amount <= 0]
+    if invalid:
+        logger.warning("Amount inválido nos itens: %s", invalid)
+        raise HTTPException(status_code=400, detail=f"Amount deve ser maior que zero (itens {invalid})")
+
+    first_id = await ORDERS_STORE.allocate_ids(len(batch.orders))
+    orders = [insert_order(order, first_id + index) for index, order in enumerate(batch.orders)]
+    await ORDERS_STORE.commit()
+
+    logger.info("%s pedidos criados em lote", len(orders))
+    return json_response({"orders": orders, "total": len(orders)}, 201)
+
+@app.put("/orders/status/batch")
+async def update_orders_status_batch(batch: OrderStatusBatch):
+    """Atualizar o status de vários pedidos em uma única requisição"""
+    logger.info("Atualizando status de %s pedidos em lote", len(batch.updates))
+
+    if len(batch.updates) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Máximo de {MAX_BATCH_SIZE} atualizações por requisição")
+
+    orders = []
+    missing = []
+    for update in batch.updates:
+        order_data = ORDERS_DB.get(update.order_id)
+        if not order_data:
+            missing.append(update.order_id)
+            continue
+        set_order_status(order_data, update.status)
+        orders.append(order_data)
+
+    await ORDERS_STORE.commit()
+
+    if missing:
+        logger.warning("Pedidos não encontrados: %s", missing)
+    return json_response({"orders": orders, "missing": missing})
+
+@app.get("/orders/analytics")
+async def orders_analytics():
+    """Totais de pedidos, valor e receita por status (sem percorrer os pedidos)"""
+    return json_response(ORDER_ANALYTICS.summary())
+
+@app.get("/orders/analytics/user/{user_id}")
+async def user_orders_analytics(user_id: int):
+    """Pedidos, valor e receita de um usuário"""
+    return json_response({"user_id": user_id, **ORDER_ANALYTICS.group("user", user_id)})
+
+@app.get("/orders/analytics/{dimension}")
+async def orders_analytics_breakdown(dimension: str = Path(..., pattern="^(user|product|status|hour|day)$")):
+    """Pedidos, valor e receita por usuário, produto, status ou bucket de tempo (hora/dia de created_at)"""
+    return json_response({"dimension": dimension, "groups": ORDER_ANALYTICS.breakdown(dimension)})
 
 @app.get("/orders/{order_id}", response_model=OrderResponse)
 async def get_order(order_id: int):
     """Buscar pedido por ID"""
-    logger.info(f"Buscando pedido: order_id={order_id}")
+    logger.info("Buscando pedido: order_id=%s", order_id)
 
     order_data = ORDERS_DB.get(order_id)
 
     if not order_data:
-        logger.warning(f"Pedido não encontrado: order_id={order_id}")
+        logger.warning("Pedido não encontrado: order_id=%s", order_id)
         raise HTTPException(status_code=404, detail="Pedido não encontrado")
 
-    logger.info(f"Pedido encontrado: order_id={order_id}")
-    return order_data
+    logger.info("Pedido encontrado: order_id=%s", order_id)
+    return json_response(order_data)
 
 @app.put("/orders/{order_id}/status")
 async def update_order_status(order_id: int, status: str):
     """Atualizar status do pedido"""
-    logger.info(f"Atualizando status do pedido {order_id} para {status}")
+    logger.info("Atualizando status do pedido %s para %s", order_id, status)
 
     order_data = ORDERS_DB.get(order_id)
 
     if not order_data:
-        logger.warning(f"Pedido não encontrado: order_id={order_id}")
+        logger.warning("Pedido não encontrado: order_id=%s", order_id)
         raise HTTPException(status_code=404, detail="Pedido não encontrado")
 
-    order_data["status"] = status
-    logger.info(f"Status atualizado: order_id={order_id}, status={status}")
+    set_order_status(order_data, status)
+    await ORDERS_STORE.commit()
+    logger.info("Status atualizado: order_id=%s, status=%s", order_id, status)
 
-    return order_data
+    return json_response(order_data)
 
 @app.get("/orders/user/{user_id}")
-async def get_user_orders(user_id: int):
-    """Listar todos os pedidos de um usuário"""
-    logger.info(f"Buscando pedidos do usuário: user_id={user_id}")
+async def get_user_orders(
+    user_id: int,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[int] = None,
+    status: Optional[str] = None,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to")
+):
+    """
+    Listar os pedidos de um usuário (paginado por order_id)
+    Usa o índice user_id -> [order_id], sem percorrer todo o ORDERS_DB. Com from/to
+    (created_at em [from, to)), a ordem passa a ser (created_at, order_id).
+    """
+    logger.info("Buscando pedidos do usuário: user_id=%s, status=%s, cursor=%s", user_id, status, cursor)
+
+    if status is None:
+        order_ids = ORDERS_BY_USER.get(user_id, EMPTY_IDS)
+    else:
+        order_ids = ORDERS_BY_USER_STATUS.get((user_id, status), EMPTY_IDS)
 
-    user_orders = [order for order in ORDERS_DB.values() if order["user_id"] == user_id]
+    if start is None and end is None:
+        page, next_cursor = paginate_ids(order_ids, cursor, limit)
+        total = len(order_ids)
+    else:
+        keys = user_orders_in_range(user_id, status, order_ids, *time_bounds(start, end))
+        after = time_cursor(ORDERS_DB, "created_at", cursor)
+        position = bisect_right(keys, after) if after is not None else 0
+        page = [order_id for _, order_id in keys[position:position + limit]]
+        next_cursor = page[-1] if page and position + limit < len(keys) else None
+        total = len(keys)
+    user_orders = [ORDERS_DB[order_id] for order_id in page]
 
-    logger.info(f"Encontrados {len(user_orders)} pedidos para user_id={user_id}")
-    return {"orders": user_orders, "total": len(user_orders)}
+    logger.info("Encontrados %s pedidos para user_id=%s", total, user_id)
+    # "orders" por último: o gateway repassa a lista sem decodificá-la (ver split_orders_page)
+    return json_response({"total": total, "next_cursor": next_cursor, "orders": user_orders})
 
 @app.get("/orders")
-async def list_all_orders():
-    """Listar todos os pedidos"""
-    logger.info(f"Listando {len(ORDERS_DB)} pedidos")
-    return {"orders": list(ORDERS_DB.values()), "total": len(ORDERS_DB)}
+async def list_all_orders(
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[int] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to")
+):
+    """
+    Listar pedidos (paginado por order_id; format=ndjson exporta em streaming)
+    Com from/to, só os criados em [from, to), pelo índice de tempo (ordem created_at, order_id)
+    """
+    logger.info("Listando pedidos: total=%s, cursor=%s, format=%s", len(ORDERS_DB), cursor, format)
+
+    if start is not None or end is not None:
+        bounds = time_bounds(start, end)
+        orders = iter_time_range(ORDERS_BY_CREATED, ORDERS_DB.get, *bounds,
+                                 after=time_cursor(ORDERS_DB, "created_at", cursor))
+        if format == "ndjson":
+            return ndjson_records_response(orders, limit)
+        low, high = ORDERS_BY_CREATED.bounds(*bounds)
+        page, next_cursor = take_page(orders, min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+        return json_response({"orders": page, "total": high - low, "next_cursor": next_cursor})
+
+    if format == "ndjson":
+        return ndjson_response(ORDERS_DB.get, FIRST_ORDER_ID, ORDERS_STORE.next_id, cursor, limit)
+
+    page_size = min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+    orders, next_cursor = page_by_id(ORDERS_DB.get, FIRST_ORDER_ID, ORDERS_STORE.next_id, cursor, page_size)
+    return json_response({"orders": orders, "total": len(ORDERS_DB), "next_cursor": next_cursor})
 
 if __name__ == "__main__":
     logger.info("Iniciando Orders Service na porta 8002")
-    uvicorn.run(app, host="0.0.0.0", port=8002)
+    serve(app, "orders_service:app", 8002, stores=[ORDERS_STORE])
@@ -40,31 +40,81 @@ if ! python3 -c "import fastapi" 2>/dev/null; then
     pip3 install -r requirements.txt
 fi
 
+# Processos por microserviço (WORKERS) e pelo gateway (GATEWAY_WORKERS), e
+# instâncias de cada microserviço (INSTANCES, em portas 8001, 8011, 8021...,
+# balanceadas pelo gateway). Com mais de um processo, o estado precisa ficar
+# em um armazenamento compartilhado.
+WORKERS=${WORKERS:-1}
+GATEWAY_WORKERS=${GATEWAY_WORKERS:-1}
+INSTANCES=${INSTANCES:-1}
+# Transporte entre gateway e microserviços: tcp (padrão) ou uds (Unix domain
+# sockets em SOCKET_DIR, sem a pilha TCP nas chamadas internas)
+TRANSPORT=${TRANSPORT:-tcp}
+SOCKET_DIR=${SOCKET_DIR:-/tmp/sba}
+if { [ "$WORKERS" -gt 1 ] || [ "$INSTANCES" -gt 1 ]; } && [ -z "$STORAGE_BACKEND" ]; then
+    export STORAGE_BACKEND=sqlite
+    echo -e "${YELLOW}WORKERS=$WORKERS, INSTANCES=$INSTANCES: usando STORAGE_BACKEND=sqlite${NC}"
+fi
+
+# Iniciar as instâncias de um microserviço e exportar a lista de URLs para o gateway
+start_instances() {
+    local script=$1 name=$2 base_port=$3 url_var=$4
+    local urls=""
+    for ((i = 0; i < INSTANCES; i++)); do
+        local port=$((base_port + 10 * i))
+        local log="logs_${name}.log"
+        if [ "$i" -gt 0 ]; then
+            log="logs_${name}_${port}.log"
+        fi
+        if [ "$TRANSPORT" = "uds" ]; then
+            local socket="$SOCKET_DIR/${name}_${port}.sock"
+            WORKERS=$WORKERS PORT=$port UDS=$socket python3 "$script" > "$log" 2>&1 &
+            urls="${urls:+$urls,}unix://$socket"
+        else
+            WORKERS=$WORKERS PORT=$port python3 "$script" > "$log" 2>&1 &
+            urls="${urls:+$urls,}http://localhost:$port"
+        fi
+    done
+    export "$url_var=$urls"
+}
+
+# Modo co-localizado: o gateway executa os três serviços no próprio processo
+if [ "$UPSTREAM_MODE" = "inprocess" ]; then
+    echo ""
+    echo -e "${YELLOW}Iniciando API Gateway com os serviços co-localizados (porta 8000)...${NC}"
+    WORKERS=$GATEWAY_WORKERS python3 gateway.py > logs_gateway.log 2>&1 &
+    sleep 3
+    echo ""
+    echo -e "${BLUE}Gateway:${NC} http://localhost:8000  (serviços em /services/users, /services/orders, /services/billing)"
+    echo -e "${BLUE}Logs:${NC}    tail -f logs_gateway.log"
+    echo ""
+    echo -e "${YELLOW}Pressione Ctrl+C para parar${NC}"
+    wait
+    exit 0
+fi
+
 echo ""
-echo -e "${GREEN}Iniciando serviços...${NC}"
+echo -e "${GREEN}Iniciando serviços (${WORKERS} processo(s) por microserviço)...${NC}"
 echo ""
 
 # Iniciar Users Service
 echo -e "${GREEN}[1/4] Iniciando Users Service (porta 8001)...${NC}"
-python3 users_service.py > logs_users.log 2>&1 &
-USERS_PID=$!
+start_instances users_service.py users 8001 USERS_SERVICE_URL
 sleep 2
 
 # Iniciar Orders Service
 echo -e "${PURPLE}[2/4] Iniciando Orders Service (porta 8002)...${NC}"
-python3 orders_service.py > logs_orders.log 2>&1 &
-ORDERS_PID=$!
+start_instances orders_service.py orders 8002 ORDERS_SERVICE_URL
 sleep 2
 
 # Iniciar Billing Service
 echo -e "${CYAN}[3/4] Iniciando Billing Service (porta 8003)...${NC}"
-python3 billing_service.py > logs_billing.log 2>&1 &
-BILLING_PID=$!
+start_instances billing_service.py billing 8003 BILLING_SERVICE_URL
 sleep 2
 
 # Iniciar Gateway
 echo -e "${YELLOW}[4/4] Iniciando API Gateway (porta 8000)...${NC}"
-python3 gateway.py > logs_gateway.log 2>&1 &
+WORKERS=$GATEWAY_WORKERS python3 gateway.py > logs_gateway.log 2>&1 &
 GATEWAY_PID=$!
 sleep 3
 
@@ -78,6 +128,9 @@ echo -e "  ${YELLOW}Gateway:${NC}  http://localhost:8000"
 echo -e "  ${GREEN}Users:${NC}    http://localhost:8001"
 echo -e "  ${PURPLE}Orders:${NC}   http://localhost:8002"
 echo -e "  ${CYAN}Billing:${NC}  http://localhost:8003"
+if [ "$TRANSPORT" = "uds" ]; then
+    echo -e "  ${YELLOW}TRANSPORT=uds:${NC} microserviços escutando só nos sockets de $SOCKET_DIR (sem porta TCP)"
+fi
 echo ""
 echo -e "${BLUE}Documentação interativa (Swagger):${NC}"
 echo -e "  Gateway:  http://localhost:8000/docs"
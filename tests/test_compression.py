@@ -0,0 +1,25 @@
+"""Escolha da codificação pelo Accept-Encoding (q-values)"""
+from common.compression import choose_encoding
+
+AVAILABLE = ["br", "gzip"]
+
+def test_q_zero_refuses_encoding():
+    assert choose_encoding("gzip;q=0", AVAILABLE) is None
+    assert choose_encoding("br;q=0, gzip", AVAILABLE) == "gzip"
+
+def test_explicit_q_zero_wins_over_wildcard():
+    assert choose_encoding("*, gzip;q=0", ["gzip"]) is None
+    assert choose_encoding("gzip;q=0, *", AVAILABLE) == "br"
+    assert choose_encoding("*;q=0", AVAILABLE) is None
+
+def test_highest_q_wins_and_ties_follow_server_order():
+    assert choose_encoding("br;q=0.5, gzip;q=1", AVAILABLE) == "gzip"
+    assert choose_encoding("gzip, br", AVAILABLE) == "br"
+    assert choose_encoding("deflate, *;q=0.1", AVAILABLE) == "br"
+
+def test_parameters_and_case():
+    assert choose_encoding("GZIP ; Q=0.5", AVAILABLE) == "gzip"
+    assert choose_encoding("gzip;level=1;q=0", AVAILABLE) is None
+    assert choose_encoding("gzip;q=abc", AVAILABLE) is None
+    assert choose_encoding("", AVAILABLE) is None
+    assert choose_encoding("identity", AVAILABLE) is None
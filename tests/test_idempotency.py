@@ -0,0 +1,35 @@
+"""Chaves de idempotência no limite de tamanho (Idempotency-Key com MAX_KEY_LENGTH caracteres)"""
+import asyncio
+
+from benchmarks.stack import asgi_stack
+from common.idempotency import IDEMPOTENCY_HEADER, MAX_KEY_LENGTH, derive_key
+
+def test_derived_key_has_fixed_length():
+    for key in ["k", "k" * MAX_KEY_LENGTH]:
+        derived = derive_key(key, "order-1000")
+        assert len(derived) == 64
+        assert derived != derive_key(key, "order-1001")
+
+def test_purchase_with_longest_key():
+    async def scenario():
+        async with asgi_stack() as clients:
+            gateway = clients["gateway"]
+            response = await gateway.post("/gateway/register", json={"name": "Limite", "email": "limite@example.com"})
+            user_id = response.json()["user"]["user_id"]
+            headers = {IDEMPOTENCY_HEADER: "k" * MAX_KEY_LENGTH}
+            purchase = {"user_id": user_id, "amount": 10.0}
+
+            first = await gateway.post("/gateway/purchase", json=purchase, headers=headers)
+            assert first.status_code == 200, first.text
+            order_id = first.json()["order"]["order_id"]
+            order = await clients["orders"].get(f"/orders/{order_id}")
+            assert order.json()["status"] != "pending"
+
+            retry = await gateway.post("/gateway/purchase", json=purchase, headers=headers)
+            assert retry.json() == first.json()
+            assert retry.headers["Idempotent-Replayed"] == "true"
+
+            too_long = {IDEMPOTENCY_HEADER: "k" * (MAX_KEY_LENGTH + 1)}
+            assert (await gateway.post("/gateway/purchase", json=purchase, headers=too_long)).status_code == 400
+
+    asyncio.run(scenario())
@@ -0,0 +1,103 @@
+"""Listagem de pedidos por usuário pelos índices secundários do orders_service"""
+import asyncio
+
+import httpx
+
+import orders_service
+
+def run_with_orders(scenario):
+    """Executar scenario(client) com o app de pedidos iniciado, sem rede"""
+    async def main():
+        app = orders_service.app
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://orders") as client:
+                await scenario(client)
+    asyncio.run(main())
+
+def test_user_without_orders():
+    async def scenario(client):
+        response = await client.get("/orders/user/900001")
+        assert response.status_code == 200
+        assert response.json() == {"total": 0, "next_cursor": None, "orders": []}
+
+    run_with_orders(scenario)
+
+def test_status_filter_without_matches():
+    async def scenario(client):
+        await client.post("/orders/create", json={"user_id": 900002, "amount": 10.0, "product_name": "Mouse"})
+        response = await client.get("/orders/user/900002", params={"status": "completed"})
+        assert response.status_code == 200
+        assert response.json() == {"total": 0, "next_cursor": None, "orders": []}
+
+    run_with_orders(scenario)
+
+async def create_orders(client, user_id: int, count: int) -> list:
+    ids = []
+    for _ in range(count):
+        response = await client.post("/orders/create", json={"user_id": user_id, "amount": 10.0})
+        assert response.status_code == 201
+        ids.append(response.json()["order_id"])
+    return ids
+
+def user_order_ids(response) -> list:
+    return [order["order_id"] for order in response.json()["orders"]]
+
+def test_created_orders_are_indexed_by_user_and_status():
+    async def scenario(client):
+        ids = await create_orders(client, 900003, 3)
+        await create_orders(client, 900004, 1)
+
+        assert list(orders_service.ORDERS_BY_USER[900003]) == ids
+        assert list(orders_service.ORDERS_BY_USER_STATUS[(900003, "pending")]) == ids
+        assert user_order_ids(await client.get("/orders/user/900003")) == ids
+        assert user_order_ids(await client.get("/orders/user/900003", params={"status": "pending"})) == ids
+
+    run_with_orders(scenario)
+
+def test_status_change_moves_order_between_status_indexes():
+    async def scenario(client):
+        first, second, third = await create_orders(client, 900005, 3)
+        await client.put(f"/orders/{third}/status", params={"status": "completed"})
+        await client.put(f"/orders/{first}/status", params={"status": "completed"})
+        await client.put("/orders/status/batch", json={"updates": [{"order_id": second, "status": "payment_failed"}]})
+
+        # A lista de status continua ordenada por order_id, independente da ordem das atualizações
+        completed = await client.get("/orders/user/900005", params={"status": "completed"})
+        assert user_order_ids(completed) == [first, third]
+        failed = await client.get("/orders/user/900005", params={"status": "payment_failed"})
+        assert user_order_ids(failed) == [second]
+        # O status esvaziado sai do índice; o índice por usuário não muda
+        assert (900005, "pending") not in orders_service.ORDERS_BY_USER_STATUS
+        assert user_order_ids(await client.get("/orders/user/900005")) == [first, second, third]
+
+        # Voltar ao status anterior
+        await client.put(f"/orders/{second}/status", params={"status": "completed"})
+        completed = await client.get("/orders/user/900005", params={"status": "completed"})
+        assert user_order_ids(completed) == [first, second, third]
+        assert (900005, "payment_failed") not in orders_service.ORDERS_BY_USER_STATUS
+
+    run_with_orders(scenario)
+
+def test_orders_synced_from_other_processes_are_reindexed_in_order():
+    async def scenario(client):
+        # Pedidos gravados por outro processo chegam pelo sync(), inclusive com ID menor que os locais
+        older_id = await orders_service.ORDERS_STORE.allocate_ids()
+        (local,) = await create_orders(client, 900006, 1)
+        newer_id = await orders_service.ORDERS_STORE.allocate_ids()
+        older = dict(orders_service.ORDERS_DB[local], order_id=older_id, status="completed")
+        newer = dict(orders_service.ORDERS_DB[local], order_id=newer_id)
+        for order in (newer, older):
+            orders_service.ORDERS_DB[order["order_id"]] = order
+            orders_service.index_synced_order(order["order_id"], None, order)
+
+        assert list(orders_service.ORDERS_BY_USER[900006]) == [older["order_id"], local, newer["order_id"]]
+        assert list(orders_service.ORDERS_BY_USER_STATUS[(900006, "pending")]) == [local, newer["order_id"]]
+
+        # Mudança de status feita pelo outro processo
+        changed = dict(newer, status="completed")
+        orders_service.ORDERS_DB[newer["order_id"]] = changed
+        orders_service.index_synced_order(newer["order_id"], newer, changed)
+        assert list(orders_service.ORDERS_BY_USER_STATUS[(900006, "completed")]) == [older["order_id"], newer["order_id"]]
+        assert list(orders_service.ORDERS_BY_USER_STATUS[(900006, "pending")]) == [local]
+
+    run_with_orders(scenario)
@@ -0,0 +1,94 @@
+"""Paginação por cursor (common/pagination.py e paginate_ids do orders_service)"""
+import asyncio
+from array import array
+
+import httpx
+import pytest
+
+import orders_service
+from common.pagination import iter_records, page_by_id, take_page
+from orders_service import paginate_ids
+
+RECORDS = {id_: {"id": id_} for id_ in range(10, 20) if id_ != 13}
+
+def page_ids(page) -> list:
+    return [record["id"] for record in page]
+
+def test_page_by_id_follows_cursor_until_the_end():
+    seen = []
+    cursor = None
+    while True:
+        page, cursor = page_by_id(RECORDS.get, 10, 20, cursor, 4)
+        seen.extend(page_ids(page))
+        if cursor is None:
+            break
+        assert len(page) == 4
+        assert cursor == page[-1]["id"]
+    # IDs ausentes (13) são pulados sem quebrar a paginação
+    assert seen == sorted(RECORDS)
+
+def test_page_by_id_exact_multiple_has_no_extra_page():
+    page, cursor = page_by_id(RECORDS.get, 10, 20, None, len(RECORDS))
+    assert len(page) == len(RECORDS)
+    assert cursor is None
+
+def test_page_by_id_empty_and_past_the_end():
+    assert page_by_id({}.get, 10, 10, None, 5) == ([], None)
+    assert page_by_id(RECORDS.get, 10, 20, 19, 5) == ([], None)
+    # Cursor anterior ao primeiro ID começa do início
+    assert page_ids(page_by_id(RECORDS.get, 10, 20, 3, 2)[0]) == [10, 11]
+
+def test_iter_records_starts_after_cursor():
+    assert [id_ for id_, _ in iter_records(RECORDS.get, 10, 20, 14)] == [15, 16, 17, 18, 19]
+
+def test_take_page_limits_and_returns_last_id():
+    records = ((id_, {"id": id_}) for id_ in range(5))
+    page, cursor = take_page(records, 3)
+    assert page_ids(page) == [0, 1, 2]
+    assert cursor == 2
+    assert take_page(iter([]), 3) == ([], None)
+
+@pytest.mark.parametrize("ids", [array("q", [3, 5, 8, 13, 21]), [3, 5, 8, 13, 21]])
+def test_paginate_ids(ids):
+    assert paginate_ids(ids, None, 2) == ([3, 5], 5)
+    assert paginate_ids(ids, 5, 2) == ([8, 13], 13)
+    assert paginate_ids(ids, 13, 2) == ([21], None)
+    # Cursor que não está na lista (ex.: pedido que mudou de status) continua do próximo maior
+    assert paginate_ids(ids, 6, 10) == ([8, 13, 21], None)
+    assert paginate_ids(ids, 21, 2) == ([], None)
+
+@pytest.mark.parametrize("ids", [array("q"), []])
+def test_paginate_ids_empty(ids):
+    assert paginate_ids(ids, None, 10) == ([], None)
+    assert paginate_ids(ids, 5, 10) == ([], None)
+
+def test_user_orders_endpoint_pages_with_cursor_and_limit():
+    async def main():
+        app = orders_service.app
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://orders") as client:
+                created = []
+                for _ in range(5):
+                    response = await client.post("/orders/create", json={"user_id": 910001, "amount": 1.0})
+                    created.append(response.json()["order_id"])
+
+                seen = []
+                params = {"limit": 2}
+                while True:
+                    body = (await client.get("/orders/user/910001", params=params)).json()
+                    assert body["total"] == 5
+                    seen.extend(order["order_id"] for order in body["orders"])
+                    if body["next_cursor"] is None:
+                        break
+                    params["cursor"] = body["next_cursor"]
+                assert seen == created
+
+                # Cursor além do último pedido, limite fora da faixa e intervalo de tempo sem pedidos
+                body = (await client.get("/orders/user/910001", params={"cursor": created[-1]})).json()
+                assert body["orders"] == [] and body["next_cursor"] is None
+                assert (await client.get("/orders/user/910001", params={"limit": 0})).status_code == 422
+                body = (await client.get("/orders/user/910001", params={"from": "2000-01-01T00:00:00",
+                                                                          "to": "2000-01-02T00:00:00"})).json()
+                assert body == {"total": 0, "next_cursor": None, "orders": []}
+
+    asyncio.run(main())
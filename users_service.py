@@ -3,25 +3,34 @@ Users Microservice
 Porta: 8001
 Responsabilidades: Gerenciamento de usuários (criar, autenticar, buscar)
 """
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
 from pydantic import BaseModel, EmailStr
-from typing import Dict, Optional
-import uvicorn
+from typing import Dict, List, Optional
+from contextlib import asynccontextmanager
 import logging
 
-# Configuração de logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='[USERS-SERVICE] %(asctime)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+from common.logs import CorrelationIdMiddleware, setup_logging
+from common.metrics import setup_metrics
+from common.storage import StoreSyncMiddleware, open_store
+from common.serialization import json_response
+from common.server import serve
+from common.tracing import setup_tracing
+from common.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, ndjson_response, page_by_id
 
-app = FastAPI(title="Users Service", version="1.0.0", docs_url=None, redoc_url=None)
+# Configuração de logging (fila + thread de escrita, JSON por padrão; ver common/logs.py)
+setup_logging("users-service")
+logger = logging.getLogger(__name__)
 
 # Armazenamento em memória
 USERS_DB: Dict[int, dict] = {}
 USERS_BY_EMAIL: Dict[str, int] = {}
-NEXT_USER_ID = 1
+FIRST_USER_ID = 1
+
+# Quantidade máxima de usuários por consulta em lote
+MAX_BATCH_SIZE = 1000
+
+# Persistência (backend definido por STORAGE_BACKEND)
+USERS_STORE = open_store("users", first_id=FIRST_USER_ID)
 
 # Modelos Pydantic
 class UserCreate(BaseModel):
@@ -31,32 +40,58 @@ class UserCreate(BaseModel):
 class UserLogin(BaseModel):
     email: EmailStr
 
+class UserBatchRequest(BaseModel):
+    user_ids: List[int]
+
 class UserResponse(BaseModel):
     user_id: int
     name: str
     email: str
 
+def index_synced_user(user_id: int, previous: Optional[dict], user_data: dict):
+    """Indexar usuários criados por outros processos (ver StoreSyncMiddleware)"""
+    USERS_BY_EMAIL[user_data["email"]] = user_id
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Carregar o estado persistido na inicialização e gravá-lo no encerramento"""
+    USERS_STORE.load(USERS_DB)
+    for user_id, user_data in USERS_DB.items():
+        USERS_BY_EMAIL[user_data["email"]] = user_id
+    USERS_STORE.subscribe(index_synced_user)
+
+    yield
+
+    await USERS_STORE.close()
+
+app = FastAPI(title="Users Service", version="1.0.0", docs_url=None, redoc_url=None, lifespan=lifespan)
+METRICS = setup_metrics(app, "users")
+app.add_middleware(CorrelationIdMiddleware)
+if USERS_STORE.shared:
+    app.add_middleware(StoreSyncMiddleware, stores=[USERS_STORE])
+setup_tracing(app, "users")
+
 # Endpoints
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "service": "users"}
+    return {"status": "healthy", "service": "users", "storage": USERS_STORE.stats()}
 
 @app.post("/users/create", response_model=UserResponse, status_code=201)
 async def create_user(user: UserCreate):
     """Criar novo usuário"""
-    global NEXT_USER_ID
-
-    logger.info(f"Criando usuário: {user.email}")
+    logger.info("Criando usuário: %s", user.email)
 
     # Verificar se email já existe
     if user.email in USERS_BY_EMAIL:
-        logger.warning(f"Email já existe: {user.email}")
+        logger.warning("Email já existe: %s", user.email)
         raise HTTPException(status_code=400, detail="Email já cadastrado")
 
     # Criar usuário
-    user_id = NEXT_USER_ID
-    NEXT_USER_ID += 1
+    user_id = await USERS_STORE.allocate_ids()
+    if user.email in USERS_BY_EMAIL:
+        logger.warning("Email já existe: %s", user.email)
+        raise HTTPException(status_code=400, detail="Email já cadastrado")
 
     user_data = {
         "user_id": user_id,
@@ -66,45 +101,86 @@ async def create_user(user: UserCreate):
 
     USERS_DB[user_id] = user_data
     USERS_BY_EMAIL[user.email] = user_id
+    # Com vários processos, o email é reservado no banco junto com o registro
+    created = False
+    try:
+        created = await USERS_STORE.insert_unique(user_id, user_data, "email", user.email)
+    finally:
+        if not created:
+            del USERS_DB[user_id]
+            if USERS_BY_EMAIL.get(user.email) == user_id:
+                del USERS_BY_EMAIL[user.email]
+    if not created:
+        logger.warning("Email já existe: %s", user.email)
+        raise HTTPException(status_code=400, detail="Email já cadastrado")
 
-    logger.info(f"Usuário criado com sucesso: ID={user_id}")
-    return user_data
+    logger.info("Usuário criado com sucesso: ID=%s", user_id)
+    return json_response(user_data, 201)
 
 @app.post("/users/login", response_model=UserResponse)
 async def login_user(credentials: UserLogin):
     """Autenticar usuário por email"""
-    logger.info(f"Tentativa de login: {credentials.email}")
+    logger.info("Tentativa de login: %s", credentials.email)
 
     user_id = USERS_BY_EMAIL.get(credentials.email)
 
     if not user_id:
-        logger.warning(f"Usuário não encontrado: {credentials.email}")
+        logger.warning("Usuário não encontrado: %s", credentials.email)
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
 
     user_data = USERS_DB[user_id]
-    logger.info(f"Login bem-sucedido: ID={user_id}")
-    return user_data
+    logger.info("Login bem-sucedido: ID=%s", user_id)
+    return json_response(user_data)
+
+@app.post("/users/batch")
+async def get_users_batch(request: UserBatchRequest):
+    """Buscar vários usuários por ID em uma única requisição"""
+    logger.info("Buscando %s usuários em lote", len(request.user_ids))
+
+    if len(request.user_ids) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Máximo de {MAX_BATCH_SIZE} usuários por requisição")
+
+    users = []
+    missing = []
+    for user_id in request.user_ids:
+        user_data = USERS_DB.get(user_id)
+        if user_data:
+            users.append(user_data)
+        else:
+            missing.append(user_id)
+
+    return json_response({"users": users, "missing": missing})
 
 @app.get("/users/{user_id}", response_model=UserResponse)
 async def get_user(user_id: int):
     """Buscar usuário por ID"""
-    logger.info(f"Buscando usuário: ID={user_id}")
+    logger.info("Buscando usuário: ID=%s", user_id)
 
     user_data = USERS_DB.get(user_id)
 
     if not user_data:
-        logger.warning(f"Usuário não encontrado: ID={user_id}")
+        logger.warning("Usuário não encontrado: ID=%s", user_id)
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
 
-    logger.info(f"Usuário encontrado: ID={user_id}")
-    return user_data
+    logger.info("Usuário encontrado: ID=%s", user_id)
+    return json_response(user_data)
 
 @app.get("/users")
-async def list_users():
-    """Listar todos os usuários"""
-    logger.info(f"Listando {len(USERS_DB)} usuários")
-    return {"users": list(USERS_DB.values()), "total": len(USERS_DB)}
+async def list_users(
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[int] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$")
+):
+    """Listar usuários (paginado por user_id; format=ndjson exporta em streaming)"""
+    logger.info("Listando usuários: total=%s, cursor=%s, format=%s", len(USERS_DB), cursor, format)
+
+    if format == "ndjson":
+        return ndjson_response(USERS_DB.get, FIRST_USER_ID, USERS_STORE.next_id, cursor, limit)
+
+    page_size = min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+    users, next_cursor = page_by_id(USERS_DB.get, FIRST_USER_ID, USERS_STORE.next_id, cursor, page_size)
+    return json_response({"users": users, "total": len(USERS_DB), "next_cursor": next_cursor})
 
 if __name__ == "__main__":
     logger.info("Iniciando Users Service na porta 8001")
-    uvicorn.run(app, host="0.0.0.0", port=8001)
+    serve(app, "users_service:app", 8001, stores=[USERS_STORE])